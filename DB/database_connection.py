@@ -1,14 +1,47 @@
+import os
+import re
 import sqlite3
+from datetime import datetime, timedelta
+from dateutil import parser as dtparser
 from models import Patient, Provider, Appointment
+from instrumentation import trace_methods
+from metrics import time_db_methods
+from fast_json import cursor_json
+from singleflight import SingleFlight, coalesce_methods
 from typing import List
 
+# Providers' ``slots`` column is one daily range such as "10 AM - 11 AM"; it is
+# offered in SLOT_MINUTES steps on OPEN_WEEKDAYS (Mon=0).
+SLOT_MINUTES = 30
+OPEN_WEEKDAYS = (0, 1, 2, 3, 4)
+# Tables whose writes bump their row in data_versions.
+VERSIONED_TABLES = ("providers",)
+
 patients_db: List[Patient] = []
 providers_db: List[Provider] = []
 appointments_db: List[Appointment] = []
 
+def parse_slot_range(slots):
+    """Parse "10 AM - 11 AM" into (time(10, 0), time(11, 0))."""
+    opens, closes = (dtparser.parse(part.strip()).time() for part in slots.split("-", 1))
+    return opens, closes
+
+
+def appointment_at(date, time):
+    """Normalise a stored date and time ("4/4/2026", "2:00 PM") to "2026-04-04 14:00".
+
+    Returns "" when they don't parse, so the row is left out of window lookups.
+    """
+    try:
+        return dtparser.parse(f"{date} {time}").strftime("%Y-%m-%d %H:%M")
+    except (ValueError, OverflowError):
+        return ""
+
+
 class AppointmentAndPatientManager:
     def __init__(self, db_name="appointment_details_new.db"):
         self.conn = sqlite3.connect(db_name)
+        self.db_path = os.path.abspath(db_name)
         self.cursor = self.conn.cursor()
         self._create_tables()
 
@@ -51,6 +84,53 @@ class AppointmentAndPatientManager:
                     )
                 ''')
 
+        # Dates and times are stored as the client sent them; appointment_at keeps
+        # a sortable "YYYY-MM-DD HH:MM" copy so slot lookups filter by window in SQL.
+        # Writers that change the date without setting it reset it to NULL, and
+        # NULL rows are normalised here on the next start.
+        columns = [row[1] for row in self.cursor.execute("PRAGMA table_info(appointments)")]
+        if "appointment_at" not in columns:
+            try:
+                self.cursor.execute("ALTER TABLE appointments ADD COLUMN appointment_at TEXT")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):  # not just another connection adding it first
+                    raise
+        self.cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS appointments_at_stale
+            AFTER UPDATE OF appointment_date, appointment_time ON appointments
+            WHEN NEW.appointment_at IS OLD.appointment_at
+            BEGIN
+                UPDATE appointments SET appointment_at = NULL WHERE appointment_id = NEW.appointment_id;
+            END
+        """)
+        self.cursor.execute("SELECT appointment_id, appointment_date, appointment_time FROM appointments WHERE appointment_at IS NULL")
+        stale = self.cursor.fetchall()
+        if stale:
+            self.cursor.executemany(
+                "UPDATE appointments SET appointment_at = ? WHERE appointment_id = ?",
+                [(appointment_at(date, time), appointment_id) for appointment_id, date, time in stale])
+            self.conn.commit()
+
+        # Availability lookups filter appointments by provider and time window and
+        # providers by name or speciality (case-insensitively).
+        self.cursor.execute("DROP INDEX IF EXISTS idx_appointments_provider")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_provider_at ON appointments(provider_id, appointment_at)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_providers_name ON providers(provider_name COLLATE NOCASE)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_providers_speciality ON providers(speciality COLLATE NOCASE)")
+
+        # Per-table data versions for HTTP caching (http_cache.py): triggers bump
+        # them on every write, whichever process or tool makes it.
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        for table in VERSIONED_TABLES:
+            self.cursor.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES (?, 0)", (table,))
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                self.cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table}
+                    BEGIN
+                        UPDATE data_versions SET version = version + 1 WHERE name = '{table}';
+                    END
+                """)
+
         self.conn.commit()
 
     def add_patient(self, first_name, last_name, gender, date_of_birth,
@@ -74,6 +154,13 @@ class AppointmentAndPatientManager:
 
         return patients_db
 
+    def get_all_patients_json(self):
+        """get_all_patients as JSON bytes, without building models (same fields and mapping)."""
+        self.cursor.execute(
+            "SELECT patient_id AS id, first_name, last_name, gender AS email, date_of_birth, email AS gender,"
+            " phone_number, address FROM patients p")
+        return cursor_json(self.cursor)
+
     def get_all_providers(self):
         self.cursor.execute("SELECT * FROM providers p")
         rows = self.cursor.fetchall()
@@ -86,12 +173,26 @@ class AppointmentAndPatientManager:
 
         return providers_db
 
+    def get_all_providers_json(self):
+        """get_all_providers as JSON bytes, without building models."""
+        self.cursor.execute(
+            "SELECT provider_id AS id, 'Dr. ' || provider_name AS provider_name, location, speciality, slots"
+            " FROM providers p")
+        return cursor_json(self.cursor)
+
     def get_provider_by_id(self, provider_id):
         self.cursor.execute("SELECT * FROM providers WHERE provider_id = ?", (provider_id,))
         row = self.cursor.fetchone()
+        if row is None:
+            return None
         provider = Provider(id=row[0], provider_name=row[1], location=row[2], speciality=row[3], slots=row[4])
         return provider
 
+    def data_version(self, table):
+        """Version of ``table``'s data; changes whenever a row of it is written."""
+        self.cursor.execute("SELECT version FROM data_versions WHERE name = ?", (table,))
+        return self.cursor.fetchone()[0]
+
     def get_provider_by_name(self, provider_name):
         updated_provider_name = provider_name.replace("dr. ","").replace("Dr. ","");
         self.cursor.execute("SELECT * FROM providers WHERE provider_name like ?", (updated_provider_name,))
@@ -160,7 +261,7 @@ class AppointmentAndPatientManager:
         return appointments_db
 
     def get_patient_by_id(self, patient_id):
-        self.cursor.execute("SELECT * FROM patients WHERE patient_id = ?", (patient_id))
+        self.cursor.execute("SELECT * FROM patients WHERE patient_id = ?", (patient_id,))
         row = self.cursor.fetchone()
         patient = Patient(id=row[0], first_name=row[1], last_name=row[2], email=row[3], date_of_birth=row[4], gender=row[5], phone_number=row[6], address=row[7])
         return patient
@@ -173,11 +274,53 @@ class AppointmentAndPatientManager:
         patient = Patient(id=row[0], first_name=row[1], last_name=row[2], gender=row[3], date_of_birth=row[4], email=row[5], phone_number=row[6], address=row[7])
         return patient
 
-    def get_provider_by_id(self, provider_id):
-        self.cursor.execute("SELECT * FROM providers WHERE provider_id = ?", (provider_id))
-        row = self.cursor.fetchone()
-        provider = Provider(id=row[0], provider_name=row[1], location=row[2], speciality=row[3], slots=row[4])
-        return provider
+    def find_providers(self, name=None, speciality=None):
+        """Providers matching a name (with or without "Dr.") or a speciality, case-insensitively."""
+        if name is not None:
+            name = re.sub(r"(?i)^\s*dr\.?\s*", "", name).strip()
+            self.cursor.execute("SELECT * FROM providers WHERE provider_name = ? COLLATE NOCASE", (name,))
+        else:
+            self.cursor.execute("SELECT * FROM providers WHERE speciality = ? COLLATE NOCASE", (speciality.strip(),))
+        return [
+            Provider(id=row[0], provider_name=row[1], location=row[2], speciality=row[3], slots=row[4])
+            for row in self.cursor.fetchall()
+        ]
+
+    def get_open_slots(self, provider, count=5, start=None, horizon_days=30):
+        """Next ``count`` unbooked slots for ``provider`` from ``start`` (default: now)."""
+        start = start or datetime.now()
+        opens, closes = parse_slot_range(provider.slots)
+
+        # Only bookings inside the searched window, via idx_appointments_provider_at;
+        # rows written since the last start without appointment_at are parsed here.
+        window = (start.strftime("%Y-%m-%d %H:%M"),
+                  (start.date() + timedelta(days=horizon_days + 1)).isoformat())
+        self.cursor.execute(
+            "SELECT appointment_at FROM appointments WHERE provider_id = ? AND appointment_at >= ? AND appointment_at < ?",
+            (str(provider.id),) + window)
+        booked = {datetime.fromisoformat(at) for at, in self.cursor.fetchall()}
+        self.cursor.execute(
+            "SELECT appointment_date, appointment_time FROM appointments WHERE provider_id = ? AND appointment_at IS NULL",
+            (str(provider.id),))
+        for booked_date, booked_time in self.cursor.fetchall():
+            at = appointment_at(booked_date, booked_time)
+            if window[0] <= at < window[1]:
+                booked.add(datetime.fromisoformat(at))
+
+        slots = []
+        step = timedelta(minutes=SLOT_MINUTES)
+        for offset in range(horizon_days + 1):
+            day = start.date() + timedelta(days=offset)
+            if day.weekday() not in OPEN_WEEKDAYS:
+                continue
+            slot = datetime.combine(day, opens)
+            while slot + step <= datetime.combine(day, closes):
+                if slot >= start and slot not in booked:
+                    slots.append(slot)
+                    if len(slots) == count:
+                        return slots
+                slot += step
+        return slots
 
     def verify_patient_by_phone_and_dob(self, patient_data):
         self.cursor.execute("SELECT * FROM patients WHERE first_name like ? AND last_name like ? AND phone_number = ? AND date_of_birth = ?", (patient_data.first_name, patient_data.last_name, patient_data.phone_number, patient_data.date_of_birth))
@@ -197,8 +340,8 @@ class AppointmentAndPatientManager:
     def schedule_appointment(self, patient_id, provider_id, date, time):
         try:
             self.cursor.execute(
-                "INSERT INTO appointments (patient_id, provider_id, appointment_date, appointment_time) VALUES (?, ?, ?, ?)",
-                (patient_id, provider_id, date, time))
+                "INSERT INTO appointments (patient_id, provider_id, appointment_date, appointment_time, appointment_at) VALUES (?, ?, ?, ?, ?)",
+                (patient_id, provider_id, date, time, appointment_at(date, time)))
             self.conn.commit()
             return {"Message": f"Appointment scheduled for patient ID {patient_id} with doctor {provider_id} on {date} at {time}. The appointment id is {self.cursor.lastrowid}."}
 
@@ -215,8 +358,8 @@ class AppointmentAndPatientManager:
                                                  req.email, req.phone_number, req.address)
 
             self.cursor.execute(
-                "INSERT INTO appointments (patient_id, provider_id, appointment_date, appointment_time) VALUES (?, ?, ?, ?)",
-                (patient_id, req.provider_id, req.date, req.time))
+                "INSERT INTO appointments (patient_id, provider_id, appointment_date, appointment_time, appointment_at) VALUES (?, ?, ?, ?, ?)",
+                (patient_id, req.provider_id, req.date, req.time, appointment_at(req.date, req.time)))
             self.conn.commit()
             return {"Message": f"Appointment scheduled for {req.first_name.upper()} {req.last_name.upper()}. The appointment id is {self.cursor.lastrowid}."}
 
@@ -238,8 +381,8 @@ class AppointmentAndPatientManager:
             }
 
         self.cursor.execute(
-            "UPDATE appointments SET appointment_date = ?, appointment_time = ? WHERE patient_id = ? AND provider_id = ?",
-            (new_date, new_time, patient.id, provider.id))
+            "UPDATE appointments SET appointment_date = ?, appointment_time = ?, appointment_at = ? WHERE patient_id = ? AND provider_id = ?",
+            (new_date, new_time, appointment_at(new_date, new_time), patient.id, provider.id))
 
         self.conn.commit()
         if self.cursor.rowcount == 0:
@@ -281,4 +424,27 @@ class AppointmentAndPatientManager:
         return {"Message": f"Appointment cancelled for patient {patient_first_name.upper()}."}
 
     def close_connection(self):
-        self.conn.close()
\ No newline at end of file
+        self.conn.close()
+
+
+# Every public query shows up as a "db" span in the agent traces and in /metrics.
+trace_methods(AppointmentAndPatientManager)
+time_db_methods(AppointmentAndPatientManager)
+# Identical reads running at the same time on any thread's connection to the
+# same database share one query (outermost, so sqlite_queries_total counts the
+# queries actually run). Reads inside an open transaction run on their own
+# connection so they see its uncommitted writes, and a read issued after a
+# write never joins one that started before it.
+db_reads = SingleFlight("db")
+coalesce_methods(
+    AppointmentAndPatientManager,
+    ("get_all_patients", "get_all_providers", "get_all_patients_json", "get_all_providers_json",
+     "get_provider_by_id", "get_provider_by_name", "get_providers_by_location",
+     "get_providers_by_speciality", "get_all_appointments", "get_appointments_by_patient_Name",
+     "get_patient_by_id", "get_patient_by_name", "find_providers", "get_open_slots"),
+    db_reads,
+    scope=lambda manager: manager.db_path,
+    skip=lambda manager: manager.conn.in_transaction,
+    writes=("add_patient", "schedule_appointment", "schedule_appointment_with_detail",
+            "reschedule_appointment", "cancel_appointment", "cancel_appointment_by_id"),
+)
@@ -1,5 +1,7 @@
 import sqlite3
 from models import Patient, Appointment
+from instrumentation import trace_methods
+from metrics import time_db_methods
 from typing import List
 
 patients_db: List[Patient] = []
@@ -77,4 +79,8 @@ class AppointmentManager:
             }
 
     def close_connection(self):
-        self.conn.close()
\ No newline at end of file
+        self.conn.close()
+
+
+trace_methods(AppointmentManager)
+time_db_methods(AppointmentManager)
@@ -0,0 +1,86 @@
+import functools
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict
+
+import metrics
+
+GRAPH_NODES = ("supervisor", "information_node", "booking_node")
+
+
+class TurnStats:
+    """Running per-turn averages for the agent graph, for /gemini-agent/stats.
+
+    ``record`` takes the turn's ``llm_callbacks.TurnCounter``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.llm_calls = 0
+        self.hops = Counter()
+        self.llm_calls_per_turn = Counter()
+
+    def record(self, counter):
+        with self._lock:
+            self.turns += 1
+            self.llm_calls += counter.llm_calls
+            self.hops.update(counter.hops)
+            self.llm_calls_per_turn[counter.llm_calls] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            turns = self.turns or 1
+            return {
+                "turns": self.turns,
+                "mean_llm_calls": round(self.llm_calls / turns, 2),
+                "mean_hops": {node: round(self.hops[node] / turns, 2) for node in GRAPH_NODES},
+                "llm_calls_per_turn": dict(sorted(self.llm_calls_per_turn.items())),
+            }
+
+
+class ToolTimings:
+    """Per-tool call counts and latency, to check tools are not the slow part of a turn."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = Counter()
+        self._total_ms = Counter()
+        self._max_ms = {}
+
+    def record(self, name: str, elapsed_ms: float, status: str = "ok"):
+        with self._lock:
+            self._calls[name] += 1
+            self._total_ms[name] += elapsed_ms
+            self._max_ms[name] = max(self._max_ms.get(name, 0.0), elapsed_ms)
+        metrics.tool_latency.labels(name).observe(elapsed_ms / 1000)
+        metrics.tool_calls.labels(name, status).inc()
+
+    def timed(self, func):
+        """Decorator: time every call of ``func`` under its name."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started, status = time.perf_counter(), "error"
+            try:
+                result = func(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.record(func.__name__, elapsed_ms, status)
+        return wrapper
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                name: {
+                    "calls": calls,
+                    "mean_ms": round(self._total_ms[name] / calls, 2),
+                    "max_ms": round(self._max_ms[name], 2),
+                }
+                for name, calls in self._calls.items()
+            }
+
+
+tool_timings = ToolTimings()
@@ -0,0 +1,214 @@
+"""Cost of the assistant's appointment tools with many appointments in one session.
+
+Fills a session with N appointments (a handful of doctors and names, dates
+spread over a year) and times the tools two ways:
+
+    list    the code before prompt/appointment_book.py: a list of dicts scanned
+            for every view, reschedule and cancel (cancel pops from the middle)
+    book    AppointmentBook: dict by id plus doctor/date/name indexes
+
+Views cover each filter alone and combined. The script then replays the same
+operations on both, checks every reply matches, and checks the book survives a
+JSON round trip (as the SQLite session store saves it).
+
+Usage (from the repository root):
+    python -m benchmarks.appointment_book_bench
+    python -m benchmarks.appointment_book_bench --sizes 1000 10000 --ops 500
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt.appointment_book import AppointmentBook  # noqa: E402
+
+DOCTORS = ["Dr. Smith", "Dr. Sam", "Dr. Patel", "Dr. Garcia", "Dr. Chen", "Dr. Okafor", "Dr. Novak", "Dr. Rossi"]
+NAMES = ["John Smith", "Krishna Rao", "Maria Lopez", "Wei Zhang", "Amara Obi", "Lena Fischer"]
+TIMES = ["9:00 AM", "10:30 AM", "1:00 PM", "3:15 PM", "5:00 PM"]
+START = date(2026, 1, 1)
+
+
+class ListTools:
+    """The tools as they were: appointments in a list, every call scans it."""
+
+    def __init__(self):
+        self.appointments = []
+
+    def schedule(self, apt):
+        self.appointments.append(dict(apt))
+
+    def reschedule(self, apt_id, new_date, new_time):
+        for apt in self.appointments:
+            if apt["id"] == apt_id:
+                apt["date"] = new_date or apt["date"]
+                apt["time"] = new_time or apt["time"]
+                return f"Rescheduled {apt_id} to {apt['date']} at {apt['time']}."
+        return f"Appointment {apt_id} not found."
+
+    def cancel(self, apt_id):
+        for i, apt in enumerate(self.appointments):
+            if apt["id"] == apt_id:
+                self.appointments.pop(i)
+                return f"Cancelled appointment {apt_id}."
+        return f"Appointment {apt_id} not found."
+
+    def view(self, slots):
+        results = []
+        for apt in self.appointments:
+            match = True
+            if slots.get("doctor"):
+                apt_doctors = apt["doctor"] if isinstance(apt["doctor"], list) else [apt["doctor"]]
+                slot_doctors = slots["doctor"] if isinstance(slots["doctor"], list) else [slots["doctor"]]
+                if not any(ad.lower() == sd.lower() for ad in apt_doctors for sd in slot_doctors):
+                    match = False
+            else:
+                apt_doctors = apt["doctor"] if isinstance(apt["doctor"], list) else [apt["doctor"]]
+            if slots.get("date"):
+                apt_dates = apt["date"] if isinstance(apt["date"], list) else [apt["date"]]
+                slot_dates = slots["date"] if isinstance(slots["date"], list) else [slots["date"]]
+                if not any(str(ad) == str(sd) for ad in apt_dates for sd in slot_dates):
+                    match = False
+            else:
+                apt_dates = apt["date"] if isinstance(apt["date"], list) else [apt["date"]]
+            if slots.get("name"):
+                slot_names = slots["name"] if isinstance(slots["name"], list) else [slots["name"]]
+                if not any(sn.lower() in apt["name"].lower() for sn in slot_names):
+                    match = False
+            if match:
+                apt_times = apt["time"] if isinstance(apt["time"], list) else [apt["time"]]
+                results.append(f"{apt['id']}: Dr. {', '.join(apt_doctors)} on {', '.join(apt_dates)}"
+                               f" at {', '.join(apt_times)} for {apt['name']}")
+        return "\n".join(results) if results else "No appointments found matching your criteria."
+
+
+class BookTools:
+    """The same replies from an AppointmentBook, as the tools in MedicalAsstPromptEndpoin build them."""
+
+    def __init__(self):
+        self.state = {"appointments": []}
+
+    def schedule(self, apt):
+        book = AppointmentBook(self.state)
+        book._insert(dict(apt))
+        book._book["last"] = max(book._book["last"], int(apt["id"][4:]))
+
+    def reschedule(self, apt_id, new_date, new_time):
+        apt = AppointmentBook(self.state).reschedule(apt_id, new_date, new_time)
+        if apt is None:
+            return f"Appointment {apt_id} not found."
+        return f"Rescheduled {apt_id} to {apt['date']} at {apt['time']}."
+
+    def cancel(self, apt_id):
+        if AppointmentBook(self.state).cancel(apt_id) is None:
+            return f"Appointment {apt_id} not found."
+        return f"Cancelled appointment {apt_id}."
+
+    def view(self, slots):
+        found = AppointmentBook(self.state).find(slots.get("doctor"), slots.get("date"), slots.get("name"))
+        if not found:
+            return "No appointments found matching your criteria."
+        return "\n".join(f"{apt['id']}: Dr. {apt['doctor']} on {apt['date']} at {apt['time']} for {apt['name']}"
+                         for apt in found)
+
+
+def _day(rng) -> str:
+    return (START + timedelta(days=rng.randrange(365))).isoformat()
+
+
+def appointments(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    return [{"id": f"apt-{1760000000 + i}", "name": rng.choice(NAMES), "doctor": rng.choice(DOCTORS),
+             "date": _day(rng), "time": rng.choice(TIMES), "created_at": "2026-01-01T00:00:00"}
+            for i in range(n)]
+
+
+def operations(n: int, count: int, seed: int = 11):
+    """A mix of views (by doctor, date, name, combined), reschedules and cancels."""
+    rng = random.Random(seed)
+    ops = []
+    for _ in range(count):
+        kind = rng.choice(["doctor", "date", "name", "doctor+date", "doctor+name",
+                           "reschedule", "cancel"])
+        apt_id = f"apt-{1760000000 + rng.randrange(n)}"
+        if kind == "reschedule":
+            ops.append(("reschedule", apt_id, _day(rng), rng.choice(TIMES)))
+        elif kind == "cancel":
+            ops.append(("cancel", apt_id))
+        else:
+            slots = {}
+            if "doctor" in kind:
+                slots["doctor"] = rng.choice(DOCTORS).upper() if rng.random() < 0.3 else rng.choice(DOCTORS)
+            if "date" in kind:
+                slots["date"] = _day(rng)
+            if "name" in kind:
+                slots["name"] = rng.choice(NAMES).split()[rng.randrange(2)].lower()
+            ops.append(("view", slots))
+    return ops
+
+
+def replay(tools, ops):
+    replies = []
+    for op in ops:
+        if op[0] == "view":
+            replies.append(tools.view(op[1]))
+        elif op[0] == "reschedule":
+            replies.append(tools.reschedule(*op[1:]))
+        else:
+            replies.append(tools.cancel(op[1]))
+    return replies
+
+
+def fill(cls, apts):
+    tools = cls()
+    for apt in apts:
+        tools.schedule(apt)
+    return tools
+
+
+def timed(cls, apts, ops):
+    tools = fill(cls, apts)
+    started = time.perf_counter()
+    replay(tools, ops)
+    return (time.perf_counter() - started) / len(ops) * 1e6
+
+
+def check(n: int, ops_count: int) -> dict:
+    apts, ops = appointments(n), operations(n, ops_count)
+    legacy, book = fill(ListTools, apts), fill(BookTools, apts)
+    mismatches = sum(a != b for a, b in zip(replay(legacy, ops), replay(book, ops)))
+    # A session saved as JSON and loaded again answers the same.
+    reloaded = BookTools()
+    reloaded.state = json.loads(json.dumps(book.state))
+    later = operations(n, ops_count, seed=13)
+    mismatches += sum(a != b for a, b in zip(replay(book, later), replay(reloaded, later)))
+    # Ids booked within one second stay unique.
+    state = {"appointments": []}
+    fresh = AppointmentBook(state)
+    ids = {fresh.add("A", "Dr. Sam", "2026-09-02", "5 PM")["id"] for _ in range(1000)}
+    return {"mismatches": mismatches, "unique_ids": len(ids) == 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--ops", type=int, default=300, help="tool calls timed per size")
+    args = parser.parse_args()
+
+    print(f"appointment tools, mean per call over {args.ops} mixed view/reschedule/cancel calls")
+    print(f"  {'appointments':>12} {'list us':>10} {'book us':>10} {'speedup':>8}")
+    for n in args.sizes:
+        apts, ops = appointments(n), operations(n, args.ops)
+        old, new = timed(ListTools, apts, ops), timed(BookTools, apts, ops)
+        print(f"  {n:>12} {old:>10.1f} {new:>10.1f} {old / new:>7.1f}x")
+    report = check(max(args.sizes), args.ops)
+    print(f"replies differing from the list tools: {report['mismatches']}; "
+          f"same-second ids unique: {report['unique_ids']}")
+
+
+if __name__ == "__main__":
+    main()
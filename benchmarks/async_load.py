@@ -0,0 +1,156 @@
+"""Concurrency check for the async /chat and /gemini-agent paths.
+
+Runs hundreds of simultaneous conversations against the route handlers in a
+single process with every LLM replaced by llm_provider's scripted fake
+(``LLM_PROVIDER=fake``), which sleeps for a fixed latency. With sync handlers
+the same run is capped by the threadpool size (40 workers by default); the
+async paths should finish in roughly ``turns * latency`` wall time regardless
+of the number of conversations.
+
+Usage (from the repository root):
+    python -m benchmarks.async_load --conversations 300 --turns 3 --latency 1.0
+    python -m benchmarks.async_load --surface gemini --conversations 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Every chat model is llm_provider's scripted fake unless LLM_PROVIDER says otherwise
+# (e.g. "replay" to drive the apps from recorded cassettes).
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+import langsmith  # noqa: E402
+import llm_limits  # noqa: E402
+from llm_provider import ScriptedChatModel  # noqa: E402
+
+
+def configure(model, latency: float, reply):
+    """Script a fake model from llm_provider; recorded (replay) models are left alone."""
+    if isinstance(model, ScriptedChatModel):
+        model.responder = reply
+        model.latency = latency
+        model.calls = 0
+    return model
+
+
+def gemini_responder(information_reply, booking_reply, supervisor=None):
+    """One Gemini model serves the supervisor and both agents; tell them apart by system prompt."""
+    def reply(messages):
+        system = messages[0].content if messages else ""
+        if system.startswith("You are a supervisor"):
+            return (supervisor or supervisor_reply)(messages)
+        if "set, cancel appointments" in system:
+            return booking_reply(messages)
+        return information_reply(messages)
+    return reply
+
+
+def _last_text(messages) -> str:
+    last = messages[-1]
+    return last.content if hasattr(last, "content") else last["content"]
+
+
+def assistant_reply(messages) -> str:
+    prompt = _last_text(messages)
+    if "JSON extractor" in prompt:
+        return json.dumps({
+            "intent": "schedule",
+            "slots": {"name": "Alex", "doctor": "Smith", "date": "2099-01-02",
+                      "time": "10:00", "appointment_id": None},
+        })
+    if '"missing", "next_slot", "question"' in prompt:
+        return json.dumps({"missing": [], "next_slot": None, "question": ""})
+    return "Your appointment is confirmed."
+
+
+def medicall_reply(messages) -> str:
+    return "Could you share your first and last name, please?"
+
+
+def supervisor_reply(messages) -> str:
+    return json.dumps({"next": "information_node", "reasoning": "availability question"})
+
+
+def setup_surface(surface: str, latency: float):
+    if surface == "medicall":
+        from prompt import MediCallPrompt as module
+        from prompt.MediCallPrompt import ChatRequest
+        configure(module.llm, latency, medicall_reply)
+        return (lambda sid, text: module.chat(ChatRequest(message=text, session_id=sid))), [module.llm]
+    if surface == "assistant":
+        from prompt import MedicalAsstPromptEndpoin as module
+        from prompt.MedicalAsstPromptEndpoin import ChatRequest
+        configure(module.llm, latency, assistant_reply)
+        return (lambda sid, text: module.chat(ChatRequest(message=text, session_id=sid))), [module.llm]
+    if surface == "gemini":
+        import create_agent
+        import main
+        from gemini_graph import build_async_gemini_graph, make_checkpointer
+        # The real supervisor and ReAct agents run; only the shared model is scripted.
+        configure(create_agent.llm, latency, gemini_responder(
+            lambda m: "Dr. Sam is available tomorrow at 11 AM.",
+            lambda m: "Your appointment is booked.",
+        ))
+        main.gemini_graph.set(build_async_gemini_graph(checkpointer=make_checkpointer("memory")))
+        return (lambda sid, text: main.run_gemini_agent(main.Req(input_text=text, thread_id=sid))), [create_agent.llm]
+    raise SystemExit(f"unknown surface {surface!r}")
+
+
+async def conversation(send, turns: int, latencies: list, errors: list):
+    session_id = None
+    for turn in range(turns):
+        started = time.perf_counter()
+        try:
+            response = await send(session_id, "I would like to see Dr. Smith on January 2, 2099 at 10 AM")
+            session_id = response["thread_id"] if isinstance(response, dict) else response.session_id
+        except Exception as exc:  # keep going; the error count is part of the report
+            errors.append(repr(exc))
+            return
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(args):
+    llm_limits.set_llm_concurrency(args.llm_concurrency)
+    send, models = setup_surface(args.surface, args.latency)
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(send, args.turns, latencies, errors)
+                           for _ in range(args.conversations)))
+    wall = time.perf_counter() - started
+    ordered = sorted(latencies) or [0.0]
+    report = {
+        "surface": args.surface,
+        "conversations": args.conversations,
+        "turns_completed": len(latencies),
+        "errors": len(errors),
+        "llm_calls": sum(m.calls for m in models),
+        "wall_seconds": round(wall, 3),
+        "turns_per_second": round(len(latencies) / wall, 1),
+        "p50_turn_seconds": round(statistics.median(ordered), 3),
+        "p95_turn_seconds": round(ordered[int(0.95 * (len(ordered) - 1))], 3),
+        "llm": llm_limits.llm_concurrency_stats(),
+    }
+    print(json.dumps(report, indent=2))
+    if errors:
+        print("first error:", errors[0], file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--surface", choices=["medicall", "assistant", "gemini"], default="medicall")
+    parser.add_argument("--conversations", type=int, default=300)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=1.0, help="simulated seconds per LLM call")
+    parser.add_argument("--llm-concurrency", type=int, default=llm_limits.LLM_MAX_CONCURRENCY)
+    # MediCallPrompt switches LangSmith tracing on at import; keep the run offline.
+    with langsmith.tracing_context(enabled=False):
+        asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
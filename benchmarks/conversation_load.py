@@ -0,0 +1,534 @@
+"""End-to-end load test: scripted multi-turn conversations against the HTTP apps.
+
+Replays schedule / reschedule / cancel / view conversations against one of the
+ASGI apps and reports per-turn p50/p95/p99 latency, throughput, error rates and
+SQLite contention ("database is locked" failures). Every chat model is
+llm_provider's scripted fake (``LLM_PROVIDER=fake``), answering the scripts
+below after ``--llm-latency`` seconds, so no network is needed.
+
+Surfaces:
+    gemini     main:app                          POST /gemini-agent
+    medicall   prompt.MediCallPrompt:app         POST /chat
+    assistant  prompt.MedicalAsstPromptEndpoin:app  POST /chat
+
+By default requests go through httpx's ASGI transport in this process. To load
+a real server over localhost, start it with the same fake in another shell and
+point ``--url`` at it:
+
+    python -m benchmarks.conversation_load serve --surface medicall --port 8000
+    python -m benchmarks.conversation_load run --surface medicall --url http://127.0.0.1:8000
+
+``--concurrency`` caps simultaneous conversations. ``--rate`` starts new
+conversations as a Poisson process (conversations per second); without it all
+of them are queued at once (closed loop). Both modes run from a scratch copy of
+the appointments database, so the repository's copy is never written.
+
+Usage (from the repository root):
+    python -m benchmarks.conversation_load run --surface medicall --conversations 500 --concurrency 100
+    python -m benchmarks.conversation_load run --surface gemini --conversations 40 --rate 2 --llm-latency 0.5
+"""
+import argparse
+import ast
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+import httpx  # noqa: E402
+import langsmith  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+
+from benchmarks.async_load import configure, gemini_responder  # noqa: E402
+
+SURFACES = {
+    "gemini": ("main", "/gemini-agent"),
+    "medicall": ("prompt.MediCallPrompt", "/chat"),
+    "assistant": ("prompt.MedicalAsstPromptEndpoin", "/chat"),
+}
+SCENARIOS = ("schedule", "reschedule", "cancel", "view")
+LOCK_MARKERS = ("database is locked", "database table is locked", "database is busy")
+
+FIRST_NAMES = ["Alex", "Jordan", "Casey", "Riley", "Morgan", "Taylor", "Jamie", "Avery"]
+TIMES = ["9:00 AM", "9:30 AM", "10:00 AM", "10:30 AM", "11:00 AM", "11:30 AM", "2:00 PM", "3:30 PM"]
+DOCTORS = [(1, "James"), (2, "Sam"), (3, "Sham"), (4, "Reeta")]
+
+DATE_TIME_RE = re.compile(r"([A-Z][a-z]+ \d{1,2}, \d{4}) at (\d{1,2}:\d{2} [AP]M)")
+
+
+# ---------------------------------------------------------------------------
+# Scripts: what each simulated caller says, per surface and scenario.
+
+def _letters(n: int) -> str:
+    out = ""
+    while True:
+        n, r = divmod(n, 26)
+        out += chr(ord("a") + r)
+        if not n:
+            return out
+
+
+def persona(n: int) -> dict:
+    """Distinct caller ``n``: names, contact details, a doctor and two future slots."""
+    first = FIRST_NAMES[n % len(FIRST_NAMES)]
+    last = "Tester" + _letters(n)
+    provider_id, doctor = DOCTORS[n % len(DOCTORS)]
+    day = date(2099, 1, 5) + timedelta(days=n % 365)
+    moved = day + timedelta(days=1)
+    return {
+        "first": first,
+        "last": last,
+        "email": f"{first}.{last}@example.com".lower(),
+        "phone": f"555{n:07d}",
+        "gender": "female" if n % 2 else "male",
+        "provider_id": provider_id,
+        "doctor": doctor,
+        "when": f"{day:%B} {day.day}, {day.year} at {TIMES[n % len(TIMES)]}",
+        "moved": f"{moved:%B} {moved.day}, {moved.year} at {TIMES[(n + 3) % len(TIMES)]}",
+    }
+
+
+def script(surface: str, scenario: str, p: dict) -> list:
+    if surface == "medicall":
+        turns = [
+            "Hi, I'd like to schedule an appointment.",
+            f"I'll take provider {p['provider_id']}. I'm {p['first']} {p['last']}, born 1990-04-12, "
+            f"{p['gender']}, email {p['email']}, phone {p['phone']}, address 12 Elm Street.",
+            f"{p['when']} please.",
+        ]
+        follow_up = {
+            "reschedule": f"Please move my appointment with Dr. {p['doctor']} to {p['moved']}.",
+            "cancel": "Please cancel my appointment.",
+            "view": "Can you show me my appointments?",
+        }
+    elif surface == "assistant":
+        turns = [
+            "Hi there",
+            f"I want to book with Dr. {p['doctor']}",
+            f"My name is {p['first']} {p['last']}",
+            p["when"],
+        ]
+        follow_up = {
+            "reschedule": f"Please reschedule that appointment to {p['moved']}",
+            "cancel": "Please cancel that appointment",
+            "view": "Show me my appointments",
+        }
+    else:
+        turns = [
+            f"Is Dr. {p['doctor']} available next week?",
+            f"Book me with Dr. {p['doctor']} on {p['when']}. I'm {p['first']} {p['last']}, email {p['email']}.",
+        ]
+        follow_up = {
+            "reschedule": f"Please reschedule it to {p['moved']}.",
+            "cancel": "Please cancel my appointment.",
+            "view": "Thanks, that's all.",
+        }
+    return turns + ([follow_up[scenario]] if scenario in follow_up else [])
+
+
+# ---------------------------------------------------------------------------
+# Scripted model replies. The fake sees exactly what the real model would, so the
+# replies are worked out from the conversation itself, not from harness state.
+
+def _human_texts(messages) -> list:
+    return [m.content for m in messages if m.type == "human"]
+
+
+def _tool_json(tool: str, parameters: dict) -> str:
+    return json.dumps({"tool": tool, "parameters": parameters})
+
+
+def medicall_reply(messages) -> str:
+    said = _human_texts(messages)
+    last = said[-1]
+    caller = re.search(
+        r"provider (\d+)\. I'm (\w+) (\w+), born (\S+), (\w+), email (\S+), phone (\S+), address ([^.]+)\.",
+        "\n".join(said),
+    )
+    booked = next((DATE_TIME_RE.search(text) for text in said if DATE_TIME_RE.search(text)), None)
+    if "schedule an appointment" in last:
+        return _tool_json("RetrieveProvidersList", {})
+    if last.startswith("I'll take provider"):
+        return f"Thanks {caller.group(2)}. Which date and time would you like?"
+    if not caller or not booked:
+        return "Could you tell me a bit more about what you need?"
+    pid, first, last_name, dob, gender, email, phone, address = caller.groups()
+    if last.startswith("Please move"):
+        doctor = re.search(r"Dr\. (\w+)", last).group(1)
+        new = DATE_TIME_RE.search(last)
+        return _tool_json("RescheduleAppointment", {
+            "providerName": doctor, "firstName": first, "lastName": last_name,
+            "oldDate": booked.group(1), "oldTime": booked.group(2),
+            "newDate": new.group(1), "newTime": new.group(2),
+        })
+    if last.startswith("Please cancel"):
+        return _tool_json("CancelAppointment", {"firstName": first, "phoneNumber": phone})
+    if "show me my appointments" in last:
+        return _tool_json("ViewAppointment", {"patient_firstName": first, "patient_lastName": last_name})
+    return _tool_json("ScheduleAppointment", {
+        "firstName": first, "lastName": last_name, "dateOfBirth": dob, "gender": gender,
+        "providerId": pid, "date": booked.group(1), "time": booked.group(2),
+        "email": email, "phoneNumber": phone, "address": address,
+    })
+
+
+ASSISTANT_REQUIRED = {
+    "schedule": ["name", "doctor", "date", "time"],
+    "reschedule": ["appointment_id", "date", "time"],
+    "cancel": ["appointment_id"],
+    "view": [],
+}
+
+
+def assistant_reply(messages) -> str:
+    prompt = messages[-1].content
+    message = re.search(r'User message:\n"""(.*)"""', prompt, re.S).group(1).strip()
+    known = ast.literal_eval(re.search(r"^known_slots: (.*)$", prompt, re.M).group(1))
+    slots = {k: known.get(k) for k in ("name", "doctor", "date", "time", "appointment_id")}
+    booked = re.findall(r"Scheduled: (apt-\d+)", prompt)
+    when = DATE_TIME_RE.search(message)
+
+    if message.startswith("I want to book"):
+        intent, slots["doctor"] = "schedule", message.rsplit(" ", 1)[-1]
+    elif message.startswith("My name is"):
+        intent, slots["name"] = "schedule", message[len("My name is "):]
+    elif "reschedule" in message:
+        intent, slots["appointment_id"] = "reschedule", booked[-1] if booked else None
+    elif "cancel" in message:
+        intent, slots["appointment_id"] = "cancel", booked[-1] if booked else None
+    elif message.startswith("Show me"):
+        intent = "view"
+    elif when:
+        intent = "schedule"
+    else:
+        return json.dumps({"intent": "none", "slots": {}, "next_slot": None,
+                           "question": "Hello! I can schedule, reschedule, cancel or view appointments."})
+    if when:
+        slots["date"] = time.strftime("%Y-%m-%d", time.strptime(when.group(1), "%B %d, %Y"))
+        slots["time"] = time.strftime("%H:%M", time.strptime(when.group(2), "%I:%M %p"))
+    missing = [s for s in ASSISTANT_REQUIRED[intent] if not slots.get(s)]
+    return json.dumps({
+        "intent": intent,
+        "slots": slots,
+        "next_slot": missing[0] if missing else None,
+        "question": f"Could you tell me the {missing[0]}?" if missing else "",
+    })
+
+
+def gemini_supervisor_reply(messages) -> str:
+    last = messages[-1]
+    if last.type == "ai" and last.name in ("information_node", "booking_node"):
+        return json.dumps({"next": "FINISH", "reasoning": "worker answered"})
+    text = _human_texts(messages)[-1].lower()
+    if "thanks" in text:
+        return json.dumps({"next": "FINISH", "reasoning": "conversation over"})
+    worker = "booking_node" if any(w in text for w in ("book", "reschedule", "cancel")) else "information_node"
+    return json.dumps({"next": worker, "reasoning": "scripted"})
+
+
+def _tool_call(name: str, args: dict) -> AIMessage:
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{name}"}])
+
+
+def gemini_information_reply(messages):
+    if messages[-1].type == "tool":
+        return f"Here are the open slots I found: {messages[-1].content[:200]}"
+    doctor = re.search(r"Dr\. (\w+)", _human_texts(messages)[-1])
+    if doctor:
+        return _tool_call("check_availability_by_doctor", {"doctor_name": doctor.group(1)})
+    return _tool_call("check_availability_by_specialization", {"specialization": "Cardiologist"})
+
+
+def gemini_booking_reply(messages):
+    if messages[-1].type == "tool":
+        return f"Done. {messages[-1].content}"
+    said = _human_texts(messages)
+    caller = re.search(r"I'm (\w+) (\w+), email (\S+)\.", "\n".join(said))
+    if not caller:
+        return "Could you tell me your name and email?"
+    first, last_name, email = caller.groups()
+    if "cancel" in said[-1].lower():
+        return _tool_call("cancel_appointment", {"state": {"emailId": email, "cancelled": False, "message": ""}})
+    when = DATE_TIME_RE.search(said[-1])
+    return _tool_call("schedule_appointment", {"state": {
+        "firstName": first, "lastName": last_name, "emailId": email,
+        "date": when.group(1) if when else "", "time": when.group(2) if when else "", "message": "",
+    }})
+
+
+# ---------------------------------------------------------------------------
+# App setup
+
+def use_scratch_dir(workdir: str = None) -> str:
+    """Run from a directory holding a copy of the appointments database.
+
+    The apps open their SQLite files by relative path, so this keeps every write
+    (appointments, sessions, checkpoints, appointments.txt) out of the repository.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="conversation_load_")
+    os.makedirs(workdir, exist_ok=True)
+    for name in ("appointment_details_new.db", "faq_corpus.json"):
+        target = os.path.join(workdir, name)
+        if not os.path.exists(target):
+            shutil.copy(os.path.join(REPO_ROOT, name), target)
+    os.chdir(workdir)
+    return workdir
+
+
+def load_app(surface: str, llm_latency: float):
+    """Import the surface's app and script its model."""
+    module_name, _ = SURFACES[surface]
+    module = __import__(module_name, fromlist=["app"])
+    if surface == "gemini":
+        import create_agent
+        configure(create_agent.llm, llm_latency, gemini_responder(
+            gemini_information_reply, gemini_booking_reply, gemini_supervisor_reply,
+        ))
+    else:
+        configure(module.llm, llm_latency, medicall_reply if surface == "medicall" else assistant_reply)
+    return module.app
+
+
+class ErrorCapture:
+    """ASGI wrapper that remembers why in-process requests failed.
+
+    httpx turns unhandled app exceptions into plain 500s; the exception text is
+    what tells a SQLite lock apart from any other failure.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.errors = {}
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.app(scope, receive, send)
+        except Exception as exc:
+            turn_key = dict(scope.get("headers") or []).get(b"x-load-turn", b"").decode()
+            self.errors[turn_key] = repr(exc)
+            raise
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+
+def percentile(ordered: list, pct: float) -> float:
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def latency_summary(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(1000 * percentile(ordered, 50), 1),
+        "p95_ms": round(1000 * percentile(ordered, 95), 1),
+        "p99_ms": round(1000 * percentile(ordered, 99), 1),
+        "max_ms": round(1000 * (ordered[-1] if ordered else 0.0), 1),
+    }
+
+
+class LoadRun:
+    def __init__(self, surface: str, client: httpx.AsyncClient, capture: ErrorCapture = None,
+                 think: float = 0.0, timeout: float = 120.0):
+        self.surface = surface
+        self.client = client
+        self.capture = capture
+        self.think = think
+        self.timeout = timeout
+        self.path = SURFACES[surface][1]
+        self.turns = []                 # (scenario, step, seconds, outcome)
+        self.queue_waits = []
+        self.conversations = Counter()
+        self.first_errors = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def _payload(self, text: str, session: str):
+        if self.surface == "gemini":
+            return {"input_text": text, "thread_id": session}
+        return {"message": text, "session_id": session}
+
+    def _classify(self, response: httpx.Response, turn_key: str):
+        if response.status_code != 200:
+            detail = (self.capture.errors.pop(turn_key, "") if self.capture else "") or response.text
+            kind = "db_locked" if any(m in detail for m in LOCK_MARKERS) else f"http_{response.status_code}"
+            return kind, None, detail
+        body = response.json()
+        reply = json.dumps(body)
+        if any(m in reply for m in LOCK_MARKERS):
+            return "db_locked", body, reply
+        return "ok", body, None
+
+    async def turn(self, session, text: str, turn_key: str):
+        try:
+            response = await asyncio.wait_for(
+                self.client.post(self.path, json=self._payload(text, session), headers={"x-load-turn": turn_key}),
+                self.timeout,
+            )
+        except asyncio.TimeoutError:
+            return "timeout", None, f"no response in {self.timeout}s"
+        except httpx.HTTPError as exc:
+            return "transport_error", None, repr(exc)
+        return self._classify(response, turn_key)
+
+    async def conversation(self, n: int, scenario: str, arrival: float, gate: asyncio.Semaphore, started: float):
+        delay = arrival - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        queued = time.perf_counter()
+        async with gate:
+            self.queue_waits.append(time.perf_counter() - queued)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                session = None
+                for step, text in enumerate(script(self.surface, scenario, persona(n))):
+                    if step and self.think:
+                        await asyncio.sleep(self.think)
+                    t0 = time.perf_counter()
+                    outcome, body, detail = await self.turn(session, text, f"{n}:{step}")
+                    self.turns.append((scenario, step, time.perf_counter() - t0, outcome))
+                    if outcome != "ok":
+                        self.first_errors.setdefault(outcome, detail[:300])
+                        self.conversations["failed"] += 1
+                        return
+                    session = body["thread_id"] if self.surface == "gemini" else body["session_id"]
+                self.conversations["completed"] += 1
+            finally:
+                self.in_flight -= 1
+
+    def report(self, wall: float, offered_rate: float) -> dict:
+        outcomes = Counter(outcome for _, _, _, outcome in self.turns)
+        total = len(self.turns) or 1
+        by_step = defaultdict(list)
+        for scenario, step, seconds, outcome in self.turns:
+            by_step[f"{scenario}/{step}"].append(seconds)
+        return {
+            "surface": self.surface,
+            "conversations": dict(self.conversations),
+            "turns": len(self.turns),
+            "wall_seconds": round(wall, 3),
+            "turns_per_second": round(len(self.turns) / wall, 2),
+            "conversations_per_second": round(self.conversations["completed"] / wall, 2),
+            "offered_conversations_per_second": offered_rate or None,
+            "peak_concurrent_conversations": self.peak_in_flight,
+            "outcomes": dict(outcomes),
+            "error_rate": round(1 - outcomes["ok"] / total, 4),
+            "db_lock_error_rate": round(outcomes["db_locked"] / total, 4),
+            "turn_latency": latency_summary([s for _, _, s, outcome in self.turns if outcome == "ok"]),
+            "queue_wait": latency_summary(self.queue_waits),
+            "per_turn": {key: latency_summary(samples) for key, samples in sorted(by_step.items())},
+            "first_errors": self.first_errors,
+        }
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}; expected one of {', '.join(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    scenarios = rng.choices(list(mix), weights=list(mix.values()), k=args.conversations)
+    arrivals, clock = [], 0.0
+    for _ in scenarios:
+        arrivals.append(clock)
+        if args.rate:
+            clock += rng.expovariate(args.rate)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=None, limits=limits)
+        capture, lifespan = None, contextlib.nullcontext()
+    else:
+        use_scratch_dir(args.workdir)
+        app = load_app(args.surface, args.llm_latency)
+        capture = ErrorCapture(app)
+        transport = httpx.ASGITransport(app=capture, raise_app_exceptions=False)
+        client = httpx.AsyncClient(transport=transport, base_url="http://load.test", timeout=None)
+        # ASGITransport does not send lifespan events; run the startup/shutdown hooks here.
+        lifespan = app.router.lifespan_context(app)
+
+    load = LoadRun(args.surface, client, capture, args.think, args.timeout)
+    gate = asyncio.Semaphore(args.concurrency)
+    app_output = io.StringIO()
+    with contextlib.ExitStack() as quiet:
+        if not args.verbose:
+            quiet.enter_context(contextlib.redirect_stdout(app_output))
+        async with lifespan, client:
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                load.conversation(n, scenario, arrival, gate, started)
+                for n, (scenario, arrival) in enumerate(zip(scenarios, arrivals))
+            ))
+            wall = time.perf_counter() - started
+    return load.report(wall, args.rate)
+
+
+def serve(args):
+    import uvicorn
+
+    use_scratch_dir(args.workdir)
+    app = load_app(args.surface, args.llm_latency)
+    print(f"Serving {args.surface} with the scripted LLM from {os.getcwd()}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("run", "serve"):
+        p = sub.add_parser(name)
+        p.add_argument("--surface", choices=sorted(SURFACES), default="medicall")
+        p.add_argument("--llm-latency", type=float, default=0.2, help="seconds per scripted LLM call")
+        p.add_argument("--workdir", help="scratch directory for the database copy (default: a new temp dir)")
+    run_p = sub.choices["run"]
+    run_p.add_argument("--url", help="load a running server instead of the in-process app")
+    run_p.add_argument("--conversations", type=int, default=200)
+    run_p.add_argument("--concurrency", type=int, default=50)
+    run_p.add_argument("--rate", type=float, default=0.0, help="new conversations per second (0: all at once)")
+    run_p.add_argument("--think", type=float, default=0.0, help="caller pause between turns, seconds")
+    run_p.add_argument("--mix", default="schedule=4,reschedule=2,cancel=2,view=2")
+    run_p.add_argument("--timeout", type=float, default=120.0, help="per-turn timeout, seconds")
+    run_p.add_argument("--seed", type=int, default=7)
+    run_p.add_argument("--out", help="also write the JSON report here")
+    run_p.add_argument("--verbose", action="store_true", help="keep the apps' own log output")
+    serve_p = sub.choices["serve"]
+    serve_p.add_argument("--host", default="127.0.0.1")
+    serve_p.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    with langsmith.tracing_context(enabled=False):
+        if args.command == "serve":
+            return serve(args)
+        report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(os.path.join(REPO_ROOT, args.out) if not os.path.isabs(args.out) else args.out, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Per-turn date/time parsing cost of the prompt services.
+
+Replays the parsing each chat turn does: the assistant's
+``postprocess_extracted_slots`` + past check (fuzzy parse of the message,
+normalizing the extracted date, combining date and time) and MediCall's
+``validate_and_normalize_params`` for a booking (date, time, combined, past
+check). Three ways:
+
+    dateutil    the code before prompt/date_normalizer.py: dateutil on every
+                call, a clock read and ZoneInfo lookup per helper
+    cold memo   date_normalizer with its memo cleared before every turn
+                (regex fast paths, dateutil only for what they do not cover)
+    warm memo   date_normalizer as it runs: the same turns seen again hit the memo
+
+It then checks that the normalizer returns what dateutil does for every turn
+(with dateutil's default moved to midnight, as in the normalizer), and reports
+how many messages the fast path decides without dateutil.
+
+Usage (from the repository root):
+    python -m benchmarks.date_parse_bench
+    python -m benchmarks.date_parse_bench --repeat 200
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+import warnings
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from dateutil import parser as dtparser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt import date_normalizer as dates  # noqa: E402
+
+# (user message, date and time slots the LLM extracted)
+ASSISTANT_TURNS = [
+    ("Hi, I'd like to book an appointment", None, None),
+    ("My name is John Smith", None, None),
+    ("I want to see Dr. Sam", None, None),
+    ("Can I come on Sep 2 at 5 PM?", "Sep 2", "5 PM"),
+    ("How about September 2nd, 2027 at 10:30 am", "2027-09-02", "10:30"),
+    ("make it 2027-09-02 17:00", "2027-09-02", "17:00"),
+    ("Book me with Dr Sam on Oct 14 at 11 AM please", "October 14", "11 AM"),
+    ("book a visit for Nov 3 at 9:15 AM", "2026-11-03", "9:15 AM"),
+    ("tomorrow afternoon works for me", None, None),
+    ("Reschedule apt-1 to Dec 1 at 3 PM", "Dec 1", "3 PM"),
+    ("yes, please confirm", None, None),
+    ("cancel my appointment", None, None),
+    ("show my appointments", None, None),
+    ("Thanks!", None, None),
+]
+# MediCall ScheduleAppointment parameters as the LLM emits them, with the user's message
+MEDICALL_TURNS = [
+    ("2026-09-02", "5:00 PM", "yes, book it"),
+    ("September 2", "5 PM", "September 2 at 5 PM"),
+    ("2027-10-14", "11:00 AM", "October 14 2027 at 11 AM"),
+    ("Dec 1", "3:30 pm", "Dec 1, 3:30 pm"),
+    ("2026-11-03", "17:00", "confirm"),
+]
+
+
+class Legacy:
+    """The helpers as they were in the prompt modules, dateutil on every call."""
+
+    def __init__(self, now_default: bool = True):
+        # now_default=False moves dateutil's default to midnight, as the normalizer does,
+        # so results can be compared ("5 PM" used to keep the current minute).
+        self.now_default = now_default
+
+    def _default(self):
+        now = datetime.now(ZoneInfo("America/New_York"))
+        return now if self.now_default else now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def mentions_year(self, text):
+        return bool(re.search(r"\b(19|20)\d{2}\b", text))
+
+    def parse_date_time_from_text(self, text):
+        tz = ZoneInfo("America/New_York")
+        default_dt = datetime.now(tz).replace(month=1, day=1, hour=9, minute=0, second=0, microsecond=0)
+        try:
+            dt = dtparser.parse(text, default=default_dt, fuzzy=True)
+        except Exception:
+            return None
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=tz)
+        if not re.search(r"\b(20\d{2}|19\d{2})\b", text):
+            dt = dt.replace(year=datetime.now(tz).year)
+        return {"date": dt.date().isoformat(), "time": dt.strftime("%H:%M"), "aware_dt": dt}
+
+    def normalize_date(self, date_str, user_msg):
+        base = dtparser.parse(date_str, default=self._default())
+        if not self.mentions_year(user_msg):
+            base = base.replace(year=datetime.now(ZoneInfo("America/New_York")).year)
+        return base.date().isoformat()
+
+    def normalize_time_ampm(self, time_str):
+        try:
+            return dtparser.parse(time_str).strftime("%-I:%M %p")
+        except Exception:
+            return time_str
+
+    def to_aware(self, date_str, time_str):
+        dt = dtparser.parse(f"{date_str} {time_str}", default=self._default())
+        return dt if dt.tzinfo else dt.replace(tzinfo=ZoneInfo("America/New_York"))
+
+    def is_past(self, aware_dt):
+        return aware_dt < datetime.now(aware_dt.tzinfo or ZoneInfo("America/New_York"))
+
+
+def assistant_turn(api, message, date_slot, time_slot):
+    """The date work of postprocess_extracted_slots and the past check in chat_turn."""
+    slots = {"date": date_slot, "time": time_slot}
+    has_year = api.mentions_year(message)
+    parts = api.parse_date_time_from_text(message)
+    if parts:
+        slots["date"] = slots["date"] or parts["date"]
+        slots["time"] = slots["time"] or parts["time"]
+    if slots["date"] and not has_year:
+        try:
+            slots["date"] = api.normalize_date(slots["date"], message)
+        except Exception:
+            pass
+    aware = parts["aware_dt"] if parts else None
+    if aware is None and slots["date"] and slots["time"]:
+        try:
+            aware = api.to_aware(slots["date"], slots["time"])
+        except Exception:
+            aware = None
+    return slots, aware, aware is not None and api.is_past(aware)
+
+
+def medicall_turn(api, date_param, time_param, message):
+    """ScheduleAppointment's date work in validate_and_normalize_params."""
+    day = api.normalize_date(date_param, message)
+    clock = api.normalize_time_ampm(time_param)
+    aware = api.to_aware(day, clock)
+    return day, clock, aware, api.is_past(aware)
+
+
+def run_turns(api, repeat: int, before_turn=None) -> float:
+    """Mean microseconds per turn over ``repeat`` passes of both corpora."""
+    turns = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message, date_slot, time_slot in ASSISTANT_TURNS:
+            if before_turn:
+                before_turn()
+            assistant_turn(api, message, date_slot, time_slot)
+        for date_param, time_param, message in MEDICALL_TURNS:
+            if before_turn:
+                before_turn()
+            medicall_turn(api, date_param, time_param, message)
+        turns += len(ASSISTANT_TURNS) + len(MEDICALL_TURNS)
+    return (time.perf_counter() - started) / turns * 1e6
+
+
+def check() -> dict:
+    legacy = Legacy(now_default=False)
+    mismatches = []
+    dates.clear_memo()
+    for message, date_slot, time_slot in ASSISTANT_TURNS:
+        if assistant_turn(legacy, message, date_slot, time_slot) != assistant_turn(dates, message, date_slot, time_slot):
+            mismatches.append(message)
+    for turn in MEDICALL_TURNS:
+        if medicall_turn(legacy, *turn) != medicall_turn(dates, *turn):
+            mismatches.append(turn[2])
+    year = datetime.now(dates.USER_TZ).year
+    fast = sum(dates._fuzzy_fast(message, year)[0] for message, _, _ in ASSISTANT_TURNS)
+    return {"mismatches": mismatches, "fast_path_messages": fast, "messages": len(ASSISTANT_TURNS)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=100, help="passes over the turn corpus per run")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")  # dateutil warns about tz-like words in fuzzy mode
+
+    modes = {
+        "dateutil": lambda: run_turns(Legacy(), args.repeat),
+        "cold memo": lambda: run_turns(dates, args.repeat, before_turn=dates.clear_memo),
+        "warm memo": lambda: run_turns(dates, args.repeat),
+    }
+    results = {}
+    for name, run in modes.items():
+        with dates.request_clock():
+            results[name] = statistics.median(run() for _ in range(args.runs))
+
+    base = results["dateutil"]
+    print(f"date/time parsing per chat turn ({len(ASSISTANT_TURNS)} assistant + {len(MEDICALL_TURNS)} MediCall turns,"
+          f" x{args.repeat}, median of {args.runs} runs)")
+    for name, us in results.items():
+        print(f"  {name:<10} {us:>8.1f} us/turn  {base / us:>5.1f}x")
+    report = check()
+    print(f"fast path decided {report['fast_path_messages']}/{report['messages']} free-text messages")
+    print(f"results differing from dateutil: {len(report['mismatches'])}"
+          + (f" {report['mismatches']}" if report["mismatches"] else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""Microbenchmarks for the SQLite data layer.
+
+Times every public method of ``AppointmentAndPatientManager`` and
+``AppointmentManager`` against synthetic databases of 10k, 100k and 1M patients
+and appointments. Each case is measured cold (first call on a freshly opened
+connection, so SQLite's page cache and statement cache are empty) and warm
+(repeated calls on the same connection, median and p95).
+
+Datasets are generated once per size into ``--data-dir`` and copied before each
+run, so write cases (schedule, reschedule, cancel) never drift the baseline.
+Results are written as JSON; ``compare`` flags cases that got slower:
+
+    python -m benchmarks.db_bench run --sizes 10000 100000 --out before.json
+    # ... change the data layer ...
+    python -m benchmarks.db_bench run --sizes 10000 100000 --out after.json
+    python -m benchmarks.db_bench compare before.json after.json --threshold 0.25
+
+``compare`` exits with status 1 when any case regressed, so it can gate CI.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DB.database_connection import AppointmentAndPatientManager  # noqa: E402
+from DB.database_connection_appointments import AppointmentManager  # noqa: E402
+
+# Bump when the generated data changes shape, so stale cached datasets are rebuilt.
+DATASET_VERSION = 1
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+FIRST_NAMES = ["alex", "jordan", "casey", "riley", "morgan", "taylor", "jamie", "avery", "sam", "drew",
+               "quinn", "reese", "skyler", "parker", "rowan", "emerson", "finley", "hayden", "kai", "logan"]
+LOCATIONS = ["san diego", "san francisco", "los angeles", "sacramento", "fresno",
+             "oakland", "san jose", "long beach", "irvine", "pasadena"]
+SPECIALITIES = ["Cardiologist", "Endocrinologist", "Neurologist", "Dermatologist", "Pediatrician",
+                "Oncologist", "Orthopedist", "Psychiatrist", "Radiologist", "Urologist"]
+TIMES = ["9:00 AM", "9:30 AM", "10:00 AM", "10:30 AM", "11:00 AM", "1:00 PM", "2:30 PM", "4:00 PM"]
+
+
+# ---------------------------------------------------------------------------
+# Synthetic data. Patient ``p`` (1-based) has exactly one appointment, with
+# provider ``provider_of(p)``, so name/phone lookups and cancellations always hit.
+
+def provider_count(size: int) -> int:
+    return max(20, size // 500)
+
+
+def provider_of(p: int, size: int) -> int:
+    return p % provider_count(size) + 1
+
+
+def patient_row(p: int):
+    first = FIRST_NAMES[p % len(FIRST_NAMES)]
+    dob = date(1940, 1, 1) + timedelta(days=p % 25_000)
+    return (first, f"doe{p}", "female" if p % 2 else "male", dob.isoformat(),
+            f"patient{p}@example.com", f"555{p:07d}", f"{p} elm street")
+
+
+def appointment_day(p: int) -> str:
+    return (date(2025, 1, 6) + timedelta(days=p % 730)).isoformat()
+
+
+def generate(path: str, size: int):
+    """Build the dataset for ``size`` patients at ``path`` using the managers' own schema."""
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    manager = AppointmentAndPatientManager(tmp)
+    cur = manager.cursor
+    providers = provider_count(size)
+    cur.executemany(
+        "INSERT INTO providers (provider_name, location, speciality, slots) VALUES (?, ?, ?, ?)",
+        ((f"doc{j}", LOCATIONS[j % len(LOCATIONS)], SPECIALITIES[j % len(SPECIALITIES)], "9 AM - 5 PM")
+         for j in range(1, providers + 1)))
+    cur.executemany(
+        "INSERT INTO patients (first_name, last_name, gender, date_of_birth, email, phone_number, address) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (patient_row(p) for p in range(1, size + 1)))
+    cur.executemany(
+        "INSERT INTO appointments (patient_id, provider_id, appointment_date, appointment_time) VALUES (?, ?, ?, ?)",
+        ((p, str(provider_of(p, size)), appointment_day(p), TIMES[p % len(TIMES)])
+         for p in range(1, size + 1)))
+    manager.conn.commit()
+    manager.close_connection()
+
+    # AppointmentManager keeps its own denormalised table in a separate file.
+    legacy = AppointmentManager(tmp + ".appointments")
+    legacy.cursor.executemany(
+        "INSERT INTO appointments (patient_name, doctor_name, appointment_date, appointment_time) VALUES (?, ?, ?, ?)",
+        ((f"{patient_row(p)[0]} doe{p}", f"doc{provider_of(p, size)}", appointment_day(p), TIMES[p % len(TIMES)])
+         for p in range(1, size + 1)))
+    legacy.conn.commit()
+    legacy.close_connection()
+    os.replace(tmp + ".appointments", path + ".appointments")
+    os.replace(tmp, path)
+
+
+def dataset(data_dir: str, size: int) -> str:
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"patients_{size}_v{DATASET_VERSION}.db")
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        print(f"generating {size} patients into {path} ...", file=sys.stderr)
+        generate(path, size)
+        print(f"  done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Cases. Each is (manager, name, call) where call(manager, k, case_index) runs
+# iteration ``k``; iterations pick distinct patients so write cases never repeat a row.
+
+def _patient(case_index: int, k: int, size: int) -> int:
+    return 1 + (case_index * 100_003 + k * 7_919) % size
+
+
+def _new_patient(k: int):
+    return types.SimpleNamespace(
+        first_name="bench", last_name=f"new{k}", gender="female", dob="1990-04-12",
+        email=f"bench.new{k}.{time.time_ns()}@example.com", phone_number=f"999{k:07d}",
+        address="1 bench road", provider_id="1", date="2026-03-02", time="10:00 AM",
+    )
+
+
+def cases(size: int):
+    def pick(index, k):
+        return _patient(index, k, size)
+
+    def provider(p):
+        return provider_of(p, size)
+
+    row = patient_row
+
+    main = [
+        ("add_patient", lambda m, k, i: m.add_patient("bench", f"add{k}", "male", "1990-01-01",
+                                                    f"bench.add{k}.{time.time_ns()}@example.com", "5550000000", "x")),
+        ("get_all_patients", lambda m, k, i: m.get_all_patients()),
+        ("get_all_providers", lambda m, k, i: m.get_all_providers()),
+        ("get_provider_by_id", lambda m, k, i: m.get_provider_by_id(provider(pick(i, k)))),
+        ("get_provider_by_name", lambda m, k, i: m.get_provider_by_name(f"Dr. doc{provider(pick(i, k))}")),
+        ("get_providers_by_location", lambda m, k, i: m.get_providers_by_location(LOCATIONS[k % len(LOCATIONS)])),
+        ("get_providers_by_speciality", lambda m, k, i: m.get_providers_by_speciality(SPECIALITIES[k % len(SPECIALITIES)])),
+        ("get_all_appointments", lambda m, k, i: m.get_all_appointments()),
+        ("get_appointments_by_patient_Name", lambda m, k, i: m.get_appointments_by_patient_Name(*row(pick(i, k))[:2])),
+        ("get_patient_by_id", lambda m, k, i: m.get_patient_by_id(pick(i, k))),
+        ("get_patient_by_name", lambda m, k, i: m.get_patient_by_name(*row(pick(i, k))[:2])),
+        ("find_providers[name]", lambda m, k, i: m.find_providers(name=f"Dr. doc{provider(pick(i, k))}")),
+        ("find_providers[speciality]", lambda m, k, i: m.find_providers(speciality=SPECIALITIES[k % len(SPECIALITIES)])),
+        ("get_open_slots", lambda m, k, i: m.get_open_slots(
+            m.find_providers(name=f"doc{provider(pick(i, k))}")[0], 5, start=datetime(2025, 6, 2, 8))),
+        ("verify_patient_by_phone_and_dob", lambda m, k, i: m.verify_patient_by_phone_and_dob(types.SimpleNamespace(
+            first_name=row(pick(i, k))[0], last_name=row(pick(i, k))[1],
+            phone_number=row(pick(i, k))[5], date_of_birth=row(pick(i, k))[3]))),
+        ("verify_patient_by_phone", lambda m, k, i: m.verify_patient_by_phone(
+            row(pick(i, k))[0], row(pick(i, k))[1], row(pick(i, k))[5])),
+        ("schedule_appointment", lambda m, k, i: m.schedule_appointment(
+            pick(i, k), str(provider(pick(i, k))), "2026-03-02", "10:00 AM")),
+        ("schedule_appointment_with_detail", lambda m, k, i: m.schedule_appointment_with_detail(_new_patient(k))),
+        ("reschedule_appointment", lambda m, k, i: m.reschedule_appointment(
+            f"doc{provider(pick(i, k))}", *row(pick(i, k))[:2], "2026-04-06", "11:00 AM")),
+        ("cancel_appointment", lambda m, k, i: m.cancel_appointment(row(pick(i, k))[0], row(pick(i, k))[5])),
+        ("cancel_appointment_by_id", lambda m, k, i: m.cancel_appointment_by_id(pick(i, k), "bench")),
+    ]
+    legacy = [
+        ("view_appointments", lambda m, k, i: m.view_appointments(f"doe{pick(i, k)}")),
+        ("schedule_appointment", lambda m, k, i: m.schedule_appointment(
+            f"bench new{k}", f"doc{provider(pick(i, k))}", "2026-03-02", "10:00 AM")),
+        ("reschedule_appointment", lambda m, k, i: m.reschedule_appointment(
+            f"{row(pick(i, k))[0]} doe{pick(i, k)}", f"doc{provider(pick(i, k))}", "2026-04-06", "11:00 AM")),
+        ("cancel_appointment", lambda m, k, i: m.cancel_appointment(types.SimpleNamespace(
+            patient_name=f"{row(pick(i, k))[0]} doe{pick(i, k)}", doctor_name=f"doc{provider(pick(i, k))}"))),
+    ]
+    return ([("AppointmentAndPatientManager", name, call) for name, call in main]
+            + [("AppointmentManager", name, call) for name, call in legacy])
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+
+def _open(manager_name: str, path: str):
+    if manager_name == "AppointmentManager":
+        return AppointmentManager(path + ".appointments")
+    return AppointmentAndPatientManager(path)
+
+
+def measure(manager_name: str, path: str, call, index: int, min_time: float, max_repeat: int) -> dict:
+    started = time.perf_counter()
+    manager = _open(manager_name, path)
+    connect = time.perf_counter() - started
+    try:
+        started = time.perf_counter()
+        call(manager, 0, index)
+        cold = time.perf_counter() - started
+
+        # Enough warm repeats to fill ``min_time``, within [3, max_repeat].
+        repeats = int(min(max_repeat, max(3, min_time / max(cold, 1e-6))))
+        warm = []
+        for k in range(1, repeats + 1):
+            started = time.perf_counter()
+            call(manager, k, index)
+            warm.append(time.perf_counter() - started)
+    finally:
+        manager.close_connection()
+    warm.sort()
+    return {
+        "connect_ms": round(connect * 1000, 4),
+        "cold_ms": round(cold * 1000, 4),
+        "warm_ms": round(statistics.median(warm) * 1000, 4),
+        "warm_p95_ms": round(warm[min(len(warm) - 1, int(0.95 * len(warm)))] * 1000, 4),
+        "warm_min_ms": round(warm[0] * 1000, 4),
+        "repeats": repeats,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run(args) -> dict:
+    results = []
+    selected = set(args.cases or [])
+    for size in args.sizes:
+        source = dataset(args.data_dir, size)
+        workdir = tempfile.mkdtemp(prefix="db_bench_")
+        path = os.path.join(workdir, "bench.db")
+        shutil.copy(source, path)
+        shutil.copy(source + ".appointments", path + ".appointments")
+        try:
+            for index, (manager_name, name, call) in enumerate(cases(size)):
+                if selected and name not in selected and f"{manager_name}.{name}" not in selected:
+                    continue
+                entry = {"size": size, "manager": manager_name, "case": name}
+                try:
+                    entry.update(measure(manager_name, path, call, index, args.min_time, args.max_repeat))
+                except Exception as exc:  # a broken method is a result too; keep benchmarking the rest
+                    entry["error"] = repr(exc)[:300]
+                results.append(entry)
+                shown = f"{entry['cold_ms']:>10.3f} {entry['warm_ms']:>10.3f}" if "error" not in entry else "  error: " + entry["error"].splitlines()[0][:60]
+                print(f"{size:>8} {manager_name[:20]:<20} {name:<34}{shown}", file=sys.stderr)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "dataset_version": DATASET_VERSION,
+            "min_time": args.min_time,
+        },
+        "results": results,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Comparison
+
+def compare(base: dict, new: dict, threshold: float, min_delta_ms: float, metric: str):
+    """(rows, regressions): per-case ratio of ``metric`` in ``new`` against ``base``."""
+    def key(entry):
+        return entry["size"], entry["manager"], entry["case"]
+
+    before = {key(e): e for e in base["results"]}
+    rows, regressions = [], 0
+    for entry in new["results"]:
+        old = before.get(key(entry))
+        if old is None or "error" in old or "error" in entry:
+            status = "error" if "error" in entry else ("new" if old is None else "fixed")
+            rows.append((key(entry), old and old.get(metric), entry.get(metric), None, status))
+            continue
+        a, b = old[metric], entry[metric]
+        ratio = b / a if a else float("inf")
+        if ratio > 1 + threshold and b - a > min_delta_ms:
+            status, regressions = "REGRESSION", regressions + 1
+        elif ratio < 1 / (1 + threshold) and a - b > min_delta_ms:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append((key(entry), a, b, ratio, status))
+    return rows, regressions
+
+
+def print_comparison(rows, metric: str):
+    print(f"{'size':>8} {'manager':<28} {'case':<34} {'base ' + metric:>14} {'new ' + metric:>14} {'ratio':>7}  status")
+    for (size, manager, case), a, b, ratio, status in rows:
+        fmt = lambda v: f"{v:>14.3f}" if isinstance(v, (int, float)) else f"{'-':>14}"  # noqa: E731
+        shown_ratio = f"{ratio:>7.2f}" if ratio is not None else f"{'-':>7}"
+        print(f"{size:>8} {manager:<28} {case:<34} {fmt(a)} {fmt(b)} {shown_ratio}  {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_p = sub.add_parser("run")
+    run_p.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    run_p.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "db_bench"),
+                       help="where generated datasets are cached")
+    run_p.add_argument("--cases", nargs="*", help="only these cases (name or Manager.name)")
+    run_p.add_argument("--min-time", type=float, default=0.2, help="seconds of warm repeats per case")
+    run_p.add_argument("--max-repeat", type=int, default=200)
+    run_p.add_argument("--out", default=f"db_bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    cmp_p = sub.add_parser("compare")
+    cmp_p.add_argument("base")
+    cmp_p.add_argument("new")
+    cmp_p.add_argument("--threshold", type=float, default=0.25, help="relative slowdown that counts as a regression")
+    cmp_p.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore differences smaller than this")
+    # The fastest warm call is the least noisy on a shared machine; medians are in the report too.
+    cmp_p.add_argument("--metric", default="warm_min_ms", choices=["warm_min_ms", "warm_ms", "warm_p95_ms", "cold_ms"])
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run(args)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {len(report['results'])} results to {args.out}")
+        return
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows, regressions = compare(base, new, args.threshold, args.min_delta_ms, args.metric)
+    print_comparison(rows, args.metric)
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%} in {args.metric}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
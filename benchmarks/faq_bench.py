@@ -0,0 +1,113 @@
+"""FAQ index build/load/query cost and direct-answer coverage.
+
+Builds indexes over synthetic corpora of increasing size with the hashing
+embedder (no network), then reports build time, memory-mapped load time and
+per-query top-k latency. Finally checks which paraphrased questions against the
+shipped ``faq_corpus.json`` would be answered directly (no agent loop).
+
+Usage (from the repository root):
+    python -m benchmarks.faq_bench --sizes 1000 10000 50000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faq_index import FAQ_CORPUS, FAQIndex, HashingEmbedder, build_index  # noqa: E402
+
+WORDS = (
+    "appointment doctor clinic parking insurance visit hours records pharmacy referral billing payment "
+    "cardiology dermatology pediatrics surgery lab results fasting telehealth video interpreter wheelchair "
+    "emergency registration portal prescription refill vaccine xray scan therapy nurse ward discharge "
+    "admission bed meal visitor children mask policy fee cancel reschedule specialist consultation"
+).split()
+
+PARAPHRASES = [
+    "what are visiting hours",
+    "when can I come visit someone at the hospital",
+    "can I get my medical records",
+    "is there a pharmacy",
+    "do you accept insurance",
+    "what should I bring to my appointment",
+    "do I have to fast before a blood test",
+    "do you offer telehealth consultations",
+    "is Dr. Puneet available tomorrow",
+    "book me with Dr. Sam at 11 AM",
+]
+
+
+def synthetic_corpus(size: int, rng: random.Random):
+    return [
+        {
+            "id": f"faq-{i}",
+            "question": " ".join(rng.choices(WORDS, k=6)) + "?",
+            "answer": " ".join(rng.choices(WORDS, k=25)) + ".",
+        }
+        for i in range(size)
+    ]
+
+
+def bench_size(size: int, queries: int, k: int, rng: random.Random) -> dict:
+    embedder = HashingEmbedder()
+    corpus = synthetic_corpus(size, rng)
+    with tempfile.TemporaryDirectory() as out:
+        started = time.perf_counter()
+        build_index(corpus, embedder, out)
+        build_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index = FAQIndex.load(out, embedder)
+        load_ms = (time.perf_counter() - started) * 1000
+
+        texts = [" ".join(rng.choices(WORDS, k=5)) for _ in range(queries)]
+        latencies = []
+        for text in texts:
+            started = time.perf_counter()
+            index.search(text, k)
+            latencies.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        index.search_many(texts, k)
+        batch_ms = (time.perf_counter() - started) * 1000
+        del index
+    ordered = sorted(latencies)
+    return {
+        "entries": size,
+        "build_s": round(build_s, 2),
+        "mmap_load_ms": round(load_ms, 2),
+        "query_p50_ms": round(statistics.median(ordered), 3),
+        "query_p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))], 3),
+        f"batch_{queries}_ms": round(batch_ms, 2),
+    }
+
+
+def coverage():
+    with open(FAQ_CORPUS) as f:
+        entries = json.load(f)
+    with tempfile.TemporaryDirectory() as out:
+        index = build_index(entries, HashingEmbedder(), out)
+        for text in PARAPHRASES:
+            hit = index.direct_answer(text)
+            print(f"  {'direct' if hit else 'agent ':6} {text!r}" + (f" -> {hit['id']} ({hit['score']:.2f})" if hit else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+    rng = random.Random(7)
+    for size in args.sizes:
+        print(json.dumps(bench_size(size, args.queries, args.k, rng)))
+    print("direct-answer coverage on faq_corpus.json:")
+    coverage()
+
+
+if __name__ == "__main__":
+    main()
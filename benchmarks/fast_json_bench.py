@@ -0,0 +1,106 @@
+"""Large list responses: Pydantic models + response_model vs JSON bytes straight from the rows.
+
+Fills a scratch copy of the database with ``--rows`` patients and providers
+and fetches /patients/ and /providers/ through main.py's app (httpx ASGI
+transport, in process) with FAST_JSON off and on, each without and with
+``Accept-Encoding: gzip``. HTTP_CACHE is off so every request serializes.
+Reports the median time per request, the peak Python memory allocated while
+serving one (tracemalloc, measured on a separate request since tracing slows
+everything down) and the bytes on the wire, and checks that both paths return
+the same JSON.
+
+Usage (from the repository root):
+    python -m benchmarks.fast_json_bench
+    python -m benchmarks.fast_json_bench --rows 20000 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("LANGCHAIN_TRACING_V2", "false")
+
+import httpx  # noqa: E402
+
+from benchmarks.conversation_load import use_scratch_dir  # noqa: E402
+
+use_scratch_dir()
+import fast_json  # noqa: E402
+import http_cache  # noqa: E402
+import main as api  # noqa: E402
+
+
+def seed(rows: int):
+    conn = sqlite3.connect("appointment_details_new.db")
+    conn.executemany(
+        "INSERT INTO patients (first_name, last_name, gender, date_of_birth, email, phone_number, address)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(f"first{i}", f"last{i}", "female" if i % 2 else "male", "1990-04-12", f"patient{i}@example.com",
+          f"555{i:07d}", f"{i} Elm Street, Springfield") for i in range(rows)])
+    conn.executemany(
+        "INSERT INTO providers (provider_name, location, speciality, slots) VALUES (?, ?, ?, ?)",
+        [(f"bench{i}", "san jose", "Cardiologist", "9 AM - 11 AM") for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+async def fetch(client, path: str, gzip: bool) -> httpx.Response:
+    headers = {"Accept-Encoding": "gzip" if gzip else "identity"}
+    response = await client.get(path, headers=headers)
+    assert response.status_code == 200, response.status_code
+    return response
+
+
+async def measure(client, path: str, fast: bool, gzip: bool, repeat: int) -> dict:
+    fast_json.FAST_JSON = fast
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = await fetch(client, path, gzip)
+        times.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    await fetch(client, path, gzip)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    wire = response.headers.get("content-length") or len(response.content)
+    return {"ms": statistics.median(times), "peak_mb": peak / 2**20, "wire_kb": int(wire) / 1024,
+            "data": json.loads(response.content)}
+
+
+async def run(repeat: int):
+    http_cache.HTTP_CACHE = False
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://json.test") as client:
+        print(f"  {'endpoint':<12} {'path':<7} {'encoding':<9} {'ms':>8} {'peak MB':>8} {'wire KB':>9}")
+        for path in ("/patients/", "/providers/"):
+            results = {}
+            for fast in (False, True):
+                for gzip in (False, True):
+                    r = results[fast, gzip] = await measure(client, path, fast, gzip, repeat)
+                    print(f"  {path:<12} {'fast' if fast else 'models':<7} {'gzip' if gzip else 'identity':<9}"
+                          f" {r['ms']:>8.0f} {r['peak_mb']:>8.1f} {r['wire_kb']:>9.0f}")
+            same = all(r["data"] == results[False, False]["data"] for r in results.values())
+            print(f"  {path:<12} same JSON on every path: {'yes' if same else 'NO'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="patients and providers to add")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    encoder = "orjson" if fast_json.orjson is not None else "json (orjson not installed)"
+    print(f"{args.rows} extra rows, median of {args.repeat}, fast path encoder: {encoder}")
+    asyncio.run(run(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
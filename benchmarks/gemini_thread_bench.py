@@ -0,0 +1,123 @@
+"""Request size and server-side parse cost of /gemini-agent vs. conversation length.
+
+Compares the old protocol, where every request carries the whole transcript
+that ``run_gemini_agent`` re-validates and rebuilds into message objects, with
+thread mode, where the request carries only ``input_text`` and ``thread_id``
+and the history comes from the graph checkpointer.
+
+Each thread is written one checkpoint per turn, as /gemini-agent does, and
+the checkpoint bytes stored so far are reported alongside. With
+``--history latest`` (GRAPH_CHECKPOINT_HISTORY's default) the SQLite saver
+keeps only a thread's newest checkpoint; ``--history all`` keeps every turn's,
+each holding the whole history up to it.
+
+Usage (from the repository root):
+    python -m benchmarks.gemini_thread_bench --checkpointer sqlite
+    python -m benchmarks.gemini_thread_bench --checkpointer sqlite --history all
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from pydantic import parse_obj_as  # noqa: E402
+
+import gemini_graph  # noqa: E402
+from main import ChatMessage, Req  # noqa: E402
+
+
+def transcript(turns: int) -> List[dict]:
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"Turn {i}: is Dr. Sam available next Tuesday around 11?"})
+        messages.append({"role": "ai", "content": f"Turn {i}: Dr. Sam has 11:00 AM and 11:30 AM open on Tuesday."})
+    return messages
+
+
+def parse_legacy(body: bytes):
+    req = Req.model_validate_json(body)
+    messages = []
+    for m in parse_obj_as(List[ChatMessage], req.messages):
+        cls = HumanMessage if m.role in ("user", "human") else AIMessage
+        messages.append(cls(content=m.content))
+    return messages
+
+
+async def parse_thread(graph, body: bytes):
+    req = Req.model_validate_json(body)
+    snapshot = await graph.aget_state({"configurable": {"thread_id": req.thread_id}})
+    return list(snapshot.values.get("messages", []))
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+async def atimed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def stored_kb() -> float:
+    """Checkpoint bytes held in the SQLite saver's tables (the WAL file only shrinks at a checkpoint)."""
+    if not os.path.exists(gemini_graph.GRAPH_CHECKPOINT_DB):
+        return 0.0
+    conn = sqlite3.connect(gemini_graph.GRAPH_CHECKPOINT_DB)
+    try:
+        return conn.execute("SELECT COALESCE(SUM(LENGTH(checkpoint)), 0) FROM checkpoints").fetchone()[0] / 1024
+    finally:
+        conn.close()
+
+
+async def run(args):
+    gemini_graph.GRAPH_CHECKPOINT_HISTORY = args.history
+    graph = gemini_graph.build_async_gemini_graph(checkpointer=gemini_graph.make_checkpointer(args.checkpointer))
+    print(f"{'turns':>6} {'legacy bytes':>13} {'legacy ms':>10} {'thread bytes':>13} {'thread ms':>10} {'stored KB':>10}")
+    for turns in args.turns:
+        history = transcript(turns)
+        legacy_body = json.dumps({"input_text": "And on Wednesday?", "messages": history}).encode()
+
+        thread_id = str(uuid.uuid4())
+        seeded = [HumanMessage(content=m["content"]) if m["role"] == "user" else AIMessage(content=m["content"])
+                  for m in history]
+        for turn in range(0, len(seeded), 2):
+            await graph.aupdate_state({"configurable": {"thread_id": thread_id}}, {"messages": seeded[turn:turn + 2]},
+                                      as_node="supervisor")
+        thread_body = json.dumps({"input_text": "And on Wednesday?", "thread_id": thread_id}).encode()
+
+        legacy_ms = timed(lambda: parse_legacy(legacy_body), args.repeat)
+        thread_ms = await atimed(lambda: parse_thread(graph, thread_body), args.repeat)
+        print(f"{turns:>6} {len(legacy_body):>13} {legacy_ms:>10.3f} {len(thread_body):>13} {thread_ms:>10.3f}"
+              f" {stored_kb():>10.0f}")
+    await gemini_graph.close_checkpointer(graph.checkpointer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpointer", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--history", choices=["latest", "all"], default="latest",
+                        help="checkpoints the SQLite saver keeps per thread")
+    parser.add_argument("--turns", type=int, nargs="+", default=[5, 20, 80, 320])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        gemini_graph.GRAPH_CHECKPOINT_DB = os.path.join(tmp, "bench_checkpoints.db")
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
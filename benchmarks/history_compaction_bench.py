@@ -0,0 +1,57 @@
+"""Prompt size per turn for MediCall /chat with history compaction.
+
+Drives a long MediCall conversation against the scripted fake LLM and prints, per turn,
+the estimated prompt tokens actually sent next to the size the full transcript
+would have had. With compaction the first column should flatten out after
+``HISTORY_KEEP_TURNS`` turns while the second keeps growing.
+
+Usage (from the repository root):
+    python -m benchmarks.history_compaction_bench --turns 40
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+import langsmith  # noqa: E402
+
+from benchmarks.async_load import configure  # noqa: E402
+from prompt import MediCallPrompt as medicall  # noqa: E402
+
+USER_LINES = [
+    "Hi, I'd like to schedule an appointment.",
+    "My name is Alex Morgan, my email is alex.morgan@example.com.",
+    "My phone number is 555-201-3344 and I was born on 1990-04-12.",
+    "I'd prefer provider 3 if they have time on Sep 14 at 10:30 AM.",
+    "Actually, could you also tell me what the other providers are?",
+    "Hmm, let me think about the address, it is 12 Elm Street, Springfield.",
+]
+
+
+async def run(turns: int):
+    configure(medicall.llm, 0, lambda m: "Thanks! Could you confirm the remaining details, please?")
+    session_id = None
+    print(f"{'turn':>4} {'sent':>6} {'full':>6} {'summary':>7} {'verbatim':>8}")
+    for turn in range(turns):
+        message = USER_LINES[turn % len(USER_LINES)]
+        response = await medicall.chat(medicall.ChatRequest(message=message, session_id=session_id))
+        session_id = response.session_id
+        usage = response.usage
+        print(f"{turn + 1:>4} {usage['prompt_tokens']:>6} {usage['full_transcript_tokens']:>6} "
+              f"{usage['summary_tokens']:>7} {usage['verbatim_entries']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=40)
+    args = parser.parse_args()
+    with langsmith.tracing_context(enabled=False):
+        asyncio.run(run(args.turns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Polling the provider endpoints: full responses vs cached bytes vs conditional GETs.
+
+Sends ``--polls`` GETs per endpoint through main.py's app (httpx ASGI
+transport, in process) three ways:
+
+    uncached   HTTP_CACHE off: query and serialize every time
+    cached     HTTP_CACHE on, no validator: the cached bytes, re-sent
+    304        HTTP_CACHE on, If-None-Match with the ETag from the last reply
+
+and reports the median time per request (end to end, and inside the /providers/
+handler alone), the body bytes sent and the provider queries run. It then inserts a provider and checks that the old ETag no longer
+matches. The scratch copy of the database gets ``--providers`` extra providers.
+
+Usage (from the repository root):
+    python -m benchmarks.http_cache_bench
+    python -m benchmarks.http_cache_bench --providers 20000 --polls 500
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("LANGCHAIN_TRACING_V2", "false")
+
+import httpx  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+from benchmarks.conversation_load import use_scratch_dir  # noqa: E402
+
+use_scratch_dir()
+import http_cache  # noqa: E402
+import main as api  # noqa: E402
+import metrics  # noqa: E402
+
+ENDPOINTS = {
+    "/providers/": {},
+    "/providers/2": {},
+    "/GetProvidersBySpeciality/": {"speciality": "Cardiologist"},
+}
+PROVIDER_QUERIES = ("get_all_providers", "get_all_providers_json", "get_provider_by_id", "get_providers_by_speciality")
+SPECIALITIES = ["Cardiologist", "Endocrinologist", "Neurologist", "Dermatologist", "Pediatrician"]
+
+
+def seed_providers(count: int):
+    conn = sqlite3.connect("appointment_details_new.db")
+    conn.executemany(
+        "INSERT INTO providers (provider_name, location, speciality, slots) VALUES (?, ?, ?, ?)",
+        [(f"bench{i}", "san jose", SPECIALITIES[i % len(SPECIALITIES)], "9 AM - 11 AM") for i in range(count)])
+    conn.commit()
+    conn.close()
+
+
+def queries_run() -> float:
+    return sum(metrics.db_queries.labels(f"AppointmentAndPatientManager.{method}", "ok").totals()[0]
+               for method in PROVIDER_QUERIES)
+
+
+async def poll(client, path: str, params: dict, polls: int, mode: str) -> dict:
+    http_cache.HTTP_CACHE = mode != "uncached"
+    first = await client.get(path, params=params)
+    headers = {"If-None-Match": first.headers["etag"]} if mode == "304" else {}
+    queries, times, sent = queries_run(), [], 0
+    for _ in range(polls):
+        started = time.perf_counter()
+        response = await client.get(path, params=params, headers=headers)
+        times.append((time.perf_counter() - started) * 1e6)
+        assert response.status_code == (304 if mode == "304" else 200), response.status_code
+        sent += len(response.content)
+    return {"us": statistics.median(times), "bytes": sent / polls, "queries": (queries_run() - queries) / polls}
+
+
+async def handler_us(polls: int, mode: str, etag: str) -> float:
+    """Median time of the /providers/ route function alone, without ASGI and middleware."""
+    http_cache.HTTP_CACHE = mode != "uncached"
+    headers = [(b"if-none-match", etag.encode())] if mode == "304" else []
+    request = Request({"type": "http", "method": "GET", "path": "/providers/", "headers": headers})
+    times = []
+    for _ in range(polls):
+        started = time.perf_counter()
+        await api.get_all_providers(request)
+        times.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(times)
+
+
+async def run(polls: int):
+    transport = httpx.ASGITransport(app=api.app)
+    # Identity encoding: the bytes column is the JSON body as served.
+    async with httpx.AsyncClient(transport=transport, base_url="http://cache.test",
+                                 headers={"Accept-Encoding": "identity"}) as client:
+        print(f"  {'endpoint':<28} {'mode':<9} {'us/request':>10} {'bytes':>9} {'queries':>8}")
+        for path, params in ENDPOINTS.items():
+            for mode in ("uncached", "cached", "304"):
+                r = await poll(client, path, params, polls, mode)
+                print(f"  {path:<28} {mode:<9} {r['us']:>10.0f} {r['bytes']:>9.0f} {r['queries']:>8.2f}")
+
+        before = (await client.get("/providers/")).headers["etag"]
+        print("  /providers/ handler alone: " + ", ".join([
+            f"{mode} {await handler_us(polls, mode, before):.0f} us" for mode in ("uncached", "cached", "304")]))
+        conn = sqlite3.connect("appointment_details_new.db")
+        conn.execute("INSERT INTO providers (provider_name, location, speciality, slots) "
+                     "VALUES ('late', 'fresno', 'Cardiologist', '9 AM - 10 AM')")
+        conn.commit()
+        conn.close()
+        after = await client.get("/providers/", headers={"If-None-Match": before})
+        print(f"  after an outside insert: {after.status_code} (ETag {before} -> {after.headers['etag']})")
+        assert after.status_code == 200 and after.headers["etag"] != before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", type=int, default=5000, help="extra providers in the scratch database")
+    parser.add_argument("--polls", type=int, default=200)
+    args = parser.parse_args()
+
+    seed_providers(args.providers)
+    print(f"{args.polls} polls per endpoint, {args.providers} extra providers (median)")
+    asyncio.run(run(args.polls))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Per-hop cost of the agent graph state vs. conversation length.
+
+Runs a supervisor -> worker loop with no LLM calls over synthetic histories of
+increasing length. "copy" is the old state shape: ``messages`` is a plain
+last-value channel, every node returns ``state["messages"] + [...]`` and
+rescans the whole history for valid messages. "append" uses the MessageLog
+channel from ``create_agent.AgentState``: nodes write only the new message and
+read the incrementally maintained valid view. Per-hop time should stay flat
+for "append" as the history grows.
+
+Usage (from the repository root):
+    python -m benchmarks.message_reducer_bench --history 100 1000 10000 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from langgraph.graph import END, StateGraph  # noqa: E402
+from langgraph.types import Command  # noqa: E402
+from typing_extensions import Annotated, TypedDict  # noqa: E402
+
+from message_log import MessageLog, valid_messages  # noqa: E402
+
+
+class CopyState(TypedDict):
+    messages: list
+    hops: int
+
+
+class AppendState(TypedDict):
+    messages: Annotated[list, MessageLog]
+    hops: int
+
+
+def copy_graph(hops: int):
+    def supervisor(state):
+        [m for m in state["messages"] if isinstance(m, (HumanMessage, AIMessage))]
+        goto = "worker" if state["hops"] < hops else END
+        return Command(goto=goto, update={"messages": state["messages"]})
+
+    def worker(state):
+        [m for m in state["messages"] if isinstance(m, (HumanMessage, AIMessage)) and m.content.strip() != ""]
+        reply = AIMessage(content=f"hop {state['hops']}", name="worker")
+        return Command(goto="supervisor", update={"messages": state["messages"] + [reply], "hops": state["hops"] + 1})
+
+    return _compile(CopyState, supervisor, worker)
+
+
+def append_graph(hops: int):
+    def supervisor(state):
+        valid_messages(state["messages"])
+        return Command(goto="worker" if state["hops"] < hops else END)
+
+    def worker(state):
+        valid_messages(state["messages"])
+        reply = AIMessage(content=f"hop {state['hops']}", name="worker")
+        return Command(goto="supervisor", update={"messages": [reply], "hops": state["hops"] + 1})
+
+    return _compile(AppendState, supervisor, worker)
+
+
+def _compile(state, supervisor, worker):
+    builder = StateGraph(state)
+    builder.add_node("supervisor", supervisor)
+    builder.add_node("worker", worker)
+    builder.set_entry_point("supervisor")
+    return builder.compile()
+
+
+def history(length: int):
+    return [
+        HumanMessage(content=f"question {i}") if i % 2 == 0 else AIMessage(content=f"answer {i}")
+        for i in range(length)
+    ]
+
+
+def per_hop_us(graph, length: int, hops: int) -> float:
+    messages = history(length) + [HumanMessage(content="latest question")]
+    config = {"recursion_limit": 2 * hops + 5}
+    # Graph start-up and the one-off copy of the input are paid by both runs; subtract a
+    # zero-hop run so only the hop cost remains.
+    started = time.perf_counter()
+    graph(0).invoke({"messages": messages, "hops": 0}, config=config)
+    baseline = time.perf_counter() - started
+    started = time.perf_counter()
+    graph(hops).invoke({"messages": messages, "hops": 0}, config=config)
+    elapsed = time.perf_counter() - started - baseline
+    return max(elapsed, 0) / (2 * hops) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--hops", type=int, default=50, help="worker round trips per run")
+    args = parser.parse_args()
+
+    print(f"{'history':>8} {'copy us/hop':>12} {'append us/hop':>14}")
+    for length in args.history:
+        copy_us = per_hop_us(copy_graph, length, args.hops)
+        append_us = per_hop_us(append_graph, length, args.hops)
+        print(f"{length:>8} {copy_us:>12.1f} {append_us:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Turns, LLM calls and time to a MediCall booking with and without the speculative provider prefetch.
+
+Drives ``prompt/MediCallPrompt.py``'s /chat handler with a scripted model that
+follows MEDICALL_PROMPT's protocol: when a patient asks to book and no
+provider list is in its context it outputs RetrieveProvidersList, otherwise it
+maps the provider the patient chose (by id or by name) and asks for whatever
+ScheduleAppointment still lacks. A scripted patient answers each question.
+
+    named     "I'd like to book with Dr. Sam. I'm ..." - the provider is named up front
+    browse    "Hi, I'd like to schedule an appointment." - the patient wants the list
+
+With PROVIDER_PREFETCH off the first turn spends its LLM call on
+RetrieveProvidersList and the patient has to restate the provider; with it on
+the list is already in context. Every LLM call costs ``--latency`` seconds.
+The savings shown are for a model that uses the injected list the way the
+prompt asks it to.
+
+Usage (from the repository root):
+    python -m benchmarks.provider_prefetch_bench
+    python -m benchmarks.provider_prefetch_bench --latency 0.6 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+import langsmith  # noqa: E402
+
+from benchmarks.async_load import configure  # noqa: E402
+from benchmarks.conversation_load import DATE_TIME_RE, use_scratch_dir  # noqa: E402
+
+use_scratch_dir()
+from prompt import MediCallPrompt as medicall  # noqa: E402
+
+DETAILS = "I'm Ana Diaz, born 1990-04-12, female, email ana@example.com, phone 5551234567, address 12 Elm Street."
+WHEN = "September 14, 2099 at 10:00 AM please."
+OPENERS = {
+    "named": f"I'd like to book with Dr. Sam. {DETAILS}",
+    "browse": "Hi, I'd like to schedule an appointment.",
+}
+PROVIDER_LINE = re.compile(r"ProviderID: (\d+) - Dr\. (\w+)")
+CALLER_RE = re.compile(r"I'm (\w+) (\w+), born (\S+), (\w+), email (\S+), phone (\S+), address ([^.]+)\.")
+
+
+def protocol_reply(messages) -> str:
+    """What a model following MEDICALL_PROMPT answers, worked out from its context alone."""
+    said = [m.content for m in messages if m.type == "human"]
+    seen = "\n".join(m.content for m in messages if m.type in ("system", "ai"))
+    providers = {name.lower(): pid for pid, name in PROVIDER_LINE.findall(seen)}
+    text = "\n".join(said)
+    if not providers:
+        return json.dumps({"tool": "RetrieveProvidersList", "parameters": {}})
+    chosen = re.search(r"provider (\d+)", text)
+    pid = chosen.group(1) if chosen else next(
+        (providers[n.lower()] for n in re.findall(r"Dr\. (\w+)", text) if n.lower() in providers), None)
+    if pid is None:
+        return "Which provider would you like to see?"
+    caller = CALLER_RE.search(text)
+    if not caller:
+        return "May I have your full name, date of birth, gender, email, phone number and address?"
+    when = DATE_TIME_RE.search(text)
+    if not when:
+        return "What date and time would you like?"
+    first, last, dob, gender, email, phone, address = caller.groups()
+    return json.dumps({"tool": "ScheduleAppointment", "parameters": {
+        "firstName": first, "lastName": last, "dateOfBirth": dob, "gender": gender, "providerId": pid,
+        "date": when.group(1), "time": when.group(2), "email": email, "phoneNumber": phone, "address": address}})
+
+
+def patient_answer(reply: str) -> str:
+    """Answer the question the reply ends with (a bare provider list counts as "which provider?")."""
+    if "date and time" in reply:
+        return WHEN
+    if "full name" in reply:
+        return DETAILS
+    return f"Dr. Sam, please. {DETAILS}"
+
+
+async def conversation(opener: str) -> dict:
+    session_id, message = None, opener
+    calls_before = medicall.llm.calls
+    started = time.perf_counter()
+    for turn in range(1, 8):
+        response = await medicall.chat(medicall.ChatRequest(message=message, session_id=session_id))
+        session_id = response.session_id
+        if response.done and "ProviderID" not in response.reply:
+            break
+        message = patient_answer(response.reply)
+    return {"turns": turn, "llm_calls": medicall.llm.calls - calls_before,
+            "ms": (time.perf_counter() - started) * 1000, "booked": response.done}
+
+
+async def bench(prefetch: bool, opener: str, latency: float, repeat: int) -> dict:
+    medicall.PROVIDER_PREFETCH = prefetch
+    configure(medicall.llm, latency, protocol_reply)
+    runs = [await conversation(opener) for _ in range(repeat)]
+    assert all(r["booked"] for r in runs), "scripted booking did not complete"
+    return {"turns": runs[0]["turns"], "llm_calls": runs[0]["llm_calls"],
+            "ms": statistics.median(r["ms"] for r in runs)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.4, help="simulated seconds per LLM call")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"MediCall booking, {args.latency:.2f} s per LLM call (median of {args.repeat})")
+    print(f"  {'opener':<8} {'prefetch':<9} {'turns':>5} {'LLM calls':>9} {'ms':>8}")
+    with langsmith.tracing_context(enabled=False):
+        for name, opener in OPENERS.items():
+            for prefetch in (False, True):
+                r = asyncio.run(bench(prefetch, opener, args.latency, args.repeat))
+                print(f"  {name:<8} {'on' if prefetch else 'off':<9} {r['turns']:>5} {r['llm_calls']:>9} {r['ms']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""LLM calls per /gemini-agent turn with supervisor vs. direct routing.
+
+Replays a scripted conversation (availability question, booking request, the
+follow-up answer, a closing thanks) through ``main.run_gemini_agent`` with the
+LLMs scripted (``LLM_PROVIDER=fake``), once with ``GRAPH_ROUTING=supervisor``
+(every worker result goes back through the supervisor) and once with ``direct``
+(worker replies end the turn; a worker that asked a question gets the next turn
+without a supervisor call).
+
+Usage (from the repository root):
+    python -m benchmarks.routing_bench --conversations 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+import langsmith  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+
+from benchmarks.async_load import _last_text, configure, gemini_responder  # noqa: E402
+
+SCRIPT = [
+    "Is Dr. Sam available tomorrow?",
+    "Book me with Dr. Sam at 11 AM",
+    "Alex Morgan",
+    "Thanks, that's all",
+]
+
+
+def supervisor_reply(messages) -> str:
+    last = messages[-1]
+    if isinstance(last, AIMessage) and last.name in ("information_node", "booking_node"):
+        return json.dumps({"next": "FINISH", "reasoning": "worker answered"})
+    text = _last_text(messages).lower()
+    if "thanks" in text:
+        return json.dumps({"next": "FINISH", "reasoning": "conversation over"})
+    worker = "booking_node" if "book" in text or "morgan" in text else "information_node"
+    return json.dumps({"next": worker, "reasoning": "scripted"})
+
+
+def booking_reply(messages) -> str:
+    if "book" in _last_text(messages).lower():
+        return "Sure, what is your full name?"
+    return "Your appointment with Dr. Sam is booked for 11 AM."
+
+
+async def bench(mode: str, conversations: int) -> dict:
+    import create_agent
+    import main
+    from gemini_graph import build_async_gemini_graph, make_checkpointer
+
+    create_agent.GRAPH_ROUTING = mode
+    configure(create_agent.llm, 0, gemini_responder(
+        lambda m: "Dr. Sam is available tomorrow at 11 AM.", booking_reply, supervisor_reply,
+    ))
+    main.gemini_graph.set(build_async_gemini_graph(checkpointer=make_checkpointer("memory")))
+
+    per_turn = [[] for _ in SCRIPT]
+    for _ in range(conversations):
+        thread_id = None
+        for index, text in enumerate(SCRIPT):
+            response = await main.run_gemini_agent(main.Req(input_text=text, thread_id=thread_id))
+            thread_id = response["thread_id"]
+            per_turn[index].append(response["llm_calls"])
+    calls = [c for turn in per_turn for c in turn]
+    return {
+        "routing": mode,
+        "llm_calls_per_turn": [statistics.mean(turn) for turn in per_turn],
+        "mean_llm_calls_per_turn": round(statistics.mean(calls), 2),
+        "last_reply": response["messages"][-1]["content"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=20)
+    args = parser.parse_args()
+    with langsmith.tracing_context(enabled=False):
+        results = [asyncio.run(bench(mode, args.conversations)) for mode in ("supervisor", "direct")]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
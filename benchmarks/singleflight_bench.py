@@ -0,0 +1,132 @@
+"""Request coalescing: queries run and latency for bursts of identical reads, SINGLEFLIGHT on and off.
+
+Three bursts of ``--callers`` identical requests released at once:
+
+    db threads      threads calling AppointmentAndPatientManager.get_all_providers
+                    on their own connections (how the API routes read)
+    medicall tasks  asyncio tasks in one event loop awaiting MediCall's provider
+                    lookup (prefetches and RetrieveProvidersList calls)
+    agent threads   threads calling the check_availability_by_specialization tool
+
+For each it reports the SQLite queries actually run (``sqlite_queries_total``),
+the calls that shared another's result, the median time for the whole burst
+and whether every caller got the same answer as with coalescing off. The
+scratch copy of the database gets ``--providers`` extra providers so a query
+takes long enough for the requests to overlap, as they do under load.
+
+Usage (from the repository root):
+    python -m benchmarks.singleflight_bench
+    python -m benchmarks.singleflight_bench --callers 100 --providers 20000 --rounds 7
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("LANGCHAIN_TRACING_V2", "false")
+
+from benchmarks.conversation_load import use_scratch_dir  # noqa: E402
+
+use_scratch_dir()
+import create_agent  # noqa: E402
+import metrics  # noqa: E402
+import singleflight  # noqa: E402
+from DB.database_connection import AppointmentAndPatientManager, db_reads  # noqa: E402
+from prompt import MediCallPrompt as medicall  # noqa: E402
+from resources import resources  # noqa: E402
+
+SPECIALITIES = ["Cardiologist", "Endocrinologist", "Neurologist", "Dermatologist", "Pediatrician",
+                "Oncologist", "Orthopedist", "Psychiatrist", "Radiologist", "Urologist"]
+
+
+def seed_providers(count: int):
+    conn = sqlite3.connect("appointment_details_new.db")
+    conn.executemany(
+        "INSERT INTO providers (provider_name, location, speciality, slots) VALUES (?, ?, ?, ?)",
+        [(f"bench{i}", "san jose", SPECIALITIES[i % len(SPECIALITIES)], "9 AM - 11 AM") for i in range(count)])
+    conn.commit()
+    conn.close()
+
+
+def queries_run() -> float:
+    return sum(metrics.db_queries.labels(f"AppointmentAndPatientManager.{method}", "ok").totals()[0]
+               for method in ("get_all_providers", "find_providers", "get_open_slots"))
+
+
+def coalesced() -> int:
+    return sum(flight.coalesced for flight in (db_reads, medicall.provider_lookups, create_agent.availability_lookups))
+
+
+def thread_burst(callers: int, fn) -> list:
+    barrier = threading.Barrier(callers)
+    results = [None] * callers
+
+    def worker(i):
+        barrier.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(callers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def db_threads(callers: int) -> list:
+    return thread_burst(callers, lambda: resources.db(AppointmentAndPatientManager).get_all_providers())
+
+
+def agent_threads(callers: int) -> list:
+    return thread_burst(callers, lambda: create_agent.check_availability_by_specialization.invoke(
+        {"specialization": "Cardiologist", "count": 3}))
+
+
+def medicall_tasks(callers: int) -> list:
+    async def burst():
+        return await asyncio.gather(*(medicall.lookup_providers({}) for _ in range(callers)))
+    return asyncio.run(burst())
+
+
+SCENARIOS = {"db threads": db_threads, "medicall tasks": medicall_tasks, "agent threads": agent_threads}
+
+
+def measure(scenario, callers: int, rounds: int, enabled: bool) -> dict:
+    singleflight.SINGLEFLIGHT = enabled
+    scenario(callers)  # every thread's connection opened, page cache warm
+    queries, shared, times, results = queries_run(), coalesced(), [], None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        results = scenario(callers)
+        times.append((time.perf_counter() - started) * 1000)
+    return {"queries": (queries_run() - queries) / rounds, "coalesced": (coalesced() - shared) / rounds,
+            "ms": statistics.median(times), "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", type=int, default=50, help="identical requests per burst")
+    parser.add_argument("--providers", type=int, default=5000, help="extra providers in the scratch database")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    seed_providers(args.providers)
+    print(f"{args.callers} identical requests at once, {args.providers} extra providers (median of {args.rounds})")
+    print(f"  {'burst':<15} {'coalescing':<10} {'queries':>8} {'coalesced':>9} {'ms':>8}  same results")
+    for name, scenario in SCENARIOS.items():
+        off = measure(scenario, args.callers, args.rounds, False)
+        on = measure(scenario, args.callers, args.rounds, True)
+        same = all(r == off["results"][0] for r in off["results"] + on["results"])
+        for label, r in (("off", off), ("on", on)):
+            print(f"  {name:<15} {label:<10} {r['queries']:>8.0f} {r['coalesced']:>9.0f} {r['ms']:>8.1f}"
+                  f"  {'yes' if same else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Cold-start benchmark for the apps: import time, startup, memory and time to first response.
+
+Each repeat runs in a fresh interpreter (from a scratch copy of the appointments
+database, with the scripted LLM) and measures:
+
+    import_ms        ``import <module>``
+    startup_ms       the app's lifespan startup (graph warm-up when WARM_UP is set)
+    first_rest_ms    the module's first REST probe (GET /providers/ for main)
+    langchain_loaded whether serving that REST call imported LangChain/LangGraph
+    first_agent_ms   first POST /gemini-agent, including building the graph on
+                     first use (only with --agent; the fake supervisor ends the
+                     turn at once, but the node's fixed sleep still dominates)
+    rss_mb           resident memory once every probe of the module has answered
+    builds_ms        what was built lazily, and how long each build took
+
+It also runs ``python -X importtime -c "import <module>"`` once and prints the
+slowest direct imports of the module, to see what a cold start pays for.
+
+``--deployment`` compares the four surfaces run as separate processes with
+``service`` (all of them in one process): per-process startup and resident
+memory, and the separate processes' totals next to the combined one.
+
+Usage (from the repository root):
+    python -m benchmarks.startup_bench
+    python -m benchmarks.startup_bench --warm-up none all --repeat 5 --out startup.json
+    python -m benchmarks.startup_bench --agent --repeat 1
+    python -m benchmarks.startup_bench --deployment --warm-up none
+"""
+import argparse
+import importlib
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_PREFIX = "STARTUP_RESULT "
+# Every fake model call answers with this; the supervisor reads it as "done".
+FAKE_REPLY = json.dumps({"next": "FINISH", "reasoning": "startup benchmark"})
+SURFACES = ["main", "main_new", "prompt.MediCallPrompt", "prompt.MedicalAsstPromptEndpoin"]
+# REST calls that touch each surface's routes and database (method, path, json body).
+PROBES = {
+    "main": [("GET", "/providers/", None)],
+    "main_new": [("POST", "/appointments/", {"patient_name": "startup"})],
+    "prompt.MediCallPrompt": [("GET", "/hello", None), ("GET", "/sessions/stats", None)],
+    "prompt.MedicalAsstPromptEndpoin": [("GET", "/hello", None), ("GET", "/sessions/stats", None)],
+}
+PROBES["service"] = PROBES["main"] + [
+    (method, prefix + path, body)
+    for prefix, module in (("/v2", "main_new"), ("/medicall", "prompt.MediCallPrompt"),
+                           ("/assistant", "prompt.MedicalAsstPromptEndpoin"))
+    for method, path, body in PROBES[module]
+]
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # Peak, not current, where /proc is unavailable (kilobytes on Linux).
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(args):
+    """One cold start, in this (fresh) interpreter."""
+    # Not conversation_load.use_scratch_dir: importing that module loads LangChain.
+    workdir = tempfile.mkdtemp(prefix="startup_bench_")
+    shutil.copy(os.path.join(REPO_ROOT, "appointment_details_new.db"), workdir)
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+
+    started = time.perf_counter()
+    module = importlib.import_module(args.module)
+    import_ms = (time.perf_counter() - started) * 1000
+
+    from fastapi.testclient import TestClient
+    import lazy
+
+    result = {"import_ms": import_ms}
+    started = time.perf_counter()
+    with TestClient(module.app) as client:
+        result["startup_ms"] = (time.perf_counter() - started) * 1000
+        statuses = []
+        for n, (method, path, body) in enumerate(PROBES[args.module]):
+            started = time.perf_counter()
+            statuses.append(client.request(method, path, json=body).status_code)
+            if n == 0:
+                result["first_rest_ms"] = (time.perf_counter() - started) * 1000
+                result["langchain_loaded"] = any(name.startswith(("langchain", "langgraph")) for name in sys.modules)
+        result["rest_status"] = statuses
+        if args.agent:
+            started = time.perf_counter()
+            response = client.post("/gemini-agent", json={"input_text": "What are your visiting hours?"})
+            result["first_agent_ms"] = (time.perf_counter() - started) * 1000
+            result["agent_status"] = response.status_code
+        result["rss_mb"] = _rss_mb()
+    result["builds_ms"] = {name: round(s * 1000, 1) for name, s in lazy.build_times().items() if s is not None}
+    print(RESULT_PREFIX + json.dumps(result))
+
+
+def _run_child(module: str, warm_up: str, agent: bool) -> dict:
+    env = dict(os.environ, LLM_PROVIDER="fake", FAKE_LLM_REPLY=FAKE_REPLY, WARM_UP=warm_up, TRACE_LOG="off",
+               GRAPH_CHECKPOINTER="memory")
+    command = [sys.executable, "-W", "ignore", "-m", "benchmarks.startup_bench", "_child", "--module", module]
+    if agent:
+        command.append("--agent")
+    proc = subprocess.run(command, cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise SystemExit(f"startup run failed ({module}, WARM_UP={warm_up}):\n{proc.stderr[-2000:]}")
+
+
+def import_profile(module: str, top: int) -> list:
+    """Slowest direct imports of ``module`` by cumulative microseconds, from -X importtime."""
+    env = dict(os.environ, LLM_PROVIDER="fake", TRACE_LOG="off")
+    proc = subprocess.run([sys.executable, "-W", "ignore", "-X", "importtime", "-c", f"import {module}"],
+                          cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # One space after the bar, then two per nesting level: 0 is a top-level import.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(cumulative) / 1000))
+    # Children are listed before their parent, so the module's direct imports are
+    # the depth-1 rows between the previous top-level import and the module's own row.
+    end = max(i for i, (name, depth, _) in enumerate(rows) if depth == 0 and name == module)
+    start = max([i for i, (_, depth, _) in enumerate(rows[:end]) if depth == 0], default=-1) + 1
+    direct = sorted((r for r in rows[start:end] if r[1] == 1), key=lambda r: r[2], reverse=True)[:top]
+    return [{"module": module, "cumulative_ms": rows[end][2]}] + [
+        {"module": name, "cumulative_ms": ms} for name, _, ms in direct
+    ]
+
+
+def _summary(runs: list, key: str):
+    values = [r[key] for r in runs if key in r]
+    if not values:
+        return None
+    return {"median": round(statistics.median(values), 1), "min": round(min(values), 1), "max": round(max(values), 1)}
+
+
+def run(args) -> dict:
+    report = {"module": args.module, "repeat": args.repeat, "variants": {}}
+    for warm_up in args.warm_up:
+        runs = [_run_child(args.module, warm_up, args.agent) for _ in range(args.repeat)]
+        report["variants"][warm_up] = {
+            key: _summary(runs, key) for key in ("import_ms", "startup_ms", "first_rest_ms", "first_agent_ms", "rss_mb")
+        }
+        report["variants"][warm_up]["langchain_loaded_by_rest"] = any(r["langchain_loaded"] for r in runs)
+        report["variants"][warm_up]["builds_ms"] = runs[-1]["builds_ms"]
+    report["import_profile"] = import_profile(args.module, args.top)
+    return report
+
+
+def run_deployment(args) -> dict:
+    """Each surface in its own process against all of them in one ``service`` process."""
+    report = {"repeat": args.repeat, "variants": {}}
+    for warm_up in args.warm_up:
+        rows = {}
+        for module in SURFACES + ["service"]:
+            runs = [_run_child(module, warm_up, False) for _ in range(args.repeat)]
+            rows[module] = {key: _summary(runs, key)["median"] for key in ("import_ms", "startup_ms", "rss_mb")}
+            rows[module]["rest_status"] = runs[-1]["rest_status"]
+        rows["separate (sum)"] = {
+            key: round(sum(rows[m][key] for m in SURFACES), 1) for key in ("import_ms", "startup_ms", "rss_mb")
+        }
+        report["variants"][warm_up] = rows
+    return report
+
+
+def print_deployment(report: dict):
+    print(f"separate processes vs one service process: {report['repeat']} cold start(s) each (median)")
+    for warm_up, rows in report["variants"].items():
+        print(f"\nWARM_UP={warm_up}")
+        print(f"{'process':<34}{'import ms':>11}{'startup ms':>12}{'RSS MB':>9}")
+        for module, row in rows.items():
+            if module == "service":
+                continue
+            print(f"{module:<34}{row['import_ms']:>11}{row['startup_ms']:>12}{row['rss_mb']:>9.1f}")
+        row = rows["service"]
+        print(f"{'service (combined)':<34}{row['import_ms']:>11}{row['startup_ms']:>12}{row['rss_mb']:>9.1f}")
+        saved = rows["separate (sum)"]["rss_mb"] - row["rss_mb"]
+        print(f"combined saves {saved:.1f} MB resident "
+              f"({saved / rows['separate (sum)']['rss_mb'] * 100:.0f}% of the separate total)")
+
+
+def print_report(report: dict):
+    print(f"{report['module']}: {report['repeat']} cold start(s) per variant (median ms, RSS MB)")
+    print(f"{'WARM_UP':<10}{'import':>10}{'startup':>10}{'1st REST':>10}{'1st agent':>11}{'RSS':>8}  LangChain on REST")
+    for warm_up, v in report["variants"].items():
+        cells = [v[k]["median"] if v[k] else "-" for k in ("import_ms", "startup_ms", "first_rest_ms", "first_agent_ms", "rss_mb")]
+        print(f"{warm_up:<10}{cells[0]:>10}{cells[1]:>10}{cells[2]:>10}{cells[3]:>11}{cells[4]:>8}  "
+              f"{v['langchain_loaded_by_rest']}")
+        if v["builds_ms"]:
+            print(f"{'':<10}built: " + ", ".join(f"{name} {ms} ms" for name, ms in v["builds_ms"].items()))
+    print("\nimport profile (cumulative ms, direct imports):")
+    for row in report["import_profile"]:
+        print(f"  {row['cumulative_ms'] or 0:>9.1f}  {row['module']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command")
+    child_p = sub.add_parser("_child")
+    child_p.add_argument("--module", default="main")
+    child_p.add_argument("--agent", action="store_true")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--warm-up", nargs="+", default=["none", "all"], help="WARM_UP values to compare")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--agent", action="store_true", help="also time the first /gemini-agent turn")
+    parser.add_argument("--deployment", action="store_true",
+                        help="compare the surfaces as separate processes with the combined service")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--out", help="write the report as JSON")
+    args = parser.parse_args()
+
+    if args.command == "_child":
+        child(args)
+        return
+    if args.deployment:
+        report = run_deployment(args)
+        print_deployment(report)
+    else:
+        report = run(args)
+        print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
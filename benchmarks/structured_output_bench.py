@@ -0,0 +1,159 @@
+"""Structured-output parsing: what the old find/rfind parsing lost, and how early a streamed tool call dispatches.
+
+1. Replays a corpus of model replies seen in practice (clean JSON, fenced
+   JSON, prose around JSON, braces in prose, two objects, wrong types, an
+   unknown tool) through the old parsing (``text.find("{")`` /
+   ``text.rfind("}")`` + ``json.loads``, defaults on failure) and through
+   prompt/structured_output.py (first complete object, schema validation).
+   Counts replies each one uses correctly, and the ones it would silently
+   replace with defaults (each of those costs the user a clarification turn).
+2. Streams a MediCall tool call from a fake model, ``--chunk-ms`` per chunk,
+   as text JSON and as a native function call, and reports when ``on_call``
+   fired against when the stream ended.
+
+Usage (from the repository root):
+    python -m benchmarks.structured_output_bench
+    python -m benchmarks.structured_output_bench --chunk-ms 30 --trailing 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("LANGCHAIN_TRACING_V2", "false")
+
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessageChunk  # noqa: E402
+from langchain_core.outputs import ChatGenerationChunk  # noqa: E402
+
+from prompt import structured_output as structured  # noqa: E402
+from prompt.MediCallPrompt import TOOL_SCHEMAS  # noqa: E402
+from prompt.MedicalAsstPromptEndpoin import Extraction  # noqa: E402
+
+CALL = {"tool": "ViewAppointment", "parameters": {"patient_firstName": "Ana", "patient_lastName": "Diaz"}}
+TURN = {"intent": "schedule", "slots": {"name": "Ana Diaz", "doctor": "Sam", "date": None, "time": None,
+                                        "appointment_id": None}}
+
+# (reply, what it should parse to; None = nothing usable, the model has to be asked again)
+CORPUS = [
+    (json.dumps(TURN), TURN),
+    ("```json\n" + json.dumps(TURN) + "\n```", TURN),
+    ("Here is the result: " + json.dumps(TURN) + " Let me know if you need more.", TURN),
+    ("Sure {name} - " + json.dumps(TURN), TURN),
+    (json.dumps(TURN) + "\n" + json.dumps({"intent": "none", "slots": {}}), TURN),
+    (json.dumps({**TURN, "intent": "Schedule"}), TURN),
+    (json.dumps({"intent": "schedule", "slots": {**TURN["slots"], "appointment_id": 1760000000}}),
+     {"intent": "schedule", "slots": {**TURN["slots"], "appointment_id": "1760000000"}}),
+    (json.dumps({"intent": "book", "slots": {}}), None),
+    ("I could not find a date in that message.", None),
+    ("What would you like to do? " + json.dumps(CALL), CALL),
+    ("{\"tool\": \"ViewAppointment\", \"parameters\": {\"patient_firstName\": \"Ana\", "
+     "\"patient_lastName\": \"Diaz\"}} (confirming {patient})", CALL),
+    (json.dumps({"tool": "ShowAppointments", "parameters": {}}), None),
+]
+
+
+def legacy_parse(text: str):
+    start, end = text.find("{"), text.rfind("}")
+    try:
+        return json.loads(text[start:end + 1])
+    except Exception:
+        return None
+
+
+def new_parse(text: str):
+    data = structured.first_object(text)
+    if data is None:
+        return None
+    if "tool" in data:
+        call, _ = structured.validate_tool_call(data["tool"], data.get("parameters"), TOOL_SCHEMAS)
+        return {"tool": call.name, "parameters": {k: v for k, v in call.params.items() if v}} if call else None
+    result, _ = structured.parse_json(text, Extraction)
+    return result.model_dump() if result else None
+
+
+def score(parse) -> dict:
+    used = dropped = wrong = 0
+    for reply, expected in CORPUS:
+        got = parse(reply)
+        if expected is None:
+            # Nothing usable: the good outcome is noticing (and asking the model again).
+            wrong += got is not None and got != expected
+            continue
+        if got == expected:
+            used += 1
+        elif got is None:
+            dropped += 1
+        else:
+            wrong += 1
+    return {"used": used, "dropped": dropped, "wrong": wrong}
+
+
+class StreamingModel(BaseChatModel):
+    """Streams ``pieces`` as text chunks, or as the argument text of one native tool call."""
+
+    pieces: list = []
+    native: bool = False
+    delay: float = 0.02
+
+    @property
+    def _llm_type(self) -> str:
+        return "bench-streamer"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for i, piece in enumerate(self.pieces):
+            await asyncio.sleep(self.delay)
+            if self.native:
+                chunk = AIMessageChunk(content="", tool_call_chunks=[
+                    {"name": CALL["tool"] if i == 0 else None, "args": piece, "id": "call-1" if i == 0 else None,
+                     "index": 0}])
+            else:
+                chunk = AIMessageChunk(content=piece)
+            yield ChatGenerationChunk(message=chunk)
+
+
+def _pieces(text: str, size: int = 8) -> list:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+async def stream_timing(native: bool, chunk_ms: float, trailing: int) -> dict:
+    body = json.dumps(CALL["parameters"] if native else CALL)
+    # Trailing chunks stand for what a completion emits after the JSON (end of a
+    # code fence, whitespace, the usage report) before the stream closes.
+    model = StreamingModel(pieces=_pieces(body) + [""] * trailing, native=native, delay=chunk_ms / 1000)
+    started = time.perf_counter()
+    fired = []
+    _, call = await structured.arequest_tool_call(model, [], TOOL_SCHEMAS,
+                                                  on_call=lambda c: fired.append(time.perf_counter()))
+    return {"call": call.name if call else None, "dispatch_ms": (fired[0] - started) * 1000 if fired else None,
+            "stream_ms": (time.perf_counter() - started) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-ms", type=float, default=20.0, help="delay per streamed chunk")
+    parser.add_argument("--trailing", type=int, default=10, help="chunks after the JSON closes")
+    args = parser.parse_args()
+
+    usable = sum(1 for _, expected in CORPUS if expected is not None)
+    print(f"replies used as intended ({usable} usable of {len(CORPUS)}; dropped = silently replaced by defaults)")
+    for name, parse in (("find/rfind", legacy_parse), ("structured", new_parse)):
+        s = score(parse)
+        print(f"  {name:<11} used {s['used']:>2}  dropped {s['dropped']:>2}  wrong/unnoticed {s['wrong']:>2}")
+
+    print(f"streamed tool call ({args.chunk_ms:.0f} ms/chunk, {args.trailing} chunks after the JSON)")
+    for native in (False, True):
+        t = asyncio.run(stream_timing(native, args.chunk_ms, args.trailing))
+        print(f"  {'native call' if native else 'text JSON':<11} dispatched at {t['dispatch_ms']:>6.0f} ms,"
+              f" stream ended at {t['stream_ms']:>6.0f} ms ({t['call']})")
+
+
+if __name__ == "__main__":
+    main()
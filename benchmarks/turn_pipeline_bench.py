@@ -0,0 +1,109 @@
+"""Latency of the slot-filling /chat turn pipelines against the scripted fake LLM.
+
+Replays one scripted booking conversation (greeting, doctor, name, date/time)
+through ``prompt/MedicalAsstPromptEndpoin.py`` with ``TURN_PIPELINE`` set to
+"legacy" (extract -> follow-up -> finalize) and "single" (one combined call,
+local missing-slot decision, templated confirmation). Every LLM call costs
+``--latency`` seconds, so the difference is the saved round trips.
+
+Usage (from the repository root):
+    python -m benchmarks.turn_pipeline_bench --latency 0.4 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+from benchmarks.async_load import _last_text, configure  # noqa: E402
+from prompt import MedicalAsstPromptEndpoin as assistant  # noqa: E402
+
+EMPTY = {"name": None, "doctor": None, "date": None, "time": None, "appointment_id": None}
+
+SCRIPT = [
+    ("Hi there", "none", {}),
+    ("I want to book with Dr. Smith", "schedule", {"doctor": "Smith"}),
+    ("My name is Alex Morgan", "schedule", {"doctor": "Smith", "name": "Alex Morgan"}),
+    ("January 2, 2099 at 10 AM", "schedule",
+     {"doctor": "Smith", "name": "Alex Morgan", "date": "2099-01-02", "time": "10:00"}),
+]
+
+current = {"intent": "none", "slots": dict(EMPTY)}
+
+
+def _missing():
+    required = assistant.REQUIRED_SLOTS.get(current["intent"], [])
+    return [s for s in required if not current["slots"].get(s)]
+
+
+def scripted_reply(messages) -> str:
+    prompt = _last_text(messages)
+    if "JSON extractor" in prompt:
+        return json.dumps(current)
+    if "language layer of an appointment assistant" in prompt:
+        missing = _missing()
+        question = f"Could you tell me the {missing[0]}?" if missing else ""
+        if current["intent"] == "none":
+            question = "Hello! How can I help with your appointments today?"
+        return json.dumps({**current, "next_slot": missing[0] if missing else None, "question": question})
+    if '"missing", "next_slot", "question"' in prompt:
+        missing = _missing()
+        return json.dumps({
+            "missing": missing,
+            "next_slot": missing[0] if missing else None,
+            "question": f"Could you tell me the {missing[0]}?" if missing else "",
+        })
+    return "Your appointment is confirmed. Anything else?"
+
+
+async def run_conversation(turn_latencies: list, turn_calls: list):
+    session_id = None
+    for index, (message, intent, slots) in enumerate(SCRIPT):
+        current["intent"] = intent
+        current["slots"] = {**EMPTY, **slots}
+        calls_before = assistant.llm.calls
+        started = time.perf_counter()
+        response = await assistant.chat(assistant.ChatRequest(message=message, session_id=session_id))
+        turn_latencies[index].append(time.perf_counter() - started)
+        turn_calls[index].append(assistant.llm.calls - calls_before)
+        session_id = response.session_id
+    return response
+
+
+async def bench(mode: str, latency: float, repeat: int) -> dict:
+    assistant.TURN_PIPELINE = mode
+    configure(assistant.llm, latency, scripted_reply)
+    turn_latencies = [[] for _ in SCRIPT]
+    turn_calls = [[] for _ in SCRIPT]
+    for _ in range(repeat):
+        last = await run_conversation(turn_latencies, turn_calls)
+    assert last.done, f"{mode}: scripted booking did not complete: {last.reply!r}"
+    return {
+        "pipeline": mode,
+        "llm_calls_per_turn": [round(statistics.mean(c), 2) for c in turn_calls],
+        "llm_calls_per_conversation": round(sum(statistics.mean(c) for c in turn_calls), 2),
+        "mean_turn_ms": [round(1000 * statistics.mean(t), 1) for t in turn_latencies],
+        "conversation_ms": round(1000 * sum(statistics.mean(t) for t in turn_latencies), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.4, help="simulated seconds per LLM call")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [asyncio.run(bench(mode, args.latency, args.repeat)) for mode in ("legacy", "single")]
+    print(json.dumps(results, indent=2))
+    legacy, single = results
+    print(f"booking turn: {legacy['llm_calls_per_turn'][-1]:g} -> {single['llm_calls_per_turn'][-1]:g} LLM calls; "
+          f"conversation: {legacy['conversation_ms']:.0f} ms -> {single['conversation_ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 import os
 from dotenv import load_dotenv
 import json
+import logging
 from typing_extensions import TypedDict, Annotated
-from typing import Literal
+from typing import Literal, Optional
 
 '''from langchain_core.pydantic_v1 import constr, BaseModel, Field, validator'''
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
@@ -14,57 +15,122 @@ from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import tools_condition, ToolNode, create_react_agent
 from langchain.tools import StructuredTool
 
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from langgraph.types import Command
 from langchain_core.tools import tool
 from langchain_core.output_parsers import JsonOutputKeyToolsParser
 from cancel_appointment import cancel_appointment
 from schedule_appointment import schedule_appointment
 import time
-
+import asyncio
+from message_log import MessageLog, valid_messages
+from faq_index import get_faq_index
+from agent_metrics import tool_timings
+from instrumentation import annotate, traced
+from llm_provider import embeddings_model
+from resources import resources
+from DB.database_connection import AppointmentAndPatientManager
+from singleflight import SingleFlight
+
+log = logging.getLogger(__name__)
 
 # Load env file
 env_path = "environment.env"
 load_dotenv(env_path)
 
-# Instantiate Gemini LLM
+# The Google client library is only imported when a live (or recording) client is built.
+def _gemini_chat():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash-lite",
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0.3,
+    )
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash-lite",
-    google_api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0.3,
-)
+
+def _gemini_embeddings():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(
+        model="models/embedding-001",
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+    )
+
+
+# Instantiate Gemini LLM (or the fake/recorded stand-in chosen by LLM_PROVIDER)
+llm = resources.chat_model("gemini", _gemini_chat)
 
 # Instantiate Gemini Embeddings
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001",
-    google_api_key=os.getenv("GOOGLE_API_KEY"),
-)
+embeddings = embeddings_model(_gemini_embeddings)
 
 
 class AgentState(TypedDict):
-    messages: MessagesState
-    # messages: Annotated[list[StrOrMsg], ListAppend]
+    # Append-only: nodes return just the messages they add, see message_log.py.
+    messages: Annotated[list, MessageLog]
+    next: str
+    query: str
+    cur_reasoning: str
+    id_number: str
+    # Worker that asked the user a question and should get the next turn directly.
+    awaiting: Optional[str]
+
+
+APPOINTMENTS_DB = os.getenv("APPOINTMENTS_DB", "appointment_details_new.db")
+
+
+def _availability_db() -> AppointmentAndPatientManager:
+    # Tools run on agent worker threads and sqlite connections are per thread; the
+    # shared pool keeps one manager per thread instead of reconnecting on every call.
+    return resources.db(AppointmentAndPatientManager, APPOINTMENTS_DB)
+
+
+# Agents asking for the same doctor's (or speciality's) availability at the same
+# time share one lookup: a name or speciality, then open slots per provider.
+availability_lookups = SingleFlight("agent_tools")
 
 
-@tool(description="Check availability of a doctor by name.")
-def check_availability_by_doctor(doctor_name: str) -> str:
-    # Dummy logic — you can replace this with DB/API logic
-    available_doctors = {
-        "Dr. Puneet": "Available tomorrow at 10 AM",
-        "Dr. Raj": "Fully booked this week",
+def _availability(manager, provider, count: int):
+    return {
+        "provider_id": provider.id,
+        "doctor": f"Dr. {provider.provider_name.title()}",
+        "speciality": provider.speciality,
+        "location": provider.location,
+        "hours": provider.slots,
+        "next_open_slots": [slot.strftime("%Y-%m-%d %I:%M %p") for slot in manager.get_open_slots(provider, count)],
     }
-    return available_doctors.get(doctor_name, "Doctor not found.")
 
 
-@tool(description="Check availability of doctors based on specialization.")
-def check_availability_by_specialization(specialization: str) -> str:
-    if specialization.lower() == "cardiologist":
-        return "Dr. Puneet is available on Monday and Thursday."
-    elif specialization.lower() == "dermatologist":
-        return "Dr. Raj is available on Wednesday."
-    else:
-        return "No doctors available for that specialization right now."
+@tool(description="Check the next open appointment slots of a doctor by name, e.g. 'Dr. Sam'.")
+@tool_timings.timed
+@availability_lookups.wrap(key=lambda doctor_name, count=5: (doctor_name.strip().lower(), count))
+def check_availability_by_doctor(doctor_name: str, count: int = 5) -> str:
+    manager = _availability_db()
+    providers = manager.find_providers(name=doctor_name)
+    if not providers:
+        return json.dumps({"error": f"No doctor named {doctor_name}."})
+    return json.dumps([_availability(manager, p, min(count, 10)) for p in providers])
+
+
+@tool(description="Check the next open appointment slots of doctors with a speciality, e.g. 'Cardiologist'.")
+@tool_timings.timed
+@availability_lookups.wrap(key=lambda specialization, count=3: (specialization.strip().lower(), count))
+def check_availability_by_specialization(specialization: str, count: int = 3) -> str:
+    manager = _availability_db()
+    providers = manager.find_providers(speciality=specialization)
+    if not providers:
+        return json.dumps({"error": f"No {specialization} doctors found."})
+    return json.dumps([_availability(manager, p, min(count, 10)) for p in providers])
+
+
+@tool(description="Search the hospital FAQ (visiting hours, parking, insurance, policies, services) for answers to a question.")
+@tool_timings.timed
+def search_hospital_faq(question: str) -> str:
+    index = get_faq_index()
+    if index is None:
+        return "The FAQ is not available right now."
+    hits = index.search(question, k=3)
+    return "\n\n".join(
+        f"Q: {entry['question']}\nA: {entry['answer']} (relevance {score:.2f})"
+        for score, entry in hits
+    )
 
 
 def create_agent(llm, tools: list, system_prompt: str):
@@ -81,8 +147,8 @@ def create_agent(llm, tools: list, system_prompt: str):
 #  Instantiate agents using Gemini LLM
 information_agent = create_agent(
     llm=llm,
-    tools=[check_availability_by_doctor, check_availability_by_specialization],
-    system_prompt="""You are a specialized agent to provide information related to availability of doctors or any FAQs related to hospital based on the query. You have access to the tools. Ask the user politely if you need more information to proceed. Always assume the current year is 2025.""",
+    tools=[check_availability_by_doctor, check_availability_by_specialization, search_hospital_faq],
+    system_prompt="""You are a specialized agent to provide information related to availability of doctors or any FAQs related to hospital based on the query. You have access to the tools; use search_hospital_faq for general hospital questions and answer from its results. Doctor availability comes from the availability tools; offer the open slots they return. Ask the user politely if you need more information to proceed. Always assume the current year is 2025.""",
 )
 
 booking_agent = create_agent(
@@ -92,94 +158,153 @@ booking_agent = create_agent(
 )
 
 
+# "direct": a worker's reply ends the turn, and if it asked the user something the
+# next turn goes straight back to that worker. "supervisor": every worker result is
+# routed through the supervisor again (two or more supervisor LLM calls per turn).
+GRAPH_ROUTING = os.getenv("GRAPH_ROUTING", "direct")
+
+
+def route_turn(state: AgentState):
+    if GRAPH_ROUTING == "direct" and state.get("awaiting"):
+        return state["awaiting"]
+    return "supervisor"
+
+
+def _worker_reply(worker: str, reply: AIMessage):
+    if GRAPH_ROUTING == "supervisor":
+        return Command(update={"messages": [reply]}, goto="supervisor")
+    # Turn complete: hand back to the user instead of asking the supervisor again.
+    awaiting = worker if reply.content.rstrip().endswith("?") else None
+    return Command(update={"messages": [reply], "next": END, "awaiting": awaiting}, goto=END)
+
+
 # Nodes to invoke the agents
-def information_node(state: AgentState):
+def _valid_messages(state: AgentState):
+    return valid_messages(state["messages"])
+
+
+def _information_failed(state: AgentState, error: Exception):
+    print("Error in information_node:", error)
+    annotate(error=repr(error)[:300])
+    return _worker_reply(
+        "information_node",
+        AIMessage(
+            content="Sorry, something went wrong while fetching doctor availability."
+        ),
+    )
+
+
+def _information_done(state: AgentState, result):
+    reply = result["messages"][-1].content
+    annotate(agent_messages=len(result["messages"]), reply_chars=len(reply))
+    return _worker_reply(
+        "information_node",
+        AIMessage(content=reply, name="information_node"),
+    )
+
+
+def _faq_direct_answer(state: AgentState):
+    """Answer a close match to a known FAQ straight from the index, skipping the agent loop."""
+    index = get_faq_index()
+    question = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
+    if index is None or not question:
+        return None
+    try:
+        hit = index.direct_answer(question)
+    except Exception:
+        log.exception("FAQ lookup failed; answering through the information agent")
+        return None
+    if hit is None:
+        return None
+    annotate(faq_direct_answer=hit["id"], faq_score=round(hit["score"], 3))
+    return _worker_reply("information_node", AIMessage(content=hit["answer"], name="information_node"))
+
+
+@traced("information_node", "node")
+def information_node(state: AgentState) -> Command[Literal["supervisor", "__end__"]]:
+    direct = _faq_direct_answer(state)
+    if direct is not None:
+        return direct
     time.sleep(5)
-    valid_messages = [
-        msg
-        for msg in state["messages"]
-        if isinstance(msg, (HumanMessage, AIMessage)) and msg.content.strip() != ""
-    ]
-    print("VALID MESSAGES >>>", valid_messages)
+    valid_messages = _valid_messages(state)
+    annotate(valid_messages=len(valid_messages))
 
     try:
         result = information_agent.invoke({"messages": valid_messages})
-        print("INFORMATION NODE RESULT >>>", result)
     except Exception as e:
-        print("Error in information_node:", e)
-        return Command(
-            update={
-                "messages": state["messages"]
-                + [
-                    AIMessage(
-                        content="Sorry, something went wrong while fetching doctor availability."
-                    )
-                ]
-            },
-            goto="supervisor",
-        )
-
-    return Command(
-        update={
-            "messages": state["messages"]
-            + [
-                AIMessage(
-                    content=result["messages"][-1].content, name="information_node"
-                )
-            ]
-        },
-        goto="supervisor",
-    )
+        return _information_failed(state, e)
+    return _information_done(state, result)
 
 
-def booking_node(state: AgentState):
-    time.sleep(2)
-    print("Booking node called.")
-    valid_messages = [
-        msg
-        for msg in state["messages"]
-        if isinstance(msg, (HumanMessage, AIMessage)) and msg.content.strip() != ""
-    ]
+@traced("information_node", "node")
+async def ainformation_node(state: AgentState) -> Command[Literal["supervisor", "__end__"]]:
+    # Embedding the question may be a network call; keep it off the event loop.
+    direct = await asyncio.to_thread(_faq_direct_answer, state)
+    if direct is not None:
+        return direct
+    await asyncio.sleep(5)
+    valid_messages = _valid_messages(state)
+    annotate(valid_messages=len(valid_messages))
 
     try:
-        result = booking_agent.invoke({"messages": valid_messages})
-        print("BOOKING NODE RESULT >>>", result)
-        response_msg = result["messages"][-1].content.strip()
+        result = await information_agent.ainvoke({"messages": valid_messages})
     except Exception as e:
-        print("Error in booking_node:", e)
-        return Command(
-            update={
-                "messages": state["messages"]
-                + [
-                    AIMessage(
-                        content="Sorry, something went wrong while handling booking."
-                    )
-                ]
-            },
-            goto="supervisor",
-        )
+        return _information_failed(state, e)
+    return _information_done(state, result)
+
+
+def _booking_failed(state: AgentState, error: Exception):
+    print("Error in booking_node:", error)
+    annotate(error=repr(error)[:300])
+    return _worker_reply(
+        "booking_node",
+        AIMessage(content="Sorry, something went wrong while handling booking."),
+    )
+
+
+def _booking_done(state: AgentState, result):
+    response_msg = result["messages"][-1].content.strip()
+    annotate(agent_messages=len(result["messages"]), reply_chars=len(response_msg))
 
     # If result is empty, end the loop
     if not response_msg:
         return Command(
             update={
-                "messages": state["messages"]
-                + [
+                "messages": [
                     AIMessage(
                         content="I'm sorry, I couldn't find enough information to proceed."
                     )
-                ]
+                ],
+                "awaiting": None,
             },
             goto=END,
         )
 
-    return Command(
-        update={
-            "messages": state["messages"]
-            + [AIMessage(content=response_msg, name="booking_node")]
-        },
-        goto="supervisor",
-    )
+    return _worker_reply("booking_node", AIMessage(content=response_msg, name="booking_node"))
+
+
+@traced("booking_node", "node")
+def booking_node(state: AgentState) -> Command[Literal["supervisor", "__end__"]]:
+    time.sleep(2)
+    valid_messages = _valid_messages(state)
+
+    try:
+        result = booking_agent.invoke({"messages": valid_messages})
+        return _booking_done(state, result)
+    except Exception as e:
+        return _booking_failed(state, e)
+
+
+@traced("booking_node", "node")
+async def abooking_node(state: AgentState) -> Command[Literal["supervisor", "__end__"]]:
+    await asyncio.sleep(2)
+    valid_messages = _valid_messages(state)
+
+    try:
+        result = await booking_agent.ainvoke({"messages": valid_messages})
+        return _booking_done(state, result)
+    except Exception as e:
+        return _booking_failed(state, e)
 
 
 # Define your workers
@@ -221,45 +346,37 @@ class Router(TypedDict):
     reasoning: Annotated[str, "Support proper reasoning for routing to the worker"]
 
 
-def supervisor_node(
-    state: AgentState,
-) -> Command[Literal["information_node", "booking_node", "__end__"]]:
-    print("Routing from supervisor")
+def _supervisor_messages(state: AgentState):
+    return [{"role": "system", "content": system_prompt}] + _valid_messages(state)
+
+
+def _supervisor_failed(state: AgentState, error: Exception):
+    print("Error in supervisor_node LLM call:", error)
+    annotate(error=repr(error)[:300])
+    return Command(
+        update={
+            "messages": [
+                AIMessage(
+                    content="Oops! I'm having trouble deciding the next step. Please try rephrasing."
+                )
+            ]
+        },
+        goto="supervisor",  # You can also fallback to a default node like "information_node"
+    )
+
 
-    messages = [{"role": "system", "content": system_prompt}]
-    for msg in state["messages"]:
-        if isinstance(msg, (HumanMessage, AIMessage)):
-            messages.append(msg)
+def _supervisor_route(state: AgentState, response):
+    annotate(route=response.get("next") if isinstance(response, dict) else None)
 
     query = ""
     if len(state["messages"]) == 1:
         query = state["messages"][0].content
 
-    time.sleep(2)
-
-    try:
-        response = llm.with_structured_output(Router).invoke(messages)
-        print("SUPERVISOR RESPONSE >>>", response)
-    except Exception as e:
-        print("Error in supervisor_node LLM call:", e)
-        return Command(
-            update={
-                "messages": state["messages"]
-                + [
-                    AIMessage(
-                        content="Oops! I'm having trouble deciding the next step. Please try rephrasing."
-                    )
-                ]
-            },
-            goto="supervisor",  # You can also fallback to a default node like "information_node"
-        )
-
     # Ensure proper dict structure
     if not isinstance(response, dict) or "next" not in response:
         return Command(
             update={
-                "messages": state["messages"]
-                + [
+                "messages": [
                     AIMessage(
                         content="Sorry, I couldn't understand your request properly."
                     )
@@ -310,11 +427,38 @@ def supervisor_node(
             "next": goto,
             "query": query,
             "cur_reasoning": reasoning,
-            "messages": state["messages"],
         },
     )
 
 
+@traced("supervisor", "node")
+def supervisor_node(
+    state: AgentState,
+) -> Command[Literal["information_node", "booking_node", "__end__"]]:
+    messages = _supervisor_messages(state)
+    time.sleep(2)
+
+    try:
+        response = llm.with_structured_output(Router).invoke(messages)
+    except Exception as e:
+        return _supervisor_failed(state, e)
+    return _supervisor_route(state, response)
+
+
+@traced("supervisor", "node")
+async def asupervisor_node(
+    state: AgentState,
+) -> Command[Literal["information_node", "booking_node", "__end__"]]:
+    messages = _supervisor_messages(state)
+    await asyncio.sleep(2)
+
+    try:
+        response = await llm.with_structured_output(Router).ainvoke(messages)
+    except Exception as e:
+        return _supervisor_failed(state, e)
+    return _supervisor_route(state, response)
+
+
 def safe_invoke(func, *args, retries=3, delay=5):
     for attempt in range(retries):
         try:
@@ -325,12 +469,3 @@ def safe_invoke(func, *args, retries=3, delay=5):
             else:
                 raise
     raise RuntimeError("Too many failed retries")
-
-
-# agent state
-class AgentState(TypedDict):
-    messages: MessagesState
-    next: str
-    query: str
-    cur_reasoning: str
-    id_number: str  # Can be user ID or similar identifier
@@ -0,0 +1,235 @@
+"""FAQ retrieval for the information agent.
+
+The corpus (``faq_corpus.json``) is embedded offline into float32 matrices of
+unit vectors: ``vectors.npy`` (question + answer, for retrieval) and
+``questions.npy`` (question only, for direct answers), next to ``entries.json``.
+At runtime the matrices are memory-mapped and a query is one matrix-vector
+product plus a partial sort. Build or rebuild the index with:
+
+    python faq_index.py build --embedder google
+    python faq_index.py build --embedder hashing   # offline, deterministic
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metrics import watch_lru_cache
+
+FAQ_CORPUS = os.getenv("FAQ_CORPUS", "faq_corpus.json")
+FAQ_INDEX_DIR = os.getenv("FAQ_INDEX_DIR", "faq_index")
+# "google" reuses the Gemini embeddings client from create_agent; "hashing" needs
+# no network and is what tests and benchmarks use. Must match the built index.
+FAQ_EMBEDDER = os.getenv("FAQ_EMBEDDER", "google")
+# A query whose closest FAQ question is at least this similar (cosine) is answered
+# verbatim, without the agent. Similarity scales differ per embedder.
+DIRECT_THRESHOLDS = {"GoogleGenerativeAIEmbeddings": 0.85, "hashing": 0.75}
+FAQ_DIRECT_THRESHOLD = os.getenv("FAQ_DIRECT_THRESHOLD")
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are at be can do does for how i in is it me my of on or the there to what when where which "
+    "who why will with you your".split()
+)
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-features embedder (feature hashing, no model, no network).
+
+    Words and their character trigrams are hashed into ``dim`` buckets with a
+    stable hash, so vectors are identical across processes and machines. Good
+    enough for matching paraphrased FAQ questions; not a semantic model.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+        return digest % dim, 1.0 if digest >> 63 else -1.0
+
+    def _features(self, text: str) -> List[Tuple[str, float]]:
+        features = []
+        for word in _WORD_RE.findall(text.lower()):
+            if word in _STOPWORDS:
+                continue
+            features.append((word, 1.0))
+            padded = f"<{word}>"
+            features.extend((padded[i:i + 3], 0.3) for i in range(len(padded) - 2))
+        return features
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                bucket, sign = self._bucket(feature, self.dim)
+                vectors[row, bucket] += sign * weight
+        return vectors.tolist()
+
+
+def make_embedder(kind: Optional[str] = None):
+    kind = kind or FAQ_EMBEDDER
+    if kind == "hashing":
+        return HashingEmbedder()
+    if kind == "google":
+        from create_agent import embeddings
+        return embeddings
+    raise ValueError(f"Unknown FAQ_EMBEDDER: {kind}")
+
+
+def _embedder_name(embedder) -> str:
+    return getattr(embedder, "name", type(embedder).__name__)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def document_text(entry: Dict[str, str]) -> str:
+    return f"{entry['question']}\n{entry['answer']}"
+
+
+def _embed_all(embedder, texts: List[str], batch_size: int) -> np.ndarray:
+    chunks = [
+        np.asarray(embedder.embed_documents(texts[start:start + batch_size]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size)
+    ]
+    return _normalize(np.vstack(chunks)).astype(np.float32)
+
+
+def build_index(entries: List[Dict[str, str]], embedder, out_dir: str = FAQ_INDEX_DIR, batch_size: int = 256):
+    """Embed ``entries`` and write the index files to ``out_dir``."""
+    os.makedirs(out_dir, exist_ok=True)
+    vectors = _embed_all(embedder, [document_text(e) for e in entries], batch_size)
+    questions = _embed_all(embedder, [e["question"] for e in entries], batch_size)
+
+    # Write to temp names and rename so a running process never maps a half-written file.
+    np.save(os.path.join(out_dir, "vectors.tmp.npy"), vectors)
+    np.save(os.path.join(out_dir, "questions.tmp.npy"), questions)
+    with open(os.path.join(out_dir, "entries.tmp.json"), "w") as f:
+        json.dump({"embedder": _embedder_name(embedder), "dim": int(vectors.shape[1]), "entries": entries}, f)
+    for name in ("vectors.npy", "questions.npy", "entries.json"):
+        stem, ext = os.path.splitext(name)
+        os.replace(os.path.join(out_dir, f"{stem}.tmp{ext}"), os.path.join(out_dir, name))
+    return FAQIndex(vectors, questions, entries, embedder)
+
+
+class FAQIndex:
+    def __init__(self, vectors: np.ndarray, questions: np.ndarray, entries: List[Dict[str, str]], embedder):
+        self.vectors = vectors
+        self.questions = questions
+        self.entries = entries
+        self.embedder = embedder
+
+    @classmethod
+    def load(cls, index_dir: str, embedder) -> "FAQIndex":
+        with open(os.path.join(index_dir, "entries.json")) as f:
+            meta = json.load(f)
+        if meta["embedder"] != _embedder_name(embedder):
+            raise ValueError(
+                f"FAQ index in {index_dir} was built with {meta['embedder']!r}, "
+                f"not {_embedder_name(embedder)!r}; rebuild it with faq_index.py build"
+            )
+        vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        questions = np.load(os.path.join(index_dir, "questions.npy"), mmap_mode="r")
+        return cls(vectors, questions, meta["entries"], embedder)
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[float, Dict[str, str]]]:
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries: Sequence[str], k: int = 3, matrix: np.ndarray = None) -> List[List[Tuple[float, Dict[str, str]]]]:
+        """Top-``k`` entries by cosine similarity for each query, best first."""
+        if not queries or not len(self.entries):
+            return [[] for _ in queries]
+        matrix = self.vectors if matrix is None else matrix
+        # embed_query, not embed_documents: hosted models embed queries for retrieval.
+        q = _normalize(np.asarray([self.embedder.embed_query(text) for text in queries], dtype=np.float32))
+        scores = q @ matrix.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ranked = candidates[np.argsort(-scores[row, candidates])]
+            results.append([(float(scores[row, i]), self.entries[i]) for i in ranked])
+        return results
+
+    def direct_answer(self, query: str, threshold: float = None) -> Optional[Dict[str, Any]]:
+        if threshold is None:
+            threshold = float(FAQ_DIRECT_THRESHOLD or DIRECT_THRESHOLDS.get(_embedder_name(self.embedder), 0.85))
+        hits = self.search_many([query], k=1, matrix=self.questions)[0]
+        if hits and hits[0][0] >= threshold:
+            score, entry = hits[0]
+            return {"score": score, **entry}
+        return None
+
+
+watch_lru_cache("faq_feature_buckets", HashingEmbedder._bucket)
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_faq_index() -> Optional[FAQIndex]:
+    """The process-wide index, loaded on first use; None if it has not been built."""
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                if os.path.exists(os.path.join(FAQ_INDEX_DIR, "entries.json")):
+                    try:
+                        _index = FAQIndex.load(FAQ_INDEX_DIR, make_embedder())
+                    except ValueError as e:
+                        print("FAQ index unusable:", e)
+                else:
+                    print(f"FAQ index not found in {FAQ_INDEX_DIR}; run faq_index.py build")
+                _index_loaded = True
+    return _index
+
+
+def set_faq_index(index: Optional[FAQIndex]):
+    global _index, _index_loaded
+    _index = index
+    _index_loaded = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the FAQ retrieval index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--corpus", default=FAQ_CORPUS)
+    build.add_argument("--out", default=FAQ_INDEX_DIR)
+    build.add_argument("--embedder", default=FAQ_EMBEDDER, choices=["google", "hashing"])
+    query = sub.add_parser("query")
+    query.add_argument("text")
+    query.add_argument("-k", type=int, default=3)
+    query.add_argument("--embedder", default=FAQ_EMBEDDER, choices=["google", "hashing"])
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with open(args.corpus) as f:
+            entries = json.load(f)
+        index = build_index(entries, make_embedder(args.embedder), args.out)
+        print(f"Indexed {len(entries)} FAQ entries into {args.out} ({index.vectors.shape[1]} dims)")
+    else:
+        index = FAQIndex.load(FAQ_INDEX_DIR, make_embedder(args.embedder))
+        for score, entry in index.search(args.text, args.k):
+            print(f"{score:.3f}  {entry['question']}")
+
+
+if __name__ == "__main__":
+    main()
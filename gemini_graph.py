@@ -1,34 +1,186 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List
 from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import HumanMessage
 from create_agent import supervisor_node, information_node, booking_node 
-from typing_extensions import TypedDict 
-from langgraph.graph import START, END, StateGraph, MessagesState
+from create_agent import asupervisor_node, ainformation_node, abooking_node
+from create_agent import AgentState, route_turn
 
-class AgentState(TypedDict):
-    messages: MessagesState
-    next: str
-    query: str
-    cur_reasoning: str
-    id_number: str
+log = logging.getLogger(__name__)
 
-def build_gemini_graph():
-    builder = StateGraph(AgentState)
-    builder.add_node("supervisor", supervisor_node)
-    builder.add_node("information_node", information_node)
-    builder.add_node("booking_node", booking_node)
- 
-    builder.add_conditional_edges(
-    "supervisor",
-    lambda state: state.get("next", "__end__"),
-    {
-        "information_node": "information_node",
-        "booking_node": "booking_node",
-        "__end__": END,
-    },
+# Where /gemini-agent conversations are checkpointed between requests, keyed by thread id:
+# "sqlite" (durable, GRAPH_CHECKPOINT_DB), "memory" (per process, for tests) or "none".
+GRAPH_CHECKPOINTER = os.getenv("GRAPH_CHECKPOINTER", "sqlite")
+GRAPH_CHECKPOINT_DB = os.getenv("GRAPH_CHECKPOINT_DB", "graph_checkpoints.db")
+# Every checkpoint holds the thread's whole history, so keeping one per turn makes
+# a thread's storage grow with the square of its length. "latest" (default) keeps
+# only the newest checkpoint of each thread in the SQLite saver; "all" keeps every
+# turn's, for replaying a conversation from an earlier point.
+GRAPH_CHECKPOINT_HISTORY = os.getenv("GRAPH_CHECKPOINT_HISTORY", "latest")
+# Threads nobody has used for GRAPH_THREAD_TTL_SECONDS are deleted, checked every
+# GRAPH_THREAD_SWEEP_SECONDS. Every request without a thread_id starts a thread,
+# so without this the checkpoint store only grows.
+GRAPH_THREAD_TTL_SECONDS = float(os.getenv("GRAPH_THREAD_TTL_SECONDS", str(24 * 3600)))
+GRAPH_THREAD_SWEEP_SECONDS = float(os.getenv("GRAPH_THREAD_SWEEP_SECONDS", "600"))
+
+
+def make_checkpointer(kind=None, async_mode=True):
+    kind = kind or GRAPH_CHECKPOINTER
+    if kind == "memory":
+        return MemorySaver()
+    if kind == "sqlite":
+        # langgraph-checkpoint-sqlite (and aiosqlite for the async saver) are only
+        # needed when this backend is selected.
+        if async_mode:
+            # AsyncSqliteSaver binds to the running event loop, so call this from
+            # inside the loop that will serve the graph (e.g. a startup hook).
+            import aiosqlite
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            saver = _latest_only(AsyncSqliteSaver) if GRAPH_CHECKPOINT_HISTORY == "latest" else AsyncSqliteSaver
+            return saver(aiosqlite.connect(GRAPH_CHECKPOINT_DB))
+        import sqlite3
+        from langgraph.checkpoint.sqlite import SqliteSaver
+        saver = _latest_only(SqliteSaver) if GRAPH_CHECKPOINT_HISTORY == "latest" else SqliteSaver
+        return saver(sqlite3.connect(GRAPH_CHECKPOINT_DB, check_same_thread=False))
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown GRAPH_CHECKPOINTER: {kind}")
+
+
+# Checkpoint ids are time-ordered (uuid6), so older means smaller.
+_PRUNE_SQL = (
+    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
 )
 
-    builder.add_edge("information_node", "supervisor")
-    builder.add_edge("booking_node", "supervisor")
-    
-    builder.set_entry_point("supervisor")
-    return builder.compile()
+
+def _saved_key(saved) -> tuple:
+    configurable = saved["configurable"]
+    return str(configurable["thread_id"]), configurable["checkpoint_ns"], configurable["checkpoint_id"]
+
+
+def _latest_only(saver_class):
+    """``saver_class`` (SqliteSaver or AsyncSqliteSaver) deleting the checkpoints a new one supersedes."""
+
+    # The async saver's put runs its aput, so each class prunes in its native method.
+    class LatestCheckpointSaver(saver_class):
+        if hasattr(saver_class, "cursor"):
+            def put(self, config, checkpoint, metadata, new_versions):
+                saved = super().put(config, checkpoint, metadata, new_versions)
+                with self.cursor() as cur:
+                    for sql in _PRUNE_SQL:
+                        cur.execute(sql, _saved_key(saved))
+                return saved
+        else:
+            async def aput(self, config, checkpoint, metadata, new_versions):
+                saved = await super().aput(config, checkpoint, metadata, new_versions)
+                async with self.lock:
+                    for sql in _PRUNE_SQL:
+                        await self.conn.execute(sql, _saved_key(saved))
+                    await self.conn.commit()
+                return saved
+
+    LatestCheckpointSaver.__name__ = LatestCheckpointSaver.__qualname__ = f"Latest{saver_class.__name__}"
+    return LatestCheckpointSaver
+
+
+async def close_checkpointer(checkpointer):
+    conn = getattr(checkpointer, "conn", None)
+    if conn is None:
+        return
+    result = conn.close()
+    if asyncio.iscoroutine(result):
+        await result
+
+
+class ThreadReaper:
+    """Deletes the checkpoints of threads idle for longer than ``ttl_seconds``.
+
+    ``touch`` marks a thread used (cheap, in memory). ``sweep`` runs on the event
+    loop that owns the checkpointer: for the SQLite saver it saves the marks in a
+    ``thread_activity`` table next to the checkpoints, so idle times survive
+    restarts. Threads found without a mark (older than this, or touched by
+    another process that has not swept yet) are marked as of that sweep.
+    """
+
+    def __init__(self, checkpointer, ttl_seconds: float = GRAPH_THREAD_TTL_SECONDS):
+        self.checkpointer = checkpointer
+        self.ttl_seconds = ttl_seconds
+        self.deleted = 0
+        self._touched: Dict[str, float] = {}
+        self._last_seen: Dict[str, float] = {}
+
+    def touch(self, thread_id: str):
+        self._touched[thread_id] = time.time()
+
+    async def sweep(self) -> int:
+        touched, self._touched = self._touched, {}
+        now = time.time()
+        conn = getattr(self.checkpointer, "conn", None)
+        if conn is not None:
+            expired = await self._sweep_sqlite(conn, touched, now)
+        else:
+            self._last_seen.update(touched)
+            for thread_id in getattr(self.checkpointer, "storage", {}):
+                self._last_seen.setdefault(thread_id, now)
+            expired = [t for t, seen in self._last_seen.items() if seen < now - self.ttl_seconds]
+            for thread_id in expired:
+                del self._last_seen[thread_id]
+        for thread_id in expired:
+            await self.checkpointer.adelete_thread(thread_id)
+        self.deleted += len(expired)
+        return len(expired)
+
+    async def _sweep_sqlite(self, conn, touched: Dict[str, float], now: float) -> List[str]:
+        await self.checkpointer.setup()
+        await conn.execute("CREATE TABLE IF NOT EXISTS thread_activity "
+                           "(thread_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)")
+        await conn.executemany(
+            "INSERT INTO thread_activity (thread_id, last_seen) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET last_seen = max(last_seen, excluded.last_seen)",
+            list(touched.items()))
+        await conn.execute("INSERT OR IGNORE INTO thread_activity (thread_id, last_seen) "
+                           "SELECT DISTINCT thread_id, ? FROM checkpoints", (now,))
+        cursor = await conn.execute("SELECT thread_id FROM thread_activity WHERE last_seen < ?",
+                                    (now - self.ttl_seconds,))
+        expired = [row[0] for row in await cursor.fetchall()]
+        await conn.executemany("DELETE FROM thread_activity WHERE thread_id = ?", [(t,) for t in expired])
+        await conn.commit()
+        return expired
+
+
+async def reap_threads(reaper: ThreadReaper, interval_seconds: float = GRAPH_THREAD_SWEEP_SECONDS):
+    """Run ``reaper.sweep()`` every ``interval_seconds`` until cancelled."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            deleted = await reaper.sweep()
+            if deleted:
+                log.info("Deleted %d idle gemini-agent threads", deleted)
+        except Exception:
+            log.exception("Thread sweep failed")
+
+
+def _build(supervisor, information, booking, checkpointer=None):
+    builder = StateGraph(AgentState)
+    builder.add_node("supervisor", supervisor)
+    builder.add_node("information_node", information)
+    builder.add_node("booking_node", booking)
+
+    # Nodes route themselves with Command(goto=...); the only edge picks where a
+    # turn starts (a worker still waiting on the user's answer, else the supervisor).
+    builder.add_conditional_edges(START, route_turn, ["supervisor", "information_node", "booking_node"])
+    return builder.compile(checkpointer=checkpointer)
+
+
+def build_gemini_graph(checkpointer=None):
+    return _build(supervisor_node, information_node, booking_node, checkpointer)
+
+
+def build_async_gemini_graph(checkpointer=None):
+    # Same topology with coroutine nodes; must be driven with ainvoke/astream.
+    return _build(asupervisor_node, ainformation_node, abooking_node, checkpointer)
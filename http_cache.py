@@ -0,0 +1,140 @@
+"""Conditional GETs for read endpoints whose data changes rarely and is polled often.
+
+    providers = ResponseCache("providers", "providers", List[Provider])
+    return providers.respond(request, key, lambda manager: manager.get_all_providers())
+
+The database keeps a version per table in ``data_versions``, bumped by
+triggers on every write (see ``AppointmentAndPatientManager._create_tables``),
+so writes from any process or tool are seen. A response is serialized once
+per (version, key) and kept as bytes; its strong ETag is the version plus a
+digest of those bytes. A request whose ``If-None-Match`` matches gets a 304,
+anything else the cached bytes, so a repeat poll costs one primary-key read
+of the version and no query of the data itself. A loader may return the body
+as JSON bytes already (fast_json.py) instead of models to serialize. Bodies of
+at least GZIP_MIN_BYTES are also kept gzipped, once, for clients that accept
+it, under their own ETag.
+
+``HTTP_CACHE=off`` serves every request from the database as before.
+``HTTP_CACHE_MAX_AGE`` (seconds, default 0: revalidate every time) and
+``HTTP_CACHE_ENTRIES`` (per cache) tune it. Hits, misses and 304s are
+exported as ``cache_requests_total{cache="http_<name>"}`` (a 304 is also a
+hit or a miss).
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+import metrics
+from DB.database_connection import AppointmentAndPatientManager
+from resources import GZIP, GZIP_LEVEL, GZIP_MIN_BYTES, resources
+
+HTTP_CACHE = os.getenv("HTTP_CACHE", "on") == "on"
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+HTTP_CACHE_ENTRIES = int(os.getenv("HTTP_CACHE_ENTRIES", "256"))
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """RFC 9110 ``If-None-Match``: ``*`` or any listed tag equal to ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an ``Accept-Encoding`` header allows gzip (listed, or ``*``, without ``q=0``)."""
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            q = params.strip().lower()
+            try:
+                return not q.startswith("q=") or float(q[2:]) > 0
+            except ValueError:
+                return True
+    return False
+
+
+class _Entry:
+    __slots__ = ("version", "etag", "body", "gzipped")
+
+    def __init__(self, version: int, body: bytes):
+        self.version = version
+        self.etag = f'"{version}-{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        self.body = body
+        self.gzipped = None
+
+    @property
+    def gzip_etag(self) -> str:
+        return self.etag[:-1] + '-gzip"'
+
+
+class ResponseCache:
+    def __init__(self, name: str, table: str, response_type: Any, max_entries: int = HTTP_CACHE_ENTRIES):
+        self.name = name
+        self.table = table
+        self.max_entries = max_entries
+        self.hits = self.misses = self.not_modified = 0
+        self._adapter = TypeAdapter(response_type)
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        metrics.cache_requests.add_source(f"http_{name}", self._lookups)
+
+    def _lookups(self):
+        cache = f"http_{self.name}"
+        return [((cache, "hit"), self.hits), ((cache, "miss"), self.misses),
+                ((cache, "not_modified"), self.not_modified)]
+
+    def _headers(self, etag: str, vary: bool) -> dict:
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate"}
+        if vary:
+            headers["Vary"] = "Accept-Encoding"
+        return headers
+
+    def _body(self, load: Callable[[AppointmentAndPatientManager], Any], manager) -> bytes:
+        result = load(manager)
+        return result if isinstance(result, bytes) else self._adapter.dump_json(result)
+
+    def respond(self, request: Request, key: Hashable, load: Callable[[AppointmentAndPatientManager], Any]) -> Response:
+        """The response for ``key``: 304, the cached bytes, or ``load(manager)`` serialized and cached."""
+        manager = resources.db(AppointmentAndPatientManager)
+        if not HTTP_CACHE:
+            return Response(self._body(load, manager), media_type="application/json")
+        version = manager.data_version(self.table)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = None
+        if entry is None:
+            # Read the version before the data: a write in between leaves the
+            # entry tagged with the older version, so the next request reloads.
+            entry = _Entry(version, self._body(load, manager))
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        compressible = GZIP and len(entry.body) >= GZIP_MIN_BYTES
+        use_gzip = compressible and accepts_gzip(request.headers.get("accept-encoding"))
+        etag = entry.gzip_etag if use_gzip else entry.etag
+        if_none_match = request.headers.get("if-none-match")
+        if etag_matches(if_none_match, entry.etag) or etag_matches(if_none_match, entry.gzip_etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=self._headers(etag, compressible))
+        if not use_gzip:
+            return Response(entry.body, media_type="application/json", headers=self._headers(etag, compressible))
+        if entry.gzipped is None:
+            entry.gzipped = gzip.compress(entry.body, compresslevel=GZIP_LEVEL)
+        headers = self._headers(etag, True)
+        headers["Content-Encoding"] = "gzip"
+        return Response(entry.gzipped, media_type="application/json", headers=headers)
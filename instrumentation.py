@@ -0,0 +1,212 @@
+"""Timing spans for the agent graph: nodes, LLM calls, tools and DB queries.
+
+A span is one timed operation with a name, a kind ("node", "llm", "tool", "db"),
+its parent span, the request's correlation id and free-form attributes (token
+counts, reply sizes, routing decisions). Finished spans go to an in-process ring
+buffer, queried by ``/gemini-agent/traces``, and to the ``agent.trace`` logger,
+when it is enabled, as one JSON object per line.
+
+    TRACING=off            no spans at all (DB methods are not even wrapped)
+    TRACE_LOG=off          no span log (default; a deployment may configure the
+                           ``agent.trace`` logger itself), "stdout", or a file path
+    TRACE_BUFFER_SIZE=5000 spans kept in memory
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from token_counter import estimate_tokens
+
+TRACING = os.getenv("TRACING", "on") != "off"
+TRACE_LOG = os.getenv("TRACE_LOG", "off")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "5000"))
+
+_correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+_current_span: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_span", default=None)
+
+
+class SpanBuffer:
+    """The last ``size`` finished spans, newest last."""
+
+    def __init__(self, size: int):
+        self._spans = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]):
+        with self._lock:
+            self._spans.append(record)
+
+    def query(self, correlation_id: str = None, kind: str = None, name: str = None, limit: int = 200) -> List[Dict[str, Any]]:
+        with self._lock:
+            spans = list(self._spans)
+        picked = [
+            s for s in spans
+            if (correlation_id is None or s["correlation_id"] == correlation_id)
+            and (kind is None or s["kind"] == kind)
+            and (name is None or s["name"] == name)
+        ]
+        return picked[-limit:] if limit else picked
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Latency per span name over the buffer: count, errors, mean/p50/p95/max ms."""
+        with self._lock:
+            spans = list(self._spans)
+        grouped = defaultdict(list)
+        errors = defaultdict(int)
+        for s in spans:
+            key = f"{s['kind']}:{s['name']}"
+            grouped[key].append(s["duration_ms"])
+            errors[key] += s["status"] != "ok"
+        out = {}
+        for key, durations in sorted(grouped.items()):
+            durations.sort()
+            out[key] = {
+                "count": len(durations),
+                "errors": errors[key],
+                "mean_ms": round(sum(durations) / len(durations), 3),
+                "p50_ms": durations[len(durations) // 2],
+                "p95_ms": durations[min(len(durations) - 1, int(0.95 * len(durations)))],
+                "max_ms": durations[-1],
+            }
+        return out
+
+
+spans = SpanBuffer(TRACE_BUFFER_SIZE)
+
+trace_log = logging.getLogger("agent.trace")
+trace_log.propagate = False
+if TRACE_LOG != "off":
+    _handler = logging.StreamHandler(sys.stdout) if TRACE_LOG == "stdout" else logging.FileHandler(TRACE_LOG)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_log.addHandler(_handler)
+    trace_log.setLevel(logging.INFO)
+
+
+def start_span(name: str, kind: str, attrs: Dict[str, Any], parent: Optional[Dict[str, Any]] = None,
+           correlation_id: Optional[str] = None) -> Dict[str, Any]:
+    parent = parent if parent is not None else _current_span.get()
+    return {
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "correlation_id": correlation_id or _correlation_id.get(),
+        "name": name,
+        "kind": kind,
+        "start": time.time(),
+        "_perf": time.perf_counter(),
+        "status": "ok",
+        "attrs": attrs,
+    }
+
+
+def finish_span(record: Dict[str, Any], error: BaseException = None):
+    record["duration_ms"] = round((time.perf_counter() - record.pop("_perf")) * 1000, 3)
+    if error is not None:
+        record["status"] = "error"
+        record["attrs"]["error"] = repr(error)[:300]
+    spans.add(record)
+    if trace_log.isEnabledFor(logging.INFO):
+        trace_log.info(json.dumps(record, default=str))
+
+
+@contextmanager
+def correlation(correlation_id: str = None):
+    """Tag every span started inside the block (and its tasks and threads) with ``correlation_id``."""
+    correlation_id = correlation_id or uuid.uuid4().hex
+    token = _correlation_id.set(correlation_id)
+    try:
+        yield correlation_id
+    finally:
+        _correlation_id.reset(token)
+
+
+def current_correlation_id() -> Optional[str]:
+    return _correlation_id.get()
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attrs):
+    """Time the block as a child of the current span. Yields the mutable attrs dict."""
+    if not TRACING:
+        yield attrs
+        return
+    record = start_span(name, kind, attrs)
+    token = _current_span.set(record)
+    try:
+        yield attrs
+    except BaseException as e:
+        _current_span.reset(token)
+        finish_span(record, e)
+        raise
+    _current_span.reset(token)
+    finish_span(record)
+
+
+def annotate(**attrs):
+    """Add attributes to the innermost open span, if any."""
+    record = _current_span.get()
+    if record is not None:
+        record["attrs"].update(attrs)
+
+
+def traced(name: str = None, kind: str = "internal"):
+    """Decorator form of ``span`` for sync and async functions."""
+    def decorate(func):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def trace_methods(cls, kind: str = "db"):
+    """Wrap every public method of ``cls`` in a ``<Class>.<method>`` span of ``kind``."""
+    if not TRACING:
+        return cls
+    for attr, value in list(vars(cls).items()):
+        if not attr.startswith("_") and inspect.isfunction(value):
+            setattr(cls, attr, traced(f"{cls.__name__}.{attr}", kind)(value))
+    return cls
+
+
+def usage_from_response(response) -> Dict[str, int]:
+    """Token usage reported by the provider, from llm_output or the message metadata."""
+    usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage")
+    if usage:
+        return {
+            "prompt_tokens": usage.get("prompt_tokens", usage.get("input_tokens", 0)),
+            "completion_tokens": usage.get("completion_tokens", usage.get("output_tokens", 0)),
+        }
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return {"prompt_tokens": metadata["input_tokens"], "completion_tokens": metadata["output_tokens"]}
+    return {}
+
+
+def call_tokens(response, prompt_estimate: int) -> Dict[str, Any]:
+    """Prompt/completion tokens of one LLM call: reported usage, else local estimates."""
+    usage = usage_from_response(response)
+    if usage:
+        return {**usage, "estimated": False}
+    text = "".join(g.text for gens in response.generations for g in gens)
+    return {"prompt_tokens": prompt_estimate, "completion_tokens": estimate_tokens(text), "estimated": True}
@@ -0,0 +1,76 @@
+"""First-use construction for expensive process-wide objects (compiled graphs, LLM clients).
+
+    graph = Lazy("graph", build_graph)   # nothing imported or built yet
+    graph.get()                          # built once on first use, thread-safe
+    warm_up()                            # build the ones named in WARM_UP now
+
+``WARM_UP`` lists what a server builds at startup instead of on its first
+request: ``none`` (default), ``all``, or comma-separated names. Each build is
+timed and logged at INFO, and ``build_times()`` returns the timings.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+log = logging.getLogger(__name__)
+
+WARM_UP = os.getenv("WARM_UP", "none")
+
+_registry: Dict[str, "Lazy"] = {}
+
+
+class Lazy:
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self.build_seconds: Optional[float] = None
+        self._value = None
+        self._built = False
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+    def get(self) -> Any:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    started = time.perf_counter()
+                    self._value = self.factory()
+                    self.build_seconds = time.perf_counter() - started
+                    self._built = True
+                    log.info("Built %s in %.0f ms", self.name, self.build_seconds * 1000)
+        return self._value
+
+    def peek(self) -> Any:
+        """The value if it has been built, else None; never builds."""
+        return self._value if self._built else None
+
+    def set(self, value: Any):
+        """Replace the value (tests and benchmarks swap in their own graphs)."""
+        with self._lock:
+            self._value, self._built = value, True
+
+
+def warm_up(names: Iterable[str] = None) -> Dict[str, float]:
+    """Build the named objects (default: those in WARM_UP) and return their build seconds."""
+    if names is None:
+        if WARM_UP == "none":
+            return {}
+        names = _registry if WARM_UP == "all" else [n.strip() for n in WARM_UP.split(",") if n.strip()]
+    timings = {}
+    for name in names:
+        if name not in _registry:
+            log.warning("WARM_UP: nothing registered as %r", name)
+            continue
+        _registry[name].get()
+        timings[name] = _registry[name].build_seconds
+    return timings
+
+
+def build_times() -> Dict[str, Optional[float]]:
+    return {name: lazy.build_seconds for name, lazy in _registry.items()}
@@ -0,0 +1,167 @@
+"""LangChain callback handlers feeding the turn counter, trace spans, /metrics and the token ledger.
+
+Kept apart from ``instrumentation``, ``metrics``, ``token_budget`` and
+``agent_metrics`` so those stay free of LangChain imports, and the REST-only
+routes of the apps start without loading it.
+"""
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import metrics
+import token_budget
+from agent_metrics import GRAPH_NODES
+from instrumentation import TRACING, call_tokens, finish_span, start_span, usage_from_response
+from token_counter import estimate_messages_tokens, estimate_tokens
+
+
+class TurnCounter(BaseCallbackHandler):
+    """Counts model calls and agent-graph node runs for one /gemini-agent turn.
+
+    Pass it in the graph config's ``callbacks``; nested agent runs inherit it.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.hops = Counter()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.llm_calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.llm_calls += 1
+
+    def on_chain_start(self, serialized, inputs, *, metadata=None, **kwargs):
+        name = kwargs.get("name")
+        if name in GRAPH_NODES and (metadata or {}).get("langgraph_node") == name:
+            self.hops[name] += 1
+
+
+class SpanCallbackHandler(BaseCallbackHandler):
+    """Records LLM and tool runs as spans under whichever span is current.
+
+    Pass it in a LangChain/LangGraph config's ``callbacks``; nested agent runs
+    inherit it. Token counts come from the provider's usage report when there is
+    one, otherwise from ``token_counter`` estimates (``tokens_estimated``).
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._open: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _open_span(self, run_id, name: str, kind: str, attrs: Dict[str, Any]):
+        if not TRACING:
+            return
+        record = start_span(name, kind, attrs)
+        with self._lock:
+            self._open[run_id] = record
+
+    def _close_span(self, run_id, error: BaseException = None, **attrs):
+        with self._lock:
+            record = self._open.pop(run_id, None)
+        if record is not None:
+            record["attrs"].update(attrs)
+            finish_span(record, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._open_span(run_id, (serialized or {}).get("name") or kwargs.get("name") or "chat_model", "llm", {
+            "node": (metadata or {}).get("langgraph_node"),
+            "prompt_tokens": estimate_messages_tokens(messages[0]) if messages else 0,
+            "tokens_estimated": True,
+        })
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._open_span(run_id, (serialized or {}).get("name") or kwargs.get("name") or "llm", "llm", {
+            "node": (metadata or {}).get("langgraph_node"),
+            "prompt_tokens": sum(estimate_tokens(p) for p in prompts),
+            "tokens_estimated": True,
+        })
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = usage_from_response(response)
+        if not usage:
+            text = "".join(g.text for gens in response.generations for g in gens)
+            usage = {"completion_tokens": estimate_tokens(text)}
+        else:
+            usage["tokens_estimated"] = False
+        self._close_span(run_id, **usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._close_span(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, metadata=None, **kwargs):
+        self._open_span(run_id, (serialized or {}).get("name") or kwargs.get("name") or "tool", "tool", {
+            "node": (metadata or {}).get("langgraph_node"),
+            "input_chars": len(input_str or ""),
+        })
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        content = getattr(output, "content", output)
+        self._close_span(run_id, output_chars=len(content) if isinstance(content, str) else None)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._close_span(run_id, error)
+
+
+span_callbacks = SpanCallbackHandler()
+
+
+class ModelCallbacks(BaseCallbackHandler):
+    """Latency, outcome and tokens of every call of one model, for /metrics and the token ledger.
+
+    Attached to the model itself by ``llm_provider.chat_model``, so bound and
+    structured-output copies report too. The ledger's agent is ``site`` or
+    ``site:<supervisor graph node>``.
+    """
+
+    run_inline = True
+
+    def __init__(self, site: str, ledger: token_budget.TokenLedger = None):
+        self.site = site
+        self.ledger = ledger or token_budget.ledger
+        self._pending: Dict[Any, Tuple[float, str, int]] = {}
+
+    def _agent(self, metadata) -> str:
+        # Calls inside a nested agent run report the inner node ("agent"); the
+        # checkpoint namespace starts with the supervisor graph's node instead.
+        metadata = metadata or {}
+        namespace = metadata.get("langgraph_checkpoint_ns") or ""
+        node = namespace.split("|")[0].split(":")[0] or metadata.get("langgraph_node")
+        return f"{self.site}:{node}" if node else self.site
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        prompt_estimate = estimate_messages_tokens(messages[0]) if messages else 0
+        self._pending[run_id] = (time.perf_counter(), self._agent(metadata), prompt_estimate)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._pending[run_id] = (time.perf_counter(), self._agent(metadata), sum(estimate_tokens(p) for p in prompts))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        pending = self._pending.pop(run_id, None)
+        if pending is None:
+            return
+        started, agent, prompt_estimate = pending
+        usage = call_tokens(response, prompt_estimate)
+        prompt, completion = usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+        metrics.observe_llm_call(self.site, started, "ok", prompt, completion)
+        self.ledger.record(agent, prompt, completion, usage["estimated"])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        pending = self._pending.pop(run_id, None)
+        if pending is not None:
+            metrics.observe_llm_call(self.site, pending[0], "error")
+
+
+def attach_model_callbacks(site: str, model):
+    """Report every call of ``model`` under call site ``site``."""
+    if not hasattr(model, "callbacks"):
+        return model
+    model.callbacks = [*(model.callbacks or []), ModelCallbacks(site)]
+    return model
@@ -0,0 +1,168 @@
+import asyncio
+import contextvars
+import os
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# Upper bound on LLM calls awaiting a response at the same time in this process.
+# Requests beyond the limit queue for a slot instead of piling onto the provider
+# and tripping its rate limits. llm_provider.chat_model takes a slot around every
+# call of the models it builds, sync or async, so an agent loop holds one only
+# while a model call of it is in flight, not for its tool calls.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+
+_in_flight = 0
+_peak_in_flight = 0
+_stats_lock = threading.Lock()
+# Set while a model call runs under a slot: a model whose generate calls its own
+# stream (streaming=True), or whose async generate runs the sync one in an
+# executor, makes the inner call under the outer slot instead of waiting on itself.
+_holding = contextvars.ContextVar("llm_slot_held", default=False)
+
+
+class _Slots:
+    """Counting semaphore shared by threads and event loops.
+
+    Threads block in ``acquire``, coroutines await ``aacquire``; a released slot
+    is handed to the longest waiter, whichever kind it is.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._lock = threading.Lock()
+        # Callables handing a slot to one waiter; False if the waiter is gone.
+        self._waiters = deque()
+
+    def _free(self) -> bool:
+        return self.in_use < self.limit and not self._waiters
+
+    def acquire(self):
+        with self._lock:
+            if self._free():
+                self.in_use += 1
+                return
+            granted = threading.Event()
+            self._waiters.append(lambda: granted.set() or True)
+        granted.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free():
+                self.in_use += 1
+                return
+            future = loop.create_future()
+
+            def grant() -> bool:
+                try:
+                    loop.call_soon_threadsafe(self._granted, future)
+                except RuntimeError:  # the waiter's loop is closed
+                    return False
+                return True
+
+            self._waiters.append(grant)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(grant)
+                    return_slot = False
+                except ValueError:
+                    # Already granted; a cancelled future is passed on by _granted.
+                    return_slot = future.done() and not future.cancelled()
+            if return_slot:
+                self.release()
+            raise
+
+    def _granted(self, future: asyncio.Future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                if self._waiters.popleft()():
+                    return
+            self.in_use -= 1
+
+
+_slots = _Slots(LLM_MAX_CONCURRENCY)
+
+
+def set_llm_concurrency(limit: int):
+    """Change the in-flight limit; calls already holding or waiting for a slot keep the old one."""
+    global LLM_MAX_CONCURRENCY, _slots
+    LLM_MAX_CONCURRENCY = limit
+    _slots = _Slots(limit)
+
+
+def _enter():
+    global _in_flight, _peak_in_flight
+    with _stats_lock:
+        _in_flight += 1
+        _peak_in_flight = max(_peak_in_flight, _in_flight)
+
+
+def _exit():
+    global _in_flight
+    with _stats_lock:
+        _in_flight -= 1
+
+
+@contextmanager
+def llm_slot():
+    """Hold one of the in-flight LLM slots, blocking the thread until one is free."""
+    if _holding.get():
+        yield
+        return
+    slots = _slots
+    slots.acquire()
+    _enter()
+    try:
+        yield
+    finally:
+        _exit()
+        slots.release()
+
+
+@asynccontextmanager
+async def allm_slot():
+    """Hold one of the in-flight LLM slots, awaiting one without blocking the loop."""
+    if _holding.get():
+        yield
+        return
+    slots = _slots
+    await slots.aacquire()
+    _enter()
+    try:
+        yield
+    finally:
+        _exit()
+        slots.release()
+
+
+@contextmanager
+def holding_slot():
+    """Mark the model call made inside the block as running under a slot already held.
+
+    Wrap only the call itself: tasks started elsewhere while the flag is set
+    would inherit it and skip the limit.
+    """
+    token = _holding.set(True)
+    try:
+        yield
+    finally:
+        _holding.reset(token)
+
+
+def llm_concurrency_stats() -> dict:
+    return {
+        "limit": LLM_MAX_CONCURRENCY,
+        "in_flight": _in_flight,
+        "peak_in_flight": _peak_in_flight,
+    }
@@ -0,0 +1,348 @@
+"""Chat model / embeddings selection, so the conversational stack can run offline.
+
+``LLM_PROVIDER`` picks what ``chat_model(name, build_live)`` returns:
+
+* ``live``   - the real client built by ``build_live`` (default).
+* ``fake``   - ``ScriptedChatModel``: canned replies from a queue, a responder
+  registered with ``register_fake_responder(name, fn)``, a ``FAKE_LLM_SCRIPT``
+  rules file, or ``FAKE_LLM_REPLY``.
+* ``record`` - the real client, with every request/response pair and its latency
+  appended to ``LLM_CASSETTE_DIR/<name>.jsonl``.
+* ``replay`` - answers from those cassettes, no network. ``LLM_REPLAY_LATENCY`` is
+  empty (answer immediately), ``recorded`` (sleep the recorded time) or seconds.
+  ``LLM_REPLAY_MATCH=sequence`` ignores request contents and replays in recorded
+  order, for prompts that embed the wall clock.
+
+``name`` identifies the call site ("gemini", "medicall", "assistant") and keys the
+cassette file and the fake responder.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict, messages_from_dict, messages_to_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from llm_callbacks import attach_model_callbacks
+from llm_limits import allm_slot, holding_slot, llm_slot
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "live")
+LLM_CASSETTE_DIR = os.getenv("LLM_CASSETTE_DIR", "cassettes")
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "")
+LLM_REPLAY_MATCH = os.getenv("LLM_REPLAY_MATCH", "exact")
+FAKE_LLM_SCRIPT = os.getenv("FAKE_LLM_SCRIPT")
+FAKE_LLM_REPLY = os.getenv("FAKE_LLM_REPLY", "OK")
+
+_fake_responders: Dict[str, Callable[[List[BaseMessage]], Any]] = {}
+_cassette_lock = threading.Lock()
+
+
+class CassetteMiss(LookupError):
+    """Replay mode got a request that was never recorded."""
+
+
+def register_fake_responder(name: str, responder: Callable[[List[BaseMessage]], Any]):
+    """Reply function for fake models named ``name``: messages -> str or AIMessage."""
+    _fake_responders[name] = responder
+
+
+def _script_rules():
+    if not FAKE_LLM_SCRIPT:
+        return []
+    with open(FAKE_LLM_SCRIPT) as f:
+        return [(re.compile(rule["pattern"], re.S), rule["reply"]) for rule in json.load(f)]
+
+
+def _message_text(message) -> str:
+    content = message.content
+    return content if isinstance(content, str) else json.dumps(content)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic chat model for tests, benchmarks and offline runs.
+
+    Each call answers with, in order of preference: the next queued entry of
+    ``responses``, ``responder(messages)``, the responder registered for ``name``,
+    the first ``FAKE_LLM_SCRIPT`` rule whose pattern matches the last message, or
+    ``FAKE_LLM_REPLY``. ``latency`` seconds are slept per call; ``calls`` counts them.
+    """
+
+    responses: List[Any] = []
+    responder: Optional[Callable[[List[BaseMessage]], Any]] = None
+    latency: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        self.calls += 1
+        if self.responses:
+            reply = self.responses.pop(0)
+        elif self.responder is not None:
+            reply = self.responder(messages)
+        elif self.name in _fake_responders:
+            reply = _fake_responders[self.name](messages)
+        else:
+            last = _message_text(messages[-1]) if messages else ""
+            reply = next((r for pattern, r in _script_rules() if pattern.search(last)), FAKE_LLM_REPLY)
+        return reply if isinstance(reply, AIMessage) else AIMessage(content=str(reply))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def bind_tools(self, tools, **kwargs):
+        # Replies are scripted; a responder that wants tool calls returns them itself.
+        return self
+
+    def with_structured_output(self, schema, **kwargs):
+        return self | RunnableLambda(lambda message: json.loads(message.content))
+
+
+def _tool_names(tools) -> List[str]:
+    return sorted(convert_to_openai_tool(t)["function"]["name"] for t in tools)
+
+
+class _CassetteModel(BaseChatModel):
+    """Shared request keying for the record and replay models."""
+
+    cassette: str
+    # Tool binding is part of the request: the same messages with different tools
+    # bound are different calls.
+    bound: Dict[str, Any] = {}
+
+    def request_key(self, messages: List[BaseMessage]) -> str:
+        # Only what the model sees: ids, tool-call ids and metadata differ between runs.
+        request = [
+            {
+                "type": m.type,
+                "content": m.content,
+                "name": getattr(m, "name", None),
+                "tool_calls": [[c["name"], c["args"]] for c in getattr(m, "tool_calls", None) or []],
+            }
+            for m in messages
+        ]
+        payload = json.dumps({"messages": request, "bound": self.bound}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _bound(self, tools, kwargs) -> Dict[str, Any]:
+        return {"tools": _tool_names(tools), **{k: v for k, v in kwargs.items() if k == "tool_choice"}}
+
+
+class RecordingChatModel(_CassetteModel):
+    """Calls the live model and appends each request/response pair to ``cassette``."""
+
+    inner: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-recorder"
+
+    def _record(self, messages, response: AIMessage, elapsed: float) -> ChatResult:
+        entry = {
+            "key": self.request_key(messages),
+            "bound": self.bound,
+            "request": messages_to_dict(messages),
+            "response": message_to_dict(response),
+            "elapsed": round(elapsed, 4),
+        }
+        os.makedirs(os.path.dirname(self.cassette) or ".", exist_ok=True)
+        with _cassette_lock, open(self.cassette, "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.perf_counter()
+        response = self.inner.invoke(messages, stop=stop, **kwargs)
+        return self._record(messages, response, time.perf_counter() - started)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.perf_counter()
+        response = await self.inner.ainvoke(messages, stop=stop, **kwargs)
+        return self._record(messages, response, time.perf_counter() - started)
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"inner": self.inner.bind_tools(tools, **kwargs), "bound": self._bound(tools, kwargs)})
+
+
+class ReplayChatModel(_CassetteModel):
+    """Answers from a recorded cassette. Identical requests replay in recorded order."""
+
+    latency: str = ""
+    match: str = "exact"
+
+    # Loaded cassette plus replay position, shared with copies made by bind_tools.
+    _tape: Optional[Dict[str, Any]] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-replay"
+
+    def _load(self) -> Dict[str, Any]:
+        if self._tape is None:
+            order, by_key = [], {}
+            if os.path.exists(self.cassette):
+                with open(self.cassette) as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            order.append(entry)
+                            by_key.setdefault(entry["key"], []).append(entry)
+            self._tape = {"order": order, "by_key": by_key, "served": {}, "cursor": 0, "lock": threading.Lock()}
+        return self._tape
+
+    def _lookup(self, messages):
+        tape = self._load()
+        with tape["lock"]:
+            if self.match == "sequence":
+                entry = tape["order"][tape["cursor"]] if tape["cursor"] < len(tape["order"]) else None
+                tape["cursor"] += 1
+            else:
+                key = self.request_key(messages)
+                recorded = tape["by_key"].get(key)
+                index = tape["served"].get(key, 0)
+                tape["served"][key] = index + 1
+                entry = recorded[min(index, len(recorded) - 1)] if recorded else None
+        if entry is None:
+            raise CassetteMiss(
+                f"No recorded response in {self.cassette} for this {self.name} request; "
+                f"record it with LLM_PROVIDER=record"
+            )
+        message = messages_from_dict([entry["response"]])[0]
+        return message, self._delay(entry)
+
+    def _delay(self, entry) -> float:
+        if not self.latency:
+            return 0.0
+        if self.latency == "recorded":
+            return entry["elapsed"]
+        return float(self.latency)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message, delay = self._lookup(messages)
+        if delay:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message, delay = self._lookup(messages)
+        if delay:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools, **kwargs):
+        replay = self.model_copy(update={"bound": self._bound(tools, kwargs)})
+        replay._tape = self._load()
+        return replay
+
+
+def cassette_path(name: str) -> str:
+    return os.path.join(LLM_CASSETTE_DIR, f"{name}.jsonl")
+
+
+def chat_model(name: str, build_live: Callable[[], Any]):
+    """The chat model for call site ``name`` under the configured LLM_PROVIDER.
+
+    Its calls are reported to /metrics and charged to the token ledger under
+    ``name``, and each call holds an ``llm_limits`` slot.
+    """
+    return attach_model_callbacks(name, limit_concurrency(_build_chat_model(name, build_live)))
+
+
+@functools.lru_cache(maxsize=None)
+def _limited_class(cls):
+    # Only override the stream methods where the model streams; BaseChatModel
+    # checks for an override to decide whether streaming may fall back to invoke.
+    streams = cls._astream is not BaseChatModel._astream or cls._stream is not BaseChatModel._stream
+
+    class Limited(cls):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            with llm_slot(), holding_slot():
+                return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            async with allm_slot():
+                with holding_slot():
+                    return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        if streams:
+            # The slot is held for the whole stream, but the flag only while the
+            # model produces a chunk, not while the caller handles it.
+            def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+                with llm_slot():
+                    chunks = super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+                    try:
+                        while True:
+                            with holding_slot():
+                                chunk = next(chunks, None)
+                            if chunk is None:
+                                return
+                            yield chunk
+                    finally:
+                        chunks.close()
+
+            async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+                async with allm_slot():
+                    chunks = super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+                    try:
+                        while True:
+                            with holding_slot():
+                                chunk = await anext(chunks, None)
+                            if chunk is None:
+                                return
+                            yield chunk
+                    finally:
+                        await chunks.aclose()
+
+    Limited.__name__ = Limited.__qualname__ = f"Limited{cls.__name__}"
+    return Limited
+
+
+def limit_concurrency(model):
+    """Make every call of ``model`` hold an ``llm_limits`` slot while it waits on the provider.
+
+    The model's class is swapped for a subclass rather than wrapping it, so
+    bound, structured-output and agent copies share the limit and callers
+    still see (and can configure) the model they built.
+    """
+    if isinstance(model, BaseChatModel):
+        model.__class__ = _limited_class(type(model))
+    return model
+
+
+def _build_chat_model(name: str, build_live: Callable[[], Any]):
+    if LLM_PROVIDER == "live":
+        return build_live()
+    if LLM_PROVIDER == "fake":
+        return ScriptedChatModel(name=name)
+    if LLM_PROVIDER == "record":
+        return RecordingChatModel(name=name, inner=build_live(), cassette=cassette_path(name))
+    if LLM_PROVIDER == "replay":
+        return ReplayChatModel(name=name, cassette=cassette_path(name), latency=LLM_REPLAY_LATENCY,
+                               match=LLM_REPLAY_MATCH)
+    raise ValueError(f"Unknown LLM_PROVIDER: {LLM_PROVIDER}")
+
+
+def embeddings_model(build_live: Callable[[], Any]):
+    """Live embeddings when calling real models, the deterministic hashing embedder otherwise."""
+    if LLM_PROVIDER in ("live", "record"):
+        return build_live()
+    from faq_index import HashingEmbedder
+    return HashingEmbedder()
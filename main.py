@@ -1,21 +1,59 @@
-from fastapi import FastAPI, HTTPException, status
+import uuid
+from fastapi import APIRouter, HTTPException, Request, Response, status
 
 from DB.database_connection import AppointmentAndPatientManager
-from graph_logic import build_graph
-from schedule_appointment import build_appointment_graph
-from cancel_appointment import build_cancel_appointment_graph
-from gemini_graph import build_gemini_graph
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_core.messages import BaseMessage
+import fast_json
+from agent_metrics import TurnStats, tool_timings
+from http_cache import ResponseCache
+from instrumentation import correlation, spans
+from resources import resources
+import token_budget
 from pydantic import parse_obj_as, BaseModel
 from typing import List, Optional, Literal
 from models import Patient, PatientVerificationByPhone, CancelAppointmentReq, PatientVerificationBySsn, Appointment, UpdateAppointment, Provider
 
-app = FastAPI()
-graph = build_graph()
-schedule_graph = build_appointment_graph()
-cancel_schedule_graph = build_cancel_appointment_graph()
-gemini_graph = build_gemini_graph()
+router = APIRouter()
+
+
+# LangGraph/LangChain and the LLM clients are imported and the graphs compiled on
+# first use (or at startup, see WARM_UP in lazy.py), so the REST routes start
+# and serve without them.
+def _build_graph():
+    from graph_logic import build_graph
+    return build_graph()
+
+
+def _build_schedule_graph():
+    from schedule_appointment import build_appointment_graph
+    return build_appointment_graph()
+
+
+def _build_cancel_schedule_graph():
+    from cancel_appointment import build_cancel_appointment_graph
+    return build_cancel_appointment_graph()
+
+
+def _build_gemini_graph():
+    # Must run on the event loop: the async SQLite checkpointer binds to it, and
+    # idle threads are swept by a task on the same loop.
+    import asyncio
+    from gemini_graph import ThreadReaper, build_async_gemini_graph, make_checkpointer, reap_threads
+    checkpointer = make_checkpointer()
+    if checkpointer is not None:
+        gemini_threads["reaper"] = reaper = ThreadReaper(checkpointer)
+        gemini_threads["sweeper"] = asyncio.get_running_loop().create_task(reap_threads(reaper))
+    return build_async_gemini_graph(checkpointer=checkpointer)
+
+
+# The gemini graph's ThreadReaper and its sweep task, once the graph is built.
+gemini_threads = {}
+
+
+graph = resources.lazy("graph", _build_graph)
+schedule_graph = resources.lazy("schedule_graph", _build_schedule_graph)
+cancel_schedule_graph = resources.lazy("cancel_schedule_graph", _build_cancel_schedule_graph)
+gemini_graph = resources.lazy("gemini_graph", _build_gemini_graph)
+gemini_turn_stats = TurnStats()
 # Doing in-memory storage
 patients_db: List[Patient] = []
 patients: []
@@ -34,6 +72,7 @@ class Req(BaseModel):
 class Req(BaseModel):
     input_text: str
     messages: Optional[List[dict]] = None
+    thread_id: Optional[str] = None
 
 
 class ScheduleReq(BaseModel):
@@ -58,113 +97,122 @@ class CancelScheduleReq(BaseModel):
     emailId: str
 
 
-@app.post("/process-input")
+@router.post("/process-input")
 def process(req: Req):
     initial_state = {"input_text": req.input_text}
-    final_state = graph.invoke(initial_state)
+    final_state = graph.get().invoke(initial_state)
     return {"result": final_state["output"]}
 
 
-@app.post("/ScheduleAppointment")
+@router.post("/ScheduleAppointment")
 def ScheduleAppointment(req: ScheduleReq):
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     return manager.schedule_appointment(req.patient_id, req.provider_id, req.date, req.time)
 
-@app.post("/ScheduleAppointmentWithDetails")
+@router.post("/ScheduleAppointmentWithDetails")
 def ScheduleAppointmentWithDetails(req: ScheduleAppointmentRequestWithDetails):
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     return manager.schedule_appointment_with_detail(req)
 
-@app.post("/CancelAppointmentById")
+@router.post("/CancelAppointmentById")
 def CancelAppointment(req: int):
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     return manager.cancel_appointment_by_id(req)
 
-@app.post("/CancelAppointment")
+@router.post("/CancelAppointment")
 def CancelAppointment(req: CancelAppointmentReq):
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     return manager.cancel_appointment(req)
 
-@app.post("/RescheduleAppointment")
+@router.post("/RescheduleAppointment")
 def RescheduleAppointment(req: UpdateAppointment):
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     return manager.reschedule_appointment(req.provider_name, req.patient_first_name, req.patient_last_name, req.new_appointment_date, req.new_appointment_time)
 
-@app.post("/patients/", response_model=Patient, status_code=status.HTTP_201_CREATED)
+@router.post("/patients/", response_model=Patient, status_code=status.HTTP_201_CREATED)
 async def register_patient(patient: Patient):
     """
     Registers a new patient.
     """
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     manager.add_patient(patient.first_name, patient.last_name, patient.gender, patient.date_of_birth,
                         patient.email, patient.phone_number, patient.address)
     return patient
 
-@app.get("/patients/", response_model=List[Patient])
+@router.get("/patients/", response_model=List[Patient])
 async def get_all_patients():
     """
     Retrieves a list of all registered patients.
     """
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
+    if fast_json.FAST_JSON:
+        return Response(manager.get_all_patients_json(), media_type="application/json")
     return manager.get_all_patients()
 
-@app.get("/providers/", response_model=List[Provider])
-async def get_all_providers():
+# Provider reads are polled by the UI and integrations; they are served from
+# serialized bytes per data version, with ETags for conditional GETs.
+provider_list_cache = ResponseCache("providers", "providers", List[Provider])
+provider_cache = ResponseCache("provider", "providers", Provider)
+
+
+@router.get("/providers/", response_model=List[Provider])
+async def get_all_providers(request: Request):
     """
     Retrieves a list of all registered patients.
     """
-    manager = AppointmentAndPatientManager()
-    return manager.get_all_providers()
+    return provider_list_cache.respond(request, "all", lambda manager: (
+        manager.get_all_providers_json() if fast_json.FAST_JSON else manager.get_all_providers()))
 
-@app.get("/providers/{provider_id}", response_model=Provider)
-async def get_provider_by_id(provider_id: str):
+@router.get("/providers/{provider_id}", response_model=Provider)
+async def get_provider_by_id(provider_id: str, request: Request):
     """
     Retrieves a single patient by its ID.
     """
-    manager = AppointmentAndPatientManager()
-    provider = manager.get_provider_by_id(provider_id)
-    if provider is not None:
+    def load(manager):
+        provider = manager.get_provider_by_id(provider_id)
+        if provider is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Provider not found")
         return provider
-    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Provider not found")
+    return provider_cache.respond(request, provider_id, load)
 
-@app.get("/GetProvidersByLocation/", response_model=List[Provider])
-async def get_providers_by_location(location: str):
+@router.get("/GetProvidersByLocation/", response_model=List[Provider])
+async def get_providers_by_location(location: str, request: Request):
     """
     Retrieves a list of providers by location.
     """
-    manager = AppointmentAndPatientManager()
-    return manager.get_providers_by_location(location)
+    return provider_list_cache.respond(request, ("location", location),
+                                       lambda manager: manager.get_providers_by_location(location))
 
-@app.get("/GetProvidersBySpeciality/", response_model=List[Provider])
-async def get_all_providers_by_speciality(speciality: str):
+@router.get("/GetProvidersBySpeciality/", response_model=List[Provider])
+async def get_all_providers_by_speciality(speciality: str, request: Request):
     """
     Retrieves a list of all providers by speciality.
     """
-    manager = AppointmentAndPatientManager()
-    return manager.get_providers_by_speciality(speciality)
+    return provider_list_cache.respond(request, ("speciality", speciality),
+                                       lambda manager: manager.get_providers_by_speciality(speciality))
 
 
-@app.get("/appointments/", response_model=List[Appointment])
+@router.get("/appointments/", response_model=List[Appointment])
 async def get_appointments_by_patient_name(patient_first_name, patient_last_name):
     """
     Retrieves a list of all registered patients.
     """
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     return manager.get_appointments_by_patient_Name(patient_first_name, patient_last_name)
 
-@app.get("/patients/{patient_id}", response_model=Patient)
+@router.get("/patients/{patient_id}", response_model=Patient)
 async def get_patient_by_id(patient_id: str):
     """
     Retrieves a single patient by its ID.
     """
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     patient = manager.get_patient_by_id(patient_id)
     if patient is not None:
         return patient
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Patient not found")
 
 
-@app.get("/patients/{patient_id}", response_model=Patient)
+@router.get("/patients/{patient_id}", response_model=Patient)
 async def get_patient_by_id(patient_id: str):
     """
     Retrieves a single patient by its ID.
@@ -174,12 +222,12 @@ async def get_patient_by_id(patient_id: str):
             return patient
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Patient not found")
 
-@app.post("/verify_patient_by_phone_and_dob")
+@router.post("/verify_patient_by_phone_and_dob")
 async def verify_patient_by_phone_and_dob(patient_data: PatientVerificationByPhone):
     """
     Verify patient details.
     """
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     patient = manager.verify_patient_by_phone_and_dob(patient_data)
     if patient is not None:
         return patient
@@ -190,7 +238,7 @@ async def verify_patient_by_phone_and_dob(patient_data: PatientVerificationByPho
     )
 
 """
-@app.post("/verify_patient_by_ssn")
+@router.post("/verify_patient_by_ssn")
 async def verify_patient_by_ssn(patient_data: PatientVerificationBySsn):
     for patient in patients_db:
         if (patient_data.first_name == patient.first_name and
@@ -204,11 +252,36 @@ async def verify_patient_by_ssn(patient_data: PatientVerificationBySsn):
     )
 """
 
-@app.post("/gemini-agent")
-def run_gemini_agent(req: Req):
+@resources.on_shutdown
+async def close_gemini_checkpointer():
+    sweeper = gemini_threads.pop("sweeper", None)
+    if sweeper is not None:
+        sweeper.cancel()
+    compiled = gemini_graph.peek()
+    if compiled is not None:
+        from gemini_graph import close_checkpointer
+        await close_checkpointer(compiled.checkpointer)
+
+
+@router.post("/gemini-agent")
+async def run_gemini_agent(req: Req):
+    # The conversation is checkpointed server-side under a thread id, so clients only
+    # send the new input_text. A request without thread_id starts a new thread; its
+    # optional ``messages`` transcript (the old protocol) seeds that thread.
+    from langchain_core.messages import HumanMessage, AIMessage
+    from llm_callbacks import TurnCounter, span_callbacks
+
+    agent_graph = gemini_graph.get()
+    thread_id = req.thread_id or str(uuid.uuid4())
+    counter = TurnCounter()
+    config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 5, "callbacks": [counter, span_callbacks]}
+    resuming = bool(req.thread_id and agent_graph.checkpointer)
+    if "reaper" in gemini_threads:
+        gemini_threads["reaper"].touch(thread_id)
+
+    # The graph appends to the checkpointed history itself, so only new messages go in.
     messages = []
-
-    if req.messages:
+    if not resuming and req.messages:
         parsed_messages = parse_obj_as(List[ChatMessage], req.messages)
         for m in parsed_messages:
             role = m.role
@@ -227,7 +300,8 @@ def run_gemini_agent(req: Req):
             "Cannot append another user message; the last message is already from the user."
         )
     # Always append the latest input_text as a new user message
-    messages.append(HumanMessage(content=req.input_text))
+    turn_id = str(uuid.uuid4())
+    messages.append(HumanMessage(content=req.input_text, id=turn_id))
 
     # Validate last message is from user
     if not isinstance(messages[-1], HumanMessage):
@@ -240,16 +314,57 @@ def run_gemini_agent(req: Req):
         "cur_reasoning": "",
         "id_number": "U001",
     }
-    final_state = gemini_graph.invoke(initial_state, config={"recursion_limit": 5})
-    
-        # Only re-invoke if last message is from Human
-    if (final_state.get("next") and final_state["next"] != "__end__" and isinstance(final_state["messages"][-1], HumanMessage)):
-        final_state = gemini_graph.invoke(final_state, config={"recursion_limit": 5})
-
+    refusal = token_budget.ledger.refusal(thread_id)
+    if refusal:
+        turn = [messages[-1], AIMessage(content=refusal)]
+        return {
+            "thread_id": thread_id,
+            "correlation_id": turn_id,
+            "messages": [{"role": m.type, "content": m.content} for m in (turn if req.thread_id else messages + turn[1:])],
+            "reasoning": "",
+            "llm_calls": 0,
+            "hops": {},
+            "budget_exceeded": True,
+        }
+
+    # Persist once per request rather than after every hop. Spans of this turn share its id.
+    with correlation(turn_id), token_budget.usage_scope(thread_id, "/gemini-agent"):
+        final_state = await agent_graph.ainvoke(initial_state, config=config, durability="exit")
+    gemini_turn_stats.record(counter)
+
+    # Thread clients already hold the earlier turns; old-protocol clients get the transcript.
+    history = final_state["messages"]
+    turn_start = next(i for i in range(len(history) - 1, -1, -1) if history[i].id == turn_id)
+    returned = history[turn_start:] if req.thread_id else history
     return {
+        "thread_id": thread_id,
+        "correlation_id": turn_id,
         "messages": [
             {"role": m.type, "content": m.content}
-            for m in final_state["messages"]
+            for m in returned
         ],
         "reasoning": final_state.get("cur_reasoning", ""),
-    }
\ No newline at end of file
+        "llm_calls": counter.llm_calls,
+        "hops": dict(counter.hops),
+    }
+
+
+@router.get("/gemini-agent/stats")
+async def gemini_agent_stats():
+    return {**gemini_turn_stats.stats(), "tools": tool_timings.stats()}
+
+
+@router.get("/gemini-agent/traces")
+async def gemini_agent_traces(correlation_id: Optional[str] = None, kind: Optional[str] = None,
+                              name: Optional[str] = None, limit: int = 200):
+    """Recent spans (node, llm, tool, db), optionally for one turn's correlation_id."""
+    return {"spans": spans.query(correlation_id=correlation_id, kind=kind, name=name, limit=limit)}
+
+
+@router.get("/gemini-agent/traces/summary")
+async def gemini_agent_trace_summary():
+    return spans.summary()
+
+
+# Standalone: ``uvicorn main:app``. service.py serves ``router`` next to the other surfaces.
+app = resources.build_app("main", {"": router}, usage_path="/gemini-agent/usage")
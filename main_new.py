@@ -1,21 +1,39 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import APIRouter, HTTPException, status
 
 from DB.database_connection_appointments import AppointmentManager
-from graph_logic import build_graph
-from schedule_appointment import build_appointment_graph
-from cancel_appointment import build_cancel_appointment_graph
-from gemini_graph import build_gemini_graph
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_core.messages import BaseMessage
 from pydantic import parse_obj_as, BaseModel
 from typing import List, Optional, Literal
 from models import Patient, PatientVerificationByPhone, PatientVerificationBySsn, Appointment, UpdateAppointment, ViewAppointmentReq
+from resources import resources
 
-app = FastAPI()
-graph = build_graph()
-schedule_graph = build_appointment_graph()
-cancel_schedule_graph = build_cancel_appointment_graph()
-gemini_graph = build_gemini_graph()
+router = APIRouter()
+
+
+# Built on first use, as in main.py; the names main.py also uses share one build.
+def _build_graph():
+    from graph_logic import build_graph
+    return build_graph()
+
+
+def _build_schedule_graph():
+    from schedule_appointment import build_appointment_graph
+    return build_appointment_graph()
+
+
+def _build_cancel_schedule_graph():
+    from cancel_appointment import build_cancel_appointment_graph
+    return build_cancel_appointment_graph()
+
+
+def _build_gemini_graph():
+    from gemini_graph import build_gemini_graph
+    return build_gemini_graph()
+
+
+graph = resources.lazy("graph", _build_graph)
+schedule_graph = resources.lazy("schedule_graph", _build_schedule_graph)
+cancel_schedule_graph = resources.lazy("cancel_schedule_graph", _build_cancel_schedule_graph)
+gemini_graph = resources.lazy("gemini_graph_sync", _build_gemini_graph)
 # Doing in-memory storage
 patients_db: List[Patient] = []
 patients: []
@@ -46,32 +64,36 @@ class CancelScheduleReq(BaseModel):
     emailId: str
 
 
-@app.post("/process-input")
+@router.post("/process-input")
 def process(req: Req):
     initial_state = {"input_text": req.input_text}
-    final_state = graph.invoke(initial_state)
+    final_state = graph.get().invoke(initial_state)
     return {"result": final_state["output"]}
 
 
-@app.post("/ScheduleAppointment")
+@router.post("/ScheduleAppointment")
 def ScheduleAppointment(req: ScheduleReq):
-    manager = AppointmentManager()
+    manager = resources.db(AppointmentManager)
     return manager.schedule_appointment(req.patient_name, req.doctor_name, req.date, req.time)
 
-@app.post("/CancelAppointment")
+@router.post("/CancelAppointment")
 def CancelAppointment(req: ScheduleReq):
-    manager = AppointmentManager()
+    manager = resources.db(AppointmentManager)
     return manager.cancel_appointment(req)
 
-@app.post("/RescheduleAppointment")
+@router.post("/RescheduleAppointment")
 def RescheduleAppointment(req: UpdateAppointment):
-    manager = AppointmentManager()
+    manager = resources.db(AppointmentManager)
     return manager.reschedule_appointment(req.patient_name, req.doctor_name, req.new_appointment_date, req.new_appointment_time)
 
-@app.post("/appointments/", response_model=List[Appointment])
+@router.post("/appointments/", response_model=List[Appointment])
 async def get_all_appointments(req: ViewAppointmentReq):
     """
     Retrieves a list of all appointments.
     """
-    manager = AppointmentManager()
+    manager = resources.db(AppointmentManager)
     return manager.view_appointments(req.patient_name)
+
+
+# Standalone: ``uvicorn main_new:app``; service.py serves ``router`` under /v2.
+app = resources.build_app("main_new", {"": router})
@@ -0,0 +1,99 @@
+from typing import Any, Sequence
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.channels.base import BaseChannel
+from langgraph.errors import EmptyChannelError
+
+
+class MessageList(list):
+    """Conversation list that remembers which of its messages an agent can be given.
+
+    ``valid()`` only scans messages appended since the previous call, so asking for
+    the agent view on every hop costs O(new messages), not O(history).
+    """
+
+    def __init__(self, messages=()):
+        super().__init__(messages)
+        self._valid = []
+        self._scanned = 0
+
+    def valid(self):
+        for i in range(self._scanned, len(self)):
+            msg = self[i]
+            if isinstance(msg, (HumanMessage, AIMessage)) and msg.content.strip() != "":
+                self._valid.append(msg)
+        self._scanned = len(self)
+        return self._valid
+
+
+def valid_messages(messages: Sequence[Any]):
+    if not isinstance(messages, MessageList):
+        messages = MessageList(messages)
+    return messages.valid()
+
+
+class MessageLog(BaseChannel):
+    """Append-only LangGraph channel for ``messages``.
+
+    Nodes write only the messages they add (a message or a list). Updates extend one
+    backing ``MessageList`` in place instead of rebuilding ``old + new`` on every hop.
+    LangGraph copies channels for fresh reads; a copy shares the backing list and
+    forks it only if both sides append, so neither ever sees the other's messages.
+
+    The checkpoint is the backing list itself, not a snapshot: compile with a saver
+    that serializes before the next step writes (``durability="sync"`` or ``"exit"``).
+    """
+
+    __slots__ = ("log", "length")
+
+    def __init__(self, typ: Any = list, key: str = ""):
+        super().__init__(typ, key)
+        self.log = MessageList()
+        self.length = 0
+
+    def __eq__(self, value: object) -> bool:
+        return isinstance(value, MessageLog)
+
+    @property
+    def ValueType(self):
+        return list
+
+    @property
+    def UpdateType(self):
+        return Any
+
+    def copy(self):
+        empty = self.__class__(self.typ, self.key)
+        empty.log = self.log
+        empty.length = self.length
+        return empty
+
+    def from_checkpoint(self, checkpoint):
+        empty = self.__class__(self.typ, self.key)
+        if isinstance(checkpoint, list):
+            empty.log = checkpoint if isinstance(checkpoint, MessageList) else MessageList(checkpoint)
+            empty.length = len(empty.log)
+        return empty
+
+    def update(self, values: Sequence[Any]) -> bool:
+        added = []
+        for value in values:
+            added.extend(value if isinstance(value, (list, tuple)) else [value])
+        if not added:
+            return False
+        if len(self.log) != self.length:
+            # Another copy of this channel appended to the shared list first.
+            self.log = MessageList(self.log[: self.length])
+        self.log.extend(added)
+        self.length = len(self.log)
+        return True
+
+    def get(self):
+        if not self.length:
+            raise EmptyChannelError()
+        if len(self.log) != self.length:
+            return MessageList(self.log[: self.length])
+        return self.log
+
+    def is_available(self) -> bool:
+        return self.length > 0
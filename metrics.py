@@ -0,0 +1,445 @@
+"""Process-wide metrics in the Prometheus text exposition format, served on ``/metrics``.
+
+Counters, gauges and histograms are sharded per thread: a thread only ever
+writes its own cells, so recording takes no lock, and a scrape sums the shards.
+Values that already live elsewhere (session store size and hit counts, LLM
+slots in flight, lru_cache statistics) are read by collector functions at
+scrape time instead of being copied on every request.
+
+    install(app, "medicall")   # request latency middleware + GET /metrics
+
+Every uvicorn worker is its own process with its own numbers; scrape each one
+(or run one worker per port). ``METRICS=off`` leaves apps, tools and DB
+managers unwrapped and ``/metrics`` empty.
+"""
+import functools
+import inspect
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+METRICS = os.getenv("METRICS", "on") != "off"
+
+# Seconds. Requests and LLM calls span milliseconds (FAQ hits) to tens of seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# SQLite queries and tools are mostly sub-millisecond to a few ms; the tail is lock waits.
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Child:
+    """One label combination: a list of cells per thread, summed on read."""
+
+    __slots__ = ("_size", "_local", "_shards", "_lock")
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._shards: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def _cells(self) -> List[float]:
+        cells = getattr(self._local, "cells", None)
+        if cells is None:
+            cells = self._local.cells = [0.0] * self._size
+            with self._lock:
+                self._shards.append(cells)
+        return cells
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            shards = list(self._shards)
+        return [sum(column) for column in zip(*shards)] if shards else [0.0] * self._size
+
+
+class CounterChild(_Child):
+    __slots__ = ()
+
+    def inc(self, amount: float = 1.0):
+        self._cells()[0] += amount
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        self._cells()[0] -= amount
+
+
+class HistogramChild(_Child):
+    __slots__ = ("_bounds",)
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        # One cell per bucket plus +Inf, then sum and count.
+        super().__init__(len(bounds) + 3)
+        self._bounds = bounds
+
+    def observe(self, value: float):
+        cells = self._cells()
+        cells[bisect_left(self._bounds, value)] += 1
+        cells[-2] += value
+        cells[-1] += 1
+
+
+class Metric:
+    """A named metric family; ``labels(*values)`` returns the child to record on."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], _Child] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self) -> _Child:
+        raise NotImplementedError
+
+    def labels(self, *values) -> Any:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(v) for v in values), self._new_child())
+                self._children[values] = child
+        return child
+
+    def _samples(self) -> Iterable[str]:
+        seen = set()
+        for values, child in list(self._children.items()):
+            if id(child) in seen:
+                continue
+            seen.add(id(child))
+            yield from self._child_samples(tuple(str(v) for v in values), child)
+
+    def _child_samples(self, values, child) -> Iterable[str]:
+        yield f"{self.name}{_label_text(self.labelnames, values)} {_number(child.totals()[0])}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", *self._samples()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return CounterChild(1)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return GaugeChild(1)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def _child_samples(self, values, child):
+        totals = child.totals()
+        cumulative = 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), totals):
+            cumulative += count
+            le = 'le="%s"' % _number(bound)
+            yield f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {_number(cumulative)}"
+        labels = _label_text(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_number(totals[-2])}"
+        yield f"{self.name}_count{labels} {_number(totals[-1])}"
+
+
+class Collector(Metric):
+    """A metric read at scrape time from ``sources``: callables yielding ``(label values, value)``."""
+
+    def __init__(self, name: str, help: str, type: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.type = type
+        self.sources: Dict[str, Callable[[], Iterable[Tuple[Sequence[str], float]]]] = {}
+
+    def add_source(self, key: str, source: Callable[[], Iterable[Tuple[Sequence[str], float]]]):
+        """Register (or replace) the source ``key``, so re-creating an app does not double count."""
+        self.sources[key] = source
+
+    def _samples(self):
+        for key, source in list(self.sources.items()):
+            try:
+                rows = list(source())
+            except Exception:
+                log.exception("Metrics source %s/%s failed", self.name, key)
+                continue
+            for values, value in rows:
+                yield f"{self.name}{_label_text(self.labelnames, [str(v) for v in values])} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self.scrapes = 0
+
+    def get_or_create(self, cls, name: str, *args, **kwargs) -> Any:
+        # Apps and managers may be imported together (or twice); share one family per name.
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, cls(name, *args, **kwargs))
+        return metric
+
+    def render(self) -> str:
+        if not METRICS:
+            return ""
+        self.scrapes += 1
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.get_or_create(Counter, name, help, labelnames)
+
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return registry.get_or_create(Gauge, name, help, labelnames)
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return registry.get_or_create(Histogram, name, help, labelnames, buckets)
+
+
+def collector(name: str, help: str, type: str, labelnames: Sequence[str] = ()) -> Collector:
+    return registry.get_or_create(Collector, name, help, type, labelnames)
+
+
+http_requests = counter("http_requests_total", "HTTP requests by app, method, route template and status.",
+                        ("app", "method", "route", "status"))
+http_latency = histogram("http_request_duration_seconds", "HTTP request latency by app, method and route template.",
+                         ("app", "method", "route"))
+http_in_progress = gauge("http_requests_in_progress", "HTTP requests being served.", ("app",))
+
+llm_requests = counter("llm_requests_total", "Chat model calls by call site and outcome.", ("site", "status"))
+llm_latency = histogram("llm_request_duration_seconds", "Chat model call latency by call site.", ("site",))
+llm_tokens = counter("llm_tokens_total", "Tokens by call site and direction (prompt/completion); "
+                     "estimated when the provider reports no usage.", ("site", "direction"))
+
+tool_calls = counter("tool_calls_total", "Tool invocations by tool and outcome.", ("tool", "status"))
+tool_latency = histogram("tool_duration_seconds", "Tool latency by tool.", ("tool",), FAST_BUCKETS)
+
+db_queries = counter("sqlite_queries_total", "DB manager calls by method and outcome.", ("method", "status"))
+db_latency = histogram("sqlite_query_duration_seconds", "DB manager call latency by method, including "
+                       "time spent waiting on the database lock.", ("method",), FAST_BUCKETS)
+db_lock_errors = counter("sqlite_lock_errors_total", "DB manager calls that gave up waiting on a locked "
+                         "database (\"database is locked\" / SQLITE_BUSY).", ("method",))
+
+session_count = collector("session_store_sessions", "Live sessions per app.", "gauge", ("app",))
+session_bytes = collector("session_store_approx_bytes", "Approximate retained size of all sessions per app.",
+                          "gauge", ("app",))
+session_events = collector("session_store_events_total", "Session store lifecycle events per app "
+                           "(created, expired, evicted).", "counter", ("app", "event"))
+cache_requests = collector("cache_requests_total", "Cache lookups by cache and result (hit/miss).",
+                           "counter", ("cache", "result"))
+singleflight_requests = collector("singleflight_requests_total", "Coalesced call groups by group and role "
+                                  "(leader = ran the call, coalesced = shared a leader's result).",
+                                  "counter", ("group", "role"))
+llm_slots = collector("llm_calls_in_flight", "LLM calls holding an llm_limits slot, and the slot limit.",
+                      "gauge", ("kind",))
+
+
+def _llm_slot_rows():
+    from llm_limits import llm_concurrency_stats
+    stats = llm_concurrency_stats()
+    return [(("in_flight",), stats["in_flight"]), (("limit",), stats["limit"]), (("peak",), stats["peak_in_flight"])]
+
+
+llm_slots.add_source("llm_limits", _llm_slot_rows)
+
+
+def _observe(status_metric: Counter, latency: Histogram, key: str, started: float, status: str):
+    latency.labels(key).observe(time.perf_counter() - started)
+    status_metric.labels(key, status).inc()
+
+
+def timed_tool(name: str, func: Callable) -> Callable:
+    """``func`` counted and timed as tool ``name`` in tool_calls_total / tool_duration_seconds."""
+    if not METRICS:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started, status = time.perf_counter(), "error"
+        try:
+            result = func(*args, **kwargs)
+            status = "ok"
+            return result
+        finally:
+            _observe(tool_calls, tool_latency, name, started, status)
+    return wrapper
+
+
+def observe_llm_call(site: str, started: float, status: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+    """One chat model call at ``site`` that began at ``started`` (perf_counter)."""
+    if prompt_tokens or completion_tokens:
+        llm_tokens.labels(site, "prompt").inc(prompt_tokens)
+        llm_tokens.labels(site, "completion").inc(completion_tokens)
+    _observe(llm_requests, llm_latency, site, started, status)
+
+
+def _is_lock_error(error: BaseException) -> bool:
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def _timed_db(label: str, func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started, status = time.perf_counter(), "error"
+        try:
+            result = func(*args, **kwargs)
+            status = "ok"
+            return result
+        except sqlite3.OperationalError as e:
+            if _is_lock_error(e):
+                db_lock_errors.labels(label).inc()
+            raise
+        finally:
+            _observe(db_queries, db_latency, label, started, status)
+    return wrapper
+
+
+def time_db_methods(cls):
+    """Count and time every public method of ``cls`` as ``<Class>.<method>``."""
+    if not METRICS:
+        return cls
+    for attr, value in list(vars(cls).items()):
+        if not attr.startswith("_") and inspect.isfunction(value):
+            setattr(cls, attr, _timed_db(f"{cls.__name__}.{attr}", value))
+    return cls
+
+
+def watch_session_store(app_name: str, store):
+    """Export ``store.stats()`` (size, bytes, hits/misses, lifecycle events) under ``app_name``."""
+    last = {"scrape": None, "stats": None}
+
+    def stats():
+        # One stats() per scrape, shared by the four families below.
+        if last["scrape"] != registry.scrapes:
+            last["scrape"], last["stats"] = registry.scrapes, store.stats()
+        return last["stats"]
+
+    cache = f"sessions:{app_name}"
+    session_count.add_source(app_name, lambda: [((app_name,), stats()["sessions"])])
+    session_bytes.add_source(app_name, lambda: [((app_name,), stats()["approx_bytes"])])
+    session_events.add_source(app_name, lambda: [
+        ((app_name, event), stats()[event]) for event in ("created", "expired", "evicted")
+    ])
+    cache_requests.add_source(cache, lambda: [((cache, "hit"), stats()["hits"]), ((cache, "miss"), stats()["misses"])])
+
+
+def watch_lru_cache(name: str, cached):
+    """Export a ``functools.lru_cache`` function's hits and misses as cache ``name``."""
+    def lookups():
+        info = cached.cache_info()
+        return [((name, "hit"), info.hits), ((name, "miss"), info.misses)]
+    cache_requests.add_source(name, lookups)
+
+
+def watch_singleflight(name: str, flight):
+    """Export a ``singleflight.SingleFlight``'s leader and coalesced calls as group ``name``."""
+    def calls():
+        return [((name, "leader"), flight.leaders), ((name, "coalesced"), flight.coalesced)]
+    singleflight_requests.add_source(name, calls)
+
+
+def _route_template(scope) -> str:
+    # Newer FastAPI leaves routes of an included router un-prefixed in
+    # scope["route"]; its effective route context has the path as served.
+    route = (scope.get("fastapi") or {}).get("effective_route_context") or scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: request count, latency and in-flight gauge per route template.
+
+    Routes are labelled by their template (``/providers/{provider_id}``), never
+    the raw path, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app, app_name: str = "app"):
+        self.app = app
+        self.app_name = app_name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_progress = http_in_progress.labels(self.app_name)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            route = _route_template(scope)
+            http_latency.labels(self.app_name, scope["method"], route).observe(time.perf_counter() - started)
+            http_requests.labels(self.app_name, scope["method"], route, str(status["code"])).inc()
+
+
+def render() -> str:
+    return registry.render()
+
+
+def install(app, app_name: str):
+    """Add request metrics to ``app`` and serve every metric family on ``GET /metrics``."""
+    from fastapi.responses import Response
+
+    if METRICS:
+        app.add_middleware(MetricsMiddleware, app_name=app_name)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint():
+        return Response(render(), media_type=CONTENT_TYPE)
+
+    return app
@@ -1,4 +1,6 @@
 # ai_service_medicall.py
+import asyncio
+import logging
 import uuid
 import json
 import re
@@ -6,12 +8,10 @@ import os
 import types
 from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
-from zoneinfo import ZoneInfo
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import APIRouter, HTTPException
 from fastapi.encoders import jsonable_encoder
-from pydantic import BaseModel
-from dateutil import parser as dtparser
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 
 # Keep the import that works in your env:
 from langchain.chat_models import AzureChatOpenAI
@@ -19,49 +19,58 @@ from langchain.schema import HumanMessage, SystemMessage, AIMessage
 from DB.database_connection_appointments import AppointmentManager
 from langsmith import traceable
 from DB.database_connection import AppointmentAndPatientManager
-
-os.environ["LANGSMITH_API_KEY"] = "###"   # <-- put your LangSmith API key here
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
-os.environ["LANGCHAIN_PROJECT"] = "MediCall-POC"
+import metrics
+import token_budget
+from prompt import date_normalizer as dates
+from prompt import structured_output as structured
+from prompt.history_manager import HistoryManager
+from resources import resources
+from singleflight import SingleFlight
+from token_counter import estimate_tokens
+
+log = logging.getLogger(__name__)
+
+# Process-wide settings: mounted in service.py they apply to every surface, so
+# the deployment's own environment wins.
+os.environ.setdefault("LANGSMITH_API_KEY", "###")   # <-- put your LangSmith API key here
+os.environ.setdefault("LANGCHAIN_TRACING_V2", "true")
+os.environ.setdefault("LANGCHAIN_PROJECT", "MediCall-POC")
 
 OPENAI_API_KEY = "###"  # <-- put your OpenAI API key here
 OPENAI_API_BASE = "###"  # <-- put your OpenAI API base URL here
 DEPLOYMENT_NAME = "gpt-4o-mini"
 OPENAI_API_VERSION = "2024-12-01-preview"
 
-llm = AzureChatOpenAI(
+llm = resources.chat_model("medicall", lambda: AzureChatOpenAI(
     deployment_name=DEPLOYMENT_NAME,
     openai_api_key=OPENAI_API_KEY,
     openai_api_base=OPENAI_API_BASE,
     openai_api_version=OPENAI_API_VERSION,
     temperature=0  # deterministic
-)
+))
 
-app = FastAPI(title="MediCall Agent Service")
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # lock down in prod
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+router = APIRouter()
 
-# In-memory session state
-sessions: Dict[str, Dict[str, Any]] = {}
+# Prompt compaction: last N user turns verbatim, older ones folded into a fact summary
+history_manager = HistoryManager(
+    keep_turns=int(os.getenv("HISTORY_KEEP_TURNS", "6")),
+    token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", "4000")),
+)
 
-def new_session() -> str:
-    sid = str(uuid.uuid4())
-    sessions[sid] = {
+# Session state: bounded by idle TTL, LRU size and a per-session history cap
+def initial_state() -> Dict[str, Any]:
+    return {
         "history": [],
         "appointments": [],
     }
-    return sid
+
+sessions = resources.session_store("medicall", initial_state, trim=history_manager.trim)
+
+def new_session() -> str:
+    return sessions.new_session()
 
 def get_session(session_id: Optional[str]) -> Tuple[str, Dict[str, Any]]:
-    if session_id and session_id in sessions:
-        return session_id, sessions[session_id]
-    sid = new_session()
-    return sid, sessions[sid]
+    return sessions.get_or_create(session_id)
 
 
 # MediCall System Prompt
@@ -115,7 +124,7 @@ CRITICAL RULES:
 
 @traceable(run_type="tool", name="RetrieveProvidersList")
 def tool_retrieve_providers(state: Dict[str, Any], params: Dict[str, str]) -> str:
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     providers = manager.get_all_providers()
     if not providers:
         return "No providers available."
@@ -141,7 +150,7 @@ def tool_schedule(state: Dict[str, Any], params: Dict[str, str]) -> str:
         "address": params.get("address", "").lower() if params.get("address") else "",
     }
     req = types.SimpleNamespace(**requestattr)
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     return manager.schedule_appointment_with_detail(req)["Message"]
 
 @traceable(run_type="tool", name="RescheduleAppointment")
@@ -152,21 +161,21 @@ def tool_reschedule(state: Dict[str, Any], params: Dict[str, str]) -> str:
         new_date = params["newDate"].lower()
         new_time = params["newTime"].lower()
         
-        manager = AppointmentAndPatientManager()
+        manager = resources.db(AppointmentAndPatientManager)
         return manager.reschedule_appointment(provider_name, patient_first_name, patient_last_name, new_date, new_time)["Message"]
 
 @traceable(run_type="tool", name="CancelAppointment")
 def tool_cancel(state: Dict[str, Any], params: Dict[str, str]) -> str:
         first_name = params["firstName"].lower()
         phone_number = params["phoneNumber"].lower()
-        manager = AppointmentAndPatientManager()
+        manager = resources.db(AppointmentAndPatientManager)
         return manager.cancel_appointment(first_name, phone_number)["Message"]
 
 @traceable(run_type="tool", name="ViewAppointment")
 def tool_view(state: Dict[str, Any], params: Dict[str, str]) -> str:
     first_name = params["patient_firstName"].lower()
     last_name = params["patient_lastName"].lower()
-    manager = AppointmentAndPatientManager()
+    manager = resources.db(AppointmentAndPatientManager)
     hits = manager.get_appointments_by_patient_Name(first_name, last_name)
     if isinstance(hits, dict): 
         return hits["Message"]
@@ -180,6 +189,54 @@ def tool_view(state: Dict[str, Any], params: Dict[str, str]) -> str:
 
     return "\n".join(response_lines)
 
+# Parameter schemas, bound as function tools and used to validate every call (prompt/structured_output.py).
+class RetrieveProvidersList(structured.ToolParams):
+    """List the providers a patient can book with."""
+
+
+class ScheduleAppointment(structured.ToolParams):
+    """Book an appointment with a provider."""
+    firstName: str = ""
+    lastName: str = ""
+    dateOfBirth: str = Field("", description="YYYY-MM-DD")
+    gender: str = ""
+    providerId: str = ""
+    date: str = Field("", description="YYYY-MM-DD")
+    time: str = Field("", description="HH:MM AM/PM")
+    email: str = ""
+    phoneNumber: str = ""
+    address: str = ""
+
+
+class RescheduleAppointment(structured.ToolParams):
+    """Move a patient's appointment with a provider to a new date and time."""
+    providerName: str = ""
+    firstName: str = ""
+    lastName: str = ""
+    oldDate: str = Field("", description="YYYY-MM-DD")
+    oldTime: str = Field("", description="HH:MM AM/PM")
+    newDate: str = Field("", description="YYYY-MM-DD")
+    newTime: str = Field("", description="HH:MM AM/PM")
+
+
+class CancelAppointment(structured.ToolParams):
+    """Cancel a patient's appointment."""
+    firstName: str = ""
+    phoneNumber: str = ""
+
+
+class ViewAppointment(structured.ToolParams):
+    """List a patient's appointments."""
+    patient_firstName: str = ""
+    patient_lastName: str = ""
+    date: str = Field("", description="optional, YYYY-MM-DD")
+
+
+TOOL_SCHEMAS = {schema.__name__: schema for schema in (
+    RetrieveProvidersList, ScheduleAppointment, RescheduleAppointment, CancelAppointment, ViewAppointment)}
+
+tool_llm = structured.tool_mode(llm, TOOL_SCHEMAS)
+
 TOOLS = {
     "RetrieveProvidersList": tool_retrieve_providers,
     "ScheduleAppointment": tool_schedule,
@@ -187,10 +244,11 @@ TOOLS = {
     "CancelAppointment": tool_cancel,
     "ViewAppointment": tool_view,
 }
+TOOLS = {name: metrics.timed_tool(name, func) for name, func in TOOLS.items()}
 
-# Timezone normalization helpers
+# Timezone normalization helpers (fast paths and memo in prompt/date_normalizer.py)
 
-USER_TZ = ZoneInfo("America/New_York")
+USER_TZ = dates.USER_TZ
 
 DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 TIME_RE = re.compile(r"^\d{1,2}:\d{2}\s?(AM|PM)$", re.I)
@@ -198,50 +256,23 @@ TIME_RE = re.compile(r"^\d{1,2}:\d{2}\s?(AM|PM)$", re.I)
 @traceable(run_type="chain", name="normalize_date")
 def normalize_date(date_str: str, user_msg: str) -> str:
     """Force current year if user didn't type a 4-digit year in THIS message."""
-    user_has_year = bool(re.search(r"\b(19|20)\d{2}\b", user_msg))
-    base = dtparser.parse(date_str, default=datetime.now(USER_TZ))
-    if not user_has_year:
-        base = base.replace(year=datetime.now(USER_TZ).year)
-    return base.date().isoformat()  # YYYY-MM-DD
+    return dates.normalize_date(date_str, user_msg)  # YYYY-MM-DD
 
 
 @traceable(run_type="chain", name="normalize_time_ampm")
 def normalize_time_ampm(time_str: str) -> str:
-    try:
-        dt = dtparser.parse(time_str)
-        try:
-            # Try Unix format first
-            return dt.strftime("%-I:%M %p")
-        except ValueError:
-            # Fallback for Windows
-            return dt.strftime("%#I:%M %p")
-    except Exception:
-        return time_str
+    return dates.normalize_time_ampm(time_str)
 
 @traceable(run_type="chain", name="to_aware")
 def to_aware(date_str: str, time_ampm: str) -> datetime:
-    dt = dtparser.parse(f"{date_str} {time_ampm}", default=datetime.now(USER_TZ))
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=USER_TZ)
-    return dt
+    return dates.to_aware(date_str, time_ampm)
 
 
 @traceable(run_type="chain", name="is_past")
 def is_past(aware_dt: datetime) -> bool:
-    return aware_dt < datetime.now(aware_dt.tzinfo or USER_TZ)
+    return dates.is_past(aware_dt)
 
 
-@traceable(run_type="chain", name="extract_json_block")
-def extract_json_block(text: str) -> Optional[dict]:
-    start = text.find("{")
-    end = text.rfind("}")
-    if start == -1 or end == -1 or end <= start:
-        return None
-    try:
-        return json.loads(text[start:end+1])
-    except Exception:
-        return None
-
 @traceable(run_type="chain", name="validate_and_normalize_params")
 def validate_and_normalize_params(tool: str, params: Dict[str, Any], user_msg: str) -> Tuple[bool, List[str], Dict[str, str]]:
 
@@ -319,6 +350,74 @@ def validate_and_normalize_params(tool: str, params: Dict[str, Any], user_msg: s
     errors.append("Unknown tool.")
     return False, errors, out
 
+# Speculative provider prefetch: a message that asks for a new appointment starts the
+# provider lookup before the LLM call. If it is back within PREFETCH_WAIT_MS the list
+# goes into that call's context and is shown above the reply, so the model can ask
+# for a choice (or use the provider the patient named) instead of first emitting
+# RetrieveProvidersList. A late lookup still answers that tool call if the model makes it.
+PROVIDER_PREFETCH = os.getenv("PROVIDER_PREFETCH", "on") == "on"
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_MS", "150")) / 1000
+
+SCHEDULING_RE = re.compile(
+    r"\b(?:schedul\w*|book\w*|new appointment|appointment with|"
+    r"see (?:a |the )?(?:doctor|provider|specialist|dr\b))", re.I)
+NOT_SCHEDULING_RE = re.compile(r"\b(?:re-?schedul\w*|cancel\w*|move my|my appointments?)\b", re.I)
+
+PROVIDER_CONTEXT = """PROVIDERS (already retrieved for this request and shown to the patient above your reply):
+{providers}
+Do not output RetrieveProvidersList and do not repeat the list. Ask the patient to choose a provider,
+or use the one they named, and continue collecting the ScheduleAppointment details."""
+
+# Said instead of a reply the model could not turn into prose or a valid tool call.
+FALLBACK_REPLY = ("Sorry, I didn't quite catch that. Could you tell me again what you need, "
+                  "for example the doctor, date and time for an appointment?")
+
+prefetch_outcomes = metrics.counter("medicall_provider_prefetch_total", "Speculative provider lookups by "
+                                    "outcome (injected, late, failed) and lookups reused for a "
+                                    "RetrieveProvidersList call (reused).", ("result",))
+
+
+def wants_new_appointment(message: str) -> bool:
+    """Cheap local check for a request to book (not move, cancel or view) an appointment."""
+    return bool(SCHEDULING_RE.search(message)) and not NOT_SCHEDULING_RE.search(message)
+
+
+async def join_prefetch(prefetch) -> Optional[str]:
+    """The prefetched provider list if it is ready within PREFETCH_WAIT_SECONDS, else None."""
+    try:
+        providers = await asyncio.wait_for(asyncio.shield(prefetch), PREFETCH_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        prefetch_outcomes.labels("late").inc()
+        return None
+    except Exception:
+        log.warning("Provider prefetch failed", exc_info=True)
+        prefetch_outcomes.labels("failed").inc()
+        return None
+    if providers == "No providers available.":
+        return None
+    prefetch_outcomes.labels("injected").inc()
+    return providers
+
+
+# Chat turns that need the provider list at the same time (prefetches and
+# RetrieveProvidersList calls alike) share one lookup and one threadpool slot.
+provider_lookups = SingleFlight("medicall_providers")
+
+
+async def lookup_providers(state: Dict[str, Any]) -> str:
+    return await provider_lookups.ado("RetrieveProvidersList", run_in_threadpool,
+                                      TOOLS["RetrieveProvidersList"], state, {})
+
+
+async def retrieve_providers_call(state: Dict[str, Any]) -> Tuple[bool, str]:
+    return True, await lookup_providers(state)
+
+
+async def reuse_prefetch(prefetch) -> Tuple[bool, str]:
+    prefetch_outcomes.labels("reused").inc()
+    return True, await prefetch
+
+
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
@@ -328,65 +427,104 @@ class ChatResponse(BaseModel):
     reply: str
     done: bool = False
     tool_result: Optional[str] = None
+    usage: Optional[Dict[str, int]] = None
 
 @traceable(run_type="chain", name="chat-handler", tags=["api", "chat"])
-@app.post("/chat", response_model=ChatResponse)
-def chat(payload: ChatRequest):
-    session_id, state = get_session(payload.session_id)
-
-    messages: List[Any] = [SystemMessage(content=MEDICALL_PROMPT)]
-    for turn in state["history"]:
-        if turn["role"] == "user":
-            messages.append(HumanMessage(content=turn["text"]))
-        else:
-            messages.append(AIMessage(content=turn["text"]))
-
-    messages.append(HumanMessage(content=payload.message))
-
-    ai = llm(messages)
-    text = ai.content.strip()
-
-    json_obj = extract_json_block(text)
-
-    if json_obj and isinstance(json_obj, dict) and "tool" in json_obj and "parameters" in json_obj:
-        tool_name = json_obj["tool"]
-        raw_params = json_obj["parameters"]
-
-        ok, errs, norm_params = validate_and_normalize_params(tool_name, raw_params, payload.message)
-        if not ok:
-            error_msg = " ".join(errs)
-            assistant_reply = (
-                f"{error_msg} Please provide the missing or corrected information."
-            )
-            state["history"].append({"role": "assistant", "text": assistant_reply})
-            state["history"].append({"role": "user", "text": payload.message})
-            return ChatResponse(session_id=session_id, reply=assistant_reply, done=False)
-
-        tool_func = TOOLS.get(tool_name)
-        if not tool_func:
-            assistant_reply = "I recognized your intent, but I can't access that tool."
-            state["history"].append({"role": "assistant", "text": assistant_reply})
-            state["history"].append({"role": "user", "text": payload.message})
-            return ChatResponse(session_id=session_id, reply=assistant_reply, done=False)
-
-        result_text = tool_func(state, norm_params)
-
-        state["history"].append({"role": "assistant", "text": result_text})
+@router.post("/chat", response_model=ChatResponse)
+async def chat(payload: ChatRequest):
+    session_id, state = await sessions.aget_or_create(payload.session_id)
+    try:
+        with token_budget.usage_scope(session_id, "/chat"), dates.request_clock():
+            return await chat_turn(payload, session_id, state)
+    finally:
+        await sessions.asave(session_id, state)
+
+async def chat_turn(payload: ChatRequest, session_id: str, state: Dict[str, Any]) -> ChatResponse:
+    refusal = token_budget.ledger.refusal(session_id)
+    if refusal:
         state["history"].append({"role": "user", "text": payload.message})
+        state["history"].append({"role": "assistant", "text": refusal})
+        return ChatResponse(session_id=session_id, reply=refusal, done=False)
+
+    prefetch = None
+    if PROVIDER_PREFETCH and not state.get("providers_offered") and wants_new_appointment(payload.message):
+        prefetch = asyncio.ensure_future(lookup_providers(state))
+        # A lookup nobody ends up waiting for must not log "exception was never retrieved".
+        prefetch.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    messages, usage = history_manager.build_messages(MEDICALL_PROMPT, state, payload.message)
+    providers = await join_prefetch(prefetch) if prefetch is not None else None
+    if providers:
+        context = PROVIDER_CONTEXT.format(providers=providers)
+        messages.insert(1, SystemMessage(content=context))
+        usage["provider_context_tokens"] = estimate_tokens(context)
+        usage["prompt_tokens"] += usage["provider_context_tokens"]
+        state["providers_offered"] = True
+    state["last_usage"] = usage
+
+    # A tool call is dispatched as soon as its JSON is complete, while the reply finishes streaming.
+    dispatched: Dict[str, Any] = {}
+
+    def start_tool(call: structured.ToolCall):
+        if call.name == "RetrieveProvidersList":
+            dispatched["task"] = asyncio.ensure_future(
+                reuse_prefetch(prefetch) if prefetch is not None else retrieve_providers_call(state))
+            return
+        dispatched["task"] = asyncio.ensure_future(run_in_threadpool(run_tool_call, state, call, payload.message))
 
-        return ChatResponse(session_id=session_id, reply=result_text, done=True, tool_result=result_text)
-
-    state["history"].append({"role": "assistant", "text": text})
+    try:
+        ai, call = await structured.arequest_tool_call(tool_llm, messages, TOOL_SCHEMAS, on_call=start_tool, schema="medicall")
+    except structured.StructuredOutputError:
+        ai, call = AIMessage(content=""), None
+
+    if call is not None:
+        if "task" not in dispatched:
+            start_tool(call)
+        task = dispatched["task"]
+        done, assistant_reply = await task
+        state["history"].append({"role": "user", "text": payload.message})
+        state["history"].append({"role": "assistant", "text": assistant_reply})
+        if not done:
+            return ChatResponse(session_id=session_id, reply=assistant_reply, done=False, usage=usage)
+        return ChatResponse(session_id=session_id, reply=assistant_reply, done=True, tool_result=assistant_reply, usage=usage)
+
+    text = ai.content.strip() if isinstance(ai.content, str) else ""
+    if not text:
+        # Repairs ran out or the model sent nothing usable; never show the raw reply.
+        text = FALLBACK_REPLY
+    if providers:
+        text = f"{providers}\n\n{text}"
     state["history"].append({"role": "user", "text": payload.message})
-    return ChatResponse(session_id=session_id, reply=text, done=False)
+    state["history"].append({"role": "assistant", "text": text})
+    return ChatResponse(session_id=session_id, reply=text, done=False, tool_result=providers, usage=usage)
+
+
+def run_tool_call(state: Dict[str, Any], call: structured.ToolCall, user_msg: str) -> Tuple[bool, str]:
+    """(done, reply) for a validated tool call. Tools hit SQLite synchronously, so this runs in the threadpool."""
+    ok, errs, norm_params = validate_and_normalize_params(call.name, call.params, user_msg)
+    if not ok:
+        return False, f"{' '.join(errs)} Please provide the missing or corrected information."
+
+    tool_func = TOOLS.get(call.name)
+    if not tool_func:
+        return False, "I recognized your intent, but I can't access that tool."
+    return True, tool_func(state, norm_params)
 
-@app.get("/session/{session_id}")
+@router.get("/session/{session_id}")
 def get_session_info(session_id: str):
-    state = sessions.get(session_id)
+    state = sessions.peek(session_id)
     if not state:
         raise HTTPException(status_code=404, detail="session not found")
     return jsonable_encoder(state)
 
-@app.get("/hello")
+@router.get("/sessions/stats")
+def get_session_stats():
+    return sessions.stats()
+
+@router.get("/hello")
 def hello():
     return {"message": "MediCall Agent is running."}
+
+
+# Standalone: ``uvicorn prompt.MediCallPrompt:app``; service.py serves ``router`` under /medicall.
+app = resources.build_app("medicall", {"": router}, cors=True, title="MediCall Agent Service")
@@ -1,44 +1,45 @@
 import uuid
 import json
 import re
-from dateutil import parser as dtparser
-from zoneinfo import ZoneInfo
-from typing import Optional, Dict, Any, List
+import os
+from typing import Optional, Dict, Any, List, Literal, Union
 from datetime import datetime, timezone
 from fastapi.encoders import jsonable_encoder
 from fastapi import HTTPException
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi import APIRouter
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 import requests
 
 from langchain.chat_models import AzureChatOpenAI
 from langchain.schema import HumanMessage
+import metrics
+import token_budget
+from prompt import date_normalizer as dates
+from prompt.appointment_book import AppointmentBook
+from prompt import structured_output as structured
+from resources import resources
 
 OPENAI_API_KEY = ""
 OPENAI_API_BASE = ""
 DEPLOYMENT_NAME = "gpt-4o-mini"
 OPENAI_API_VERSION = "2024-12-01-preview"
 
-llm = AzureChatOpenAI(
+# "single": one combined LLM call per turn, missing slots decided locally and the
+# confirmation rendered from templates. "legacy": extract -> follow-up -> finalize.
+TURN_PIPELINE = os.getenv("TURN_PIPELINE", "single")
+
+llm = resources.chat_model("assistant", lambda: AzureChatOpenAI(
     deployment_name=DEPLOYMENT_NAME,
     openai_api_key=OPENAI_API_KEY,
     openai_api_base=OPENAI_API_BASE,
     openai_api_version=OPENAI_API_VERSION,
     temperature=0
-)
-
-app = FastAPI(title="AI Appointment Assistant (POC)")
+))
+# The extraction, follow-up and turn prompts are answered in JSON mode (prompt/structured_output.py).
+json_llm = structured.json_mode(llm)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+router = APIRouter()
 
-sessions: Dict[str, Dict[str, Any]] = {}
 
 class ChatRequest(BaseModel):
     message: str
@@ -52,10 +53,59 @@ class ChatResponse(BaseModel):
     missing_slots: Optional[List[str]] = None
     tool_result: Optional[str] = None
 
-def new_session() -> str:
-    """Create and return a new session id and initial state."""
-    sid = str(uuid.uuid4())
-    sessions[sid] = {
+# Schemas the JSON replies are validated against.
+SlotValue = Union[str, List[str], None]
+
+
+class Slots(BaseModel):
+    model_config = ConfigDict(extra="ignore", coerce_numbers_to_str=True)
+
+    name: SlotValue = None
+    doctor: SlotValue = None
+    date: SlotValue = None
+    time: SlotValue = None
+    appointment_id: SlotValue = None
+
+
+class Extraction(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    intent: Literal["schedule", "reschedule", "cancel", "view", "none"] = "none"
+    slots: Slots = Field(default_factory=Slots)
+
+    @field_validator("intent", mode="before")
+    @classmethod
+    def _intent_case(cls, value):
+        return value.strip().lower() if isinstance(value, str) else "none" if value is None else value
+
+
+class TurnPlan(Extraction):
+    next_slot: Optional[str] = None
+    question: str = ""
+
+    @field_validator("question", mode="before")
+    @classmethod
+    def _no_question(cls, value):
+        return "" if value is None else value
+
+
+class FollowUp(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    missing: List[str] = []
+    next_slot: Optional[str] = None
+    question: str = ""
+
+    @field_validator("missing", "question", mode="before")
+    @classmethod
+    def _null_is_empty(cls, value, info):
+        if value is None:
+            return [] if info.field_name == "missing" else ""
+        return value
+
+
+def initial_state() -> Dict[str, Any]:
+    return {
         "slots": {
             "name": None,
             "doctor": None,
@@ -75,27 +125,21 @@ def new_session() -> str:
         "appointments": [],
         "intent": None
     }
-    return sid
+
+sessions = resources.session_store("assistant", initial_state)
+
+def new_session() -> str:
+    """Create and return a new session id and initial state."""
+    return sessions.new_session()
 
 def get_session(session_id: Optional[str]) -> (str, Dict[str, Any]):
-    if not session_id or session_id not in sessions:
-        sid = new_session()
-        return sid, sessions[sid]
-    return session_id, sessions[session_id]
+    return sessions.get_or_create(session_id)
 
 def tool_schedule(session_state: Dict[str, Any]) -> str:
     slots = session_state["slots"]
-    apt_id = f"apt-{int(datetime.utcnow().timestamp())}"
-    apt = {
-        "id": apt_id,
-        "name": slots["name"],
-        "doctor": slots["doctor"],
-        "date": slots["date"],
-        "time": slots["time"],
-        "created_at": datetime.utcnow().isoformat(),
-    }
-    session_state["appointments"].append(apt)
-    print("Appointments", session_state["appointments"]);
+    book = AppointmentBook(session_state)
+    apt = book.add(slots["name"], slots["doctor"], slots["date"], slots["time"])
+    print("Appointment", apt, "- session has", len(book))
     return f"Scheduled: {apt['id']} with Dr. {apt['doctor']} on {apt['date']} at {apt['time']} for {apt['name']}."
 
 def tool_reschedule(session_state: Dict[str, Any]) -> str:
@@ -104,12 +148,10 @@ def tool_reschedule(session_state: Dict[str, Any]) -> str:
     if not apt_id:
         return "No appointment id provided to reschedule."
 
-    for apt in session_state["appointments"]:
-        if apt["id"] == apt_id:
-            apt["date"] = slots.get("date") or apt["date"]
-            apt["time"] = slots.get("time") or apt["time"]
-            return f"Rescheduled {apt_id} to {apt['date']} at {apt['time']}."
-    return f"Appointment {apt_id} not found."
+    apt = AppointmentBook(session_state).reschedule(apt_id, slots.get("date"), slots.get("time"))
+    if apt is None:
+        return f"Appointment {apt_id} not found."
+    return f"Rescheduled {apt_id} to {apt['date']} at {apt['time']}."
 
 def tool_cancel(session_state: Dict[str, Any]) -> str:
     slots = session_state["slots"]
@@ -117,48 +159,22 @@ def tool_cancel(session_state: Dict[str, Any]) -> str:
     if not apt_id:
         return "No appointment id provided to cancel."
 
-    for i, apt in enumerate(session_state["appointments"]):
-        if apt["id"] == apt_id:
-            session_state["appointments"].pop(i)
-            return f"Cancelled appointment {apt_id}."
-    return f"Appointment {apt_id} not found."
+    if AppointmentBook(session_state).cancel(apt_id) is None:
+        return f"Appointment {apt_id} not found."
+    return f"Cancelled appointment {apt_id}."
+
+def _joined(value) -> str:
+    return ", ".join(str(v) for v in value) if isinstance(value, list) else str(value)
 
 def tool_view(session_state: Dict[str, Any]) -> str:
     slots = session_state["allAppointmentsSlots"]
-    results = []
-
-    for apt in session_state["appointments"]:
-        match = True
-        if slots.get("doctor"):
-            apt_doctors = apt["doctor"] if isinstance(apt["doctor"], list) else [apt["doctor"]]
-            slot_doctors = slots["doctor"] if isinstance(slots["doctor"], list) else [slots["doctor"]]
-            if not any(ad.lower() == sd.lower() for ad in apt_doctors for sd in slot_doctors):
-                match = False
-        else:
-            apt_doctors = apt["doctor"] if isinstance(apt["doctor"], list) else [apt["doctor"]]
-
-        if slots.get("date"):
-            apt_dates = apt["date"] if isinstance(apt["date"], list) else [apt["date"]]
-            slot_dates = slots["date"] if isinstance(slots["date"], list) else [slots["date"]]
-            if not any(str(ad) == str(sd) for ad in apt_dates for sd in slot_dates):
-                match = False
-        else:
-            apt_dates = apt["date"] if isinstance(apt["date"], list) else [apt["date"]]
-
-        if slots.get("name"):
-            slot_names = slots["name"] if isinstance(slots["name"], list) else [slots["name"]]
-            if not any(sn.lower() in apt["name"].lower() for sn in slot_names):
-                match = False
-
-        if match:
-            apt_times = apt["time"] if isinstance(apt["time"], list) else [apt["time"]]
-            results.append(
-                f"{apt['id']}: Dr. {', '.join(apt_doctors)} on {', '.join(apt_dates)} at {', '.join(apt_times)} for {apt['name']}"
-            )
-
-    if not results:
+    found = AppointmentBook(session_state).find(slots.get("doctor"), slots.get("date"), slots.get("name"))
+    if not found:
         return "No appointments found matching your criteria."
-    return "\n".join(results)
+    return "\n".join(
+        f"{apt['id']}: Dr. {_joined(apt['doctor'])} on {_joined(apt['date'])} at {_joined(apt['time'])} for {apt['name']}"
+        for apt in found
+    )
 
 
 TOOLS = {
@@ -167,6 +183,7 @@ TOOLS = {
     "cancel": tool_cancel,
     "view": tool_view,
 }
+TOOLS = {name: metrics.timed_tool(name, func) for name, func in TOOLS.items()}
 
 EXTRACTION_PROMPT = """
 You are a JSON extractor for an appointment assistant.
@@ -220,7 +237,7 @@ conversation_history (most recent last):
 {history}
 """
 
-def llm_next_question(intent: str, required_slots: list, known_slots: dict, history: list) -> dict:
+async def llm_next_question(intent: str, required_slots: list, known_slots: dict, history: list) -> dict:
     history_text = "\n".join(history[-10:])
     compact_known = {k: v for k, v in known_slots.items() if v not in [None, "", [], {}]}
 
@@ -230,26 +247,8 @@ def llm_next_question(intent: str, required_slots: list, known_slots: dict, hist
         known_slots=compact_known,
         history=history_text
     )
-    resp = llm([HumanMessage(content=prompt)])
-    raw = resp.content.strip()
-
-    try:
-        data = json.loads(raw)
-    except Exception:
-        start, end = raw.find("{"), raw.rfind("}")
-        try:
-            data = json.loads(raw[start:end+1])
-        except Exception:
-            data = {"missing": [], "next_slot": None, "question": ""}
-
-    data.setdefault("missing", [])
-    data.setdefault("next_slot", None)
-    data.setdefault("question", "")
-    if not isinstance(data["missing"], list):
-        data["missing"] = []
-    if not isinstance(data["question"], str):
-        data["question"] = ""
-    return data
+    followup = await structured.ainvoke_json(json_llm, [HumanMessage(content=prompt)], FollowUp)
+    return (followup or FollowUp()).model_dump()
 
 
 WELCOME_PROMPT = """
@@ -259,7 +258,7 @@ scheduling, rescheduling, canceling, or viewing appointments. Ask what they'd li
 Return only the reply text.
 """
 
-def call_llm_extract(payload: Dict[str, Any], history: List[str]) -> Dict[str, Any]:
+async def call_llm_extract(payload: Dict[str, Any], history: List[str]) -> Dict[str, Any]:
     user_message = payload.get("message", "").strip()
     session_id = payload.get("session_id", "")
 
@@ -271,60 +270,62 @@ def call_llm_extract(payload: Dict[str, Any], history: List[str]) -> Dict[str, A
         message=user_message
     )
 
-    response = llm([HumanMessage(content=prompt)])
-    text = response.content.strip()
+    extraction = await structured.ainvoke_json(json_llm, [HumanMessage(content=prompt)], Extraction)
+    return (extraction or Extraction()).model_dump()
 
-    try:
-        data = json.loads(text)
-    except Exception:
-        start = text.find("{")
-        end = text.rfind("}")
-        try:
-            data = json.loads(text[start:end + 1])
-        except Exception:
-            data = {
-                "intent": "none",
-                "slots": {
-                    "name": None,
-                    "doctor": None,
-                    "date": None,
-                    "time": None,
-                    "appointment_id": None
-                }
-            }
+TURN_PROMPT = """
+You are the language layer of an appointment assistant. In one pass, extract what the
+user wants and write the next thing to say to them.
 
-    data.setdefault("slots", {})
-    for k in ["name", "doctor", "date", "time", "appointment_id"]:
-        data["slots"].setdefault(k, None)
+Return ONLY valid JSON with exactly these keys: "intent", "slots", "next_slot", "question".
 
-    return data
+- "intent" must be one of: "schedule", "reschedule", "cancel", "view", or "none".
+  Use "none" if the message is a greeting or unrelated.
+- "slots" is an object with the keys: "name", "doctor", "date", "time", "appointment_id".
+  If a field is not present in the latest message, take it from known_slots or the history.
+  If unknown, set it to null.
+- "next_slot": the first required slot for the intent that is still null after filling
+  "slots", or null if nothing is missing.
+- "question": one short, friendly question asking for "next_slot". If the intent is "none"
+  and nothing was extracted, instead greet the user in at most two sentences and say you can
+  schedule, reschedule, cancel or view appointments. Otherwise use "".
 
-USER_TZ = ZoneInfo("America/New_York")  # e.g., EST/EDT
+Required slots per intent: {required_slots}
 
-def parse_date_time_from_text(text: str) -> dict | None:
-    default_dt = datetime.now(USER_TZ).replace(month=1, day=1, hour=9, minute=0, second=0, microsecond=0)
-    try:
-        dt = dtparser.parse(text, default=default_dt, fuzzy=True)
-    except Exception:
-        return None
+Disambiguation rules:
+- If the latest message contains phrases like "meet/see/with <Name>", treat <Name> as the doctor/provider, unless the message also contains "my name is".
+- Do not carry over a previous doctor if a new doctor-like name appears in the latest message; prefer the latest message.
 
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=USER_TZ)
+known_slots: {known_slots}
 
-    mentioned_year = re.search(r"\b(20\d{2}|19\d{2})\b", text)
-    if not mentioned_year:
-        dt = dt.replace(year=datetime.now(USER_TZ).year)
+Conversation history (most recent last):
+{history}
 
-    return {
-        "date": dt.date().isoformat(),
-        "time": dt.strftime("%H:%M"),
-        "aware_dt": dt
-    }
+User message:
+\"\"\"{message}\"\"\"
+"""
+
+
+async def call_llm_turn(payload: Dict[str, Any], history: List[str], known_slots: dict) -> Dict[str, Any]:
+    """Extraction and follow-up question from a single LLM call."""
+    compact_known = {k: v for k, v in known_slots.items() if v not in [None, "", [], {}]}
+    prompt = TURN_PROMPT.format(
+        required_slots=json.dumps(REQUIRED_SLOTS),
+        known_slots=compact_known,
+        history="\n".join(history[-10:]),
+        message=payload.get("message", "").strip(),
+    )
+    plan = await structured.ainvoke_json(json_llm, [HumanMessage(content=prompt)], TurnPlan)
+    return (plan or TurnPlan()).model_dump()
+
+USER_TZ = dates.USER_TZ  # e.g., EST/EDT
+
+def parse_date_time_from_text(text: str) -> dict | None:
+    return dates.parse_date_time_from_text(text)
 
 
 def is_past(aware_dt: datetime) -> bool:
-    now = datetime.now(aware_dt.tzinfo or USER_TZ)
-    return aware_dt < now
+    return dates.is_past(aware_dt)
 
 def postprocess_extracted_slots(extracted: dict, state: dict, user_msg: str) -> dict:
     slots = dict(extracted)
@@ -346,7 +347,7 @@ def postprocess_extracted_slots(extracted: dict, state: dict, user_msg: str) ->
         else:
             slots["name"] = None
 
-    user_has_explicit_year = bool(re.search(r"\b(19|20)\d{2}\b", user_msg))
+    user_has_explicit_year = dates.mentions_year(user_msg)
 
     dt_parts = parse_date_time_from_text(user_msg)
     if dt_parts:
@@ -357,9 +358,7 @@ def postprocess_extracted_slots(extracted: dict, state: dict, user_msg: str) ->
 
     if slots.get("date") and not user_has_explicit_year:
         try:
-            base = dtparser.parse(slots["date"], default=datetime.now(ZoneInfo("America/New_York")))
-            normalized = base.replace(year=datetime.now(ZoneInfo("America/New_York")).year)
-            slots["date"] = normalized.date().isoformat()
+            slots["date"] = dates.normalize_date(slots["date"], user_msg)
         except Exception:
             pass
 
@@ -368,13 +367,7 @@ def postprocess_extracted_slots(extracted: dict, state: dict, user_msg: str) ->
         aware_dt = dt_parts["aware_dt"]
     elif slots.get("date") and slots.get("time"):
         try:
-            tmp = dtparser.parse(
-                f"{slots['date']} {slots['time']}",
-                default=datetime.now(ZoneInfo("America/New_York"))
-            )
-            if tmp.tzinfo is None:
-                tmp = tmp.replace(tzinfo=ZoneInfo("America/New_York"))
-            aware_dt = tmp
+            aware_dt = dates.to_aware(slots["date"], slots["time"])
         except Exception:
             aware_dt = None
 
@@ -396,7 +389,7 @@ def determine_missing_slots(action: str, slots: Dict[str, Optional[str]]) -> Lis
     missing = [s for s in required if not slots.get(s)]
     return missing
 
-def llm_finalize_message(user_message: str, action: str, tool_result: Optional[str], slots: Dict[str, Any]) -> str:
+async def llm_finalize_message(user_message: str, action: str, tool_result: Optional[str], slots: Dict[str, Any]) -> str:
     safe_slots = {k: v for k, v in slots.items() if not str(k).startswith("_")}
     try:
         slots_json = json.dumps(safe_slots)
@@ -417,30 +410,76 @@ Please return a polite one-paragraph final message to the user confirming the re
 Do not summarize or skip any items from the tool result. 
 List all appointments exactly as they appear above.
 """
-    resp = llm([HumanMessage(content=prompt)])
+    resp = await llm.ainvoke([HumanMessage(content=prompt)])
     return resp.content.strip()
 
-@app.post("/chat", response_model=ChatResponse)
-def chat(payload: ChatRequest):
-    session_id, state = get_session(payload.session_id)
+WELCOME_MESSAGE = (
+    "Hello! I can help you schedule, reschedule, cancel, or view your appointments. "
+    "What would you like to do?"
+)
+
+SLOT_QUESTIONS = {
+    "name": "May I have the patient's full name?",
+    "doctor": "Which doctor would you like to see?",
+    "date": "What date works for you (e.g., Sep 2 or 2025-09-02)?",
+    "time": "What time would you prefer (e.g., 5 PM)?",
+    "appointment_id": "Could you share the appointment id (it looks like apt-1234567890)?",
+}
+
+FINAL_TEMPLATES = {
+    "schedule": "You're all set. {tool_result} Is there anything else I can help you with?",
+    "reschedule": "Done. {tool_result} Is there anything else I can help you with?",
+    "cancel": "{tool_result} Is there anything else I can help you with?",
+    "view": "Here is what I found:\n{tool_result}",
+}
+
+
+def followup_question(turn: Dict[str, Any], missing: List[str]) -> str:
+    """Use the model's question when it targets the slot we actually need next."""
+    if turn.get("question") and turn.get("next_slot") == missing[0]:
+        return turn["question"]
+    return SLOT_QUESTIONS.get(missing[0], f"Could you tell me the {missing[0]}?")
+
+
+def render_final_message(action: str, tool_result: Optional[str]) -> str:
+    template = FINAL_TEMPLATES.get(action, "{tool_result}")
+    return template.format(tool_result=tool_result)
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(payload: ChatRequest):
+    session_id, state = await sessions.aget_or_create(payload.session_id)
+    try:
+        with token_budget.usage_scope(session_id, "/chat"), dates.request_clock():
+            return await chat_turn(payload, session_id, state)
+    finally:
+        await sessions.asave(session_id, state)
+
+async def chat_turn(payload: ChatRequest, session_id: str, state: Dict[str, Any]) -> ChatResponse:
     state["history"].append(f"User: {payload.message}")
 
-    extraction = call_llm_extract(
-        {"message": payload.message, "session_id": session_id},
-        state["history"]
-    )
+    refusal = token_budget.ledger.refusal(session_id)
+    if refusal:
+        state["history"].append(f"Bot: {refusal}")
+        return ChatResponse(session_id=session_id, reply=refusal, done=False)
+
+    if TURN_PIPELINE == "legacy":
+        extraction = await call_llm_extract(
+            {"message": payload.message, "session_id": session_id},
+            state["history"]
+        )
+    else:
+        extraction = await call_llm_turn(
+            {"message": payload.message, "session_id": session_id},
+            state["history"],
+            state["slots"]
+        )
     intent = extraction.get("intent", "none")
     extracted_slots = postprocess_extracted_slots(extraction["slots"], state, payload.message)
 
     aware_dt = extracted_slots.pop("_aware_dt", None)
     if not aware_dt and state["slots"].get("date") and state["slots"].get("time"):
         try:
-            aware_dt = dtparser.parse(
-                f"{state['slots']['date']} {state['slots']['time']}",
-                default=datetime.now(USER_TZ)
-            )
-            if aware_dt.tzinfo is None:
-                aware_dt = aware_dt.replace(tzinfo=USER_TZ)
+            aware_dt = dates.to_aware(state["slots"]["date"], state["slots"]["time"])
         except Exception:
             aware_dt = None
 
@@ -456,7 +495,10 @@ def chat(payload: ChatRequest):
         intent = state.get("intent") or intent
 
     if intent == "none" and all(v in [None, "", [], {}] for v in extracted_slots.values()):
-        welcome = llm([HumanMessage(content=WELCOME_PROMPT)]).content.strip()
+        if TURN_PIPELINE == "legacy":
+            welcome = (await llm.ainvoke([HumanMessage(content=WELCOME_PROMPT)])).content.strip()
+        else:
+            welcome = extraction["question"] or WELCOME_MESSAGE
         state["history"].append(f"Bot: {welcome}")
         return ChatResponse(session_id=session_id, reply=welcome, done=False, missing_slots=[])
 
@@ -496,16 +538,21 @@ def chat(payload: ChatRequest):
         if v and not k.startswith("_"):
             state["slots"][k] = v.strip() if isinstance(v, str) else v
 
-    required = REQUIRED_SLOTS.get(state["action"], [])
-    followup = llm_next_question(
-        intent=state["action"],
-        required_slots=required,
-        known_slots=state["slots"],
-        history=state["history"]
-    )
-    missing = followup.get("missing", [])
-    next_slot = followup.get("next_slot")
-    question = followup.get("question", "")
+    if TURN_PIPELINE == "legacy":
+        required = REQUIRED_SLOTS.get(state["action"], [])
+        followup = await llm_next_question(
+            intent=state["action"],
+            required_slots=required,
+            known_slots=state["slots"],
+            history=state["history"]
+        )
+        missing = followup.get("missing", [])
+        next_slot = followup.get("next_slot")
+        question = followup.get("question", "")
+    else:
+        missing = determine_missing_slots(state["action"], state["slots"])
+        next_slot = missing[0] if missing else None
+        question = followup_question(extraction, missing) if missing else ""
 
     if next_slot:
         state["history"].append(f"Bot: {question}")
@@ -520,18 +567,29 @@ def chat(payload: ChatRequest):
 
     tool_result = tool_func(state)
 
-    final_msg = llm_finalize_message(payload.message, action, tool_result, state["slots"])
+    if TURN_PIPELINE == "legacy":
+        final_msg = await llm_finalize_message(payload.message, action, tool_result, state["slots"])
+    else:
+        final_msg = render_final_message(action, tool_result)
     state["history"].append(f"Bot: {final_msg}")
 
     return ChatResponse(session_id=session_id, reply=final_msg, done=True, missing_slots=[], tool_result=tool_result)
 
-@app.get("/session/{session_id}")
+@router.get("/session/{session_id}")
 def get_session_info(session_id: str):
-    state = sessions.get(session_id)
+    state = sessions.peek(session_id)
     if not state:
         raise HTTPException(status_code=404, detail="session not found")
     return jsonable_encoder(state)
 
-@app.get("/hello")
+@router.get("/sessions/stats")
+def get_session_stats():
+    return sessions.stats()
+
+@router.get("/hello")
 def hello():
     return {"message": "Appointment Flow Service running."}
+
+
+# Standalone: ``uvicorn prompt.MedicalAsstPromptEndpoin:app``; service.py serves ``router`` under /assistant.
+app = resources.build_app("assistant", {"": router}, cors=True, title="AI Appointment Assistant (POC)")
@@ -0,0 +1,154 @@
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Fields the view tool filters on. Doctors and names compare case-insensitively,
+# dates as strings; a field may hold a single value or a list of them.
+INDEXED_FIELDS = ("doctor", "date", "name")
+
+
+def _values(value) -> List[Any]:
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _key(field: str, value) -> str:
+    return str(value) if field == "date" else str(value).lower()
+
+
+def _seq(apt_id: str) -> int:
+    tail = str(apt_id).rpartition("-")[2]
+    return int(tail) if tail.isdigit() else 0
+
+
+class AppointmentBook:
+    """The appointments of one assistant session, kept in ``state["appointments"]``.
+
+    The data stays plain JSON so every session store can persist it:
+
+        {"last": 1760000000,                      highest id number handed out
+         "by_id": {"apt-1760000000": {...}},      appointments in booking order
+         "index": {"doctor": {"dr. sam": {"apt-1760000000": 1}},
+                   "date": {...}, "name": {...}}}
+
+    Ids keep the ``apt-<unix seconds>`` shape but are unique per session: a
+    second booking within the same second takes the next number. Lookups,
+    reschedules and cancels are dict operations; ``find`` intersects the index
+    buckets of the given filters instead of scanning every appointment. A
+    session saved before this layout (a plain list) is converted on first use.
+    """
+
+    def __init__(self, state: Dict[str, Any]):
+        book = state.get("appointments")
+        if not isinstance(book, dict):
+            book = self._from_list(book or [])
+            state["appointments"] = book
+        self._book = book
+        self._by_id: Dict[str, Dict[str, Any]] = book["by_id"]
+        self._index: Dict[str, Dict[str, Dict[str, int]]] = book["index"]
+
+    @classmethod
+    def _from_list(cls, appointments: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        book = {"last": 0, "by_id": {}, "index": {field: {} for field in INDEXED_FIELDS}}
+        view = cls({"appointments": book})
+        for apt in appointments:
+            apt = dict(apt)
+            if apt.get("id") in book["by_id"]:
+                # Same-second ids used to collide; the later booking gets a fresh one.
+                apt["id"] = view._next_id()
+            book["last"] = max(book["last"], _seq(apt["id"]))
+            view._insert(apt)
+        return book
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def get(self, apt_id: str) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(apt_id)
+
+    def _next_id(self) -> str:
+        self._book["last"] = max(int(time.time()), self._book["last"] + 1)
+        return f"apt-{self._book['last']}"
+
+    def _insert(self, apt: Dict[str, Any]):
+        self._by_id[apt["id"]] = apt
+        for field in INDEXED_FIELDS:
+            buckets = self._index[field]
+            for value in _values(apt.get(field)):
+                buckets.setdefault(_key(field, value), {})[apt["id"]] = 1
+
+    def _unindex(self, apt: Dict[str, Any], field: str):
+        buckets = self._index[field]
+        for value in _values(apt.get(field)):
+            key = _key(field, value)
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.pop(apt["id"], None)
+                if not bucket:
+                    del buckets[key]
+
+    def add(self, name, doctor, date, time) -> Dict[str, Any]:
+        apt = {
+            "id": self._next_id(),
+            "name": name,
+            "doctor": doctor,
+            "date": date,
+            "time": time,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        self._insert(apt)
+        return apt
+
+    def reschedule(self, apt_id: str, date=None, time=None) -> Optional[Dict[str, Any]]:
+        """Move ``apt_id`` to the new date and/or time; None if there is no such appointment."""
+        apt = self._by_id.get(apt_id)
+        if apt is None:
+            return None
+        if date and date != apt["date"]:
+            self._unindex(apt, "date")
+            apt["date"] = date
+            for value in _values(date):
+                self._index["date"].setdefault(_key("date", value), {})[apt_id] = 1
+        apt["time"] = time or apt["time"]
+        return apt
+
+    def cancel(self, apt_id: str) -> Optional[Dict[str, Any]]:
+        """Remove and return ``apt_id``; None if there is no such appointment."""
+        apt = self._by_id.pop(apt_id, None)
+        if apt is not None:
+            for field in INDEXED_FIELDS:
+                self._unindex(apt, field)
+        return apt
+
+    def _matching(self, field: str, wanted) -> set:
+        buckets = self._index[field]
+        ids = set()
+        for value in wanted:
+            key = _key(field, value)
+            if field == "name":
+                # Names match on a substring, so scan the distinct names, not the appointments.
+                for name, bucket in buckets.items():
+                    if key in name:
+                        ids.update(bucket)
+            else:
+                ids.update(buckets.get(key, ()))
+        return ids
+
+    def find(self, doctor=None, date=None, name=None) -> List[Dict[str, Any]]:
+        """Appointments matching every given filter (any of a filter's values), in booking order."""
+        filters = {field: _values(value) for field, value in
+                   (("doctor", doctor), ("date", date), ("name", name)) if value}
+        if not filters:
+            return list(self._by_id.values())
+        ids = None
+        for field in sorted(filters, key=lambda f: f == "name"):
+            found = self._matching(field, filters[field])
+            ids = found if ids is None else ids & found
+            if not ids:
+                return []
+        by_id = self._by_id
+        return [by_id[apt_id] for apt_id in sorted(ids, key=_seq)]
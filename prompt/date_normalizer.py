@@ -0,0 +1,252 @@
+"""Date/time normalization shared by the prompt services.
+
+The common shapes ("2025-09-02", "Sep 2", "September 2nd, 2025", "5 PM",
+"5:30pm", "17:00") are read with precompiled patterns; anything else goes to
+``dateutil.parser`` as before. Results are memoized (``DATE_MEMO_SIZE`` entries
+per function) on the input and the reference day, and ``request_clock()``
+makes every ``now()`` of a request return one reading of the wall clock.
+
+Free-text messages (``parse_date_time_from_text``) only take the fast path
+when nothing outside the recognised date and time could change what dateutil's
+fuzzy parse would return: no other digits, month or weekday names, AM/PM
+markers or time-zone names. Parses that fill in missing fields from a default
+use midnight of the reference day, so results do not carry the current
+seconds.
+"""
+import os
+import re
+import time as _time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, time
+from functools import lru_cache
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from dateutil import parser as dtparser
+
+import metrics
+
+USER_TZ = ZoneInfo("America/New_York")
+DATE_MEMO_SIZE = int(os.getenv("DATE_MEMO_SIZE", "4096"))
+# Benchmarks switch this off to time dateutil alone.
+FAST_PATH = True
+
+_clock: ContextVar[Optional[datetime]] = ContextVar("request_clock", default=None)
+
+_info = dtparser.parserinfo()
+_MONTHS = {name.lower(): n for n, names in enumerate(_info.MONTHS, 1) for name in names}
+_WEEKDAYS = {name.lower() for names in _info.WEEKDAYS for name in names}
+_AMPM = {name.lower() for names in _info.AMPM for name in names}
+_TZ_NAMES = {name.lower() for name in (*_info.UTCZONE, *_time.tzname)}
+
+_DATE = r"(?:(?P<iso_y>\d{4})-(?P<iso_m>\d{2})-(?P<iso_d>\d{2})" \
+        r"|(?P<month>[A-Za-z]{3,9})\.?\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(?P<year>\d{4}))?)"
+_TIME = r"(?:(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ampm>[AaPp][Mm])?)"
+DATE_RE = re.compile(rf"\s*{_DATE}\s*")
+TIME_RE = re.compile(rf"\s*{_TIME}\s*")
+DATE_TIME_RE = re.compile(rf"\s*{_DATE}\s+{_TIME}\s*")
+# Inside a message: whole words only, so "2025-09-02T17:00" or "5pmish" are left to dateutil.
+_DATE_IN_TEXT = re.compile(rf"(?<![\w:/.-]){_DATE}(?![\w:/-])")
+_TIME_IN_TEXT = re.compile(rf"(?<![\w:/.-]){_TIME}(?![\w:/-])")
+_YEAR_RE = re.compile(r"\b(19|20)\d{2}\b")
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+
+def now() -> datetime:
+    """The request's clock reading inside ``request_clock()``, else the current time (USER_TZ)."""
+    return _clock.get() or datetime.now(USER_TZ)
+
+
+def today() -> date:
+    return now().date()
+
+
+@contextmanager
+def request_clock():
+    """Read the clock once; ``now()`` returns that reading until the block exits."""
+    token = _clock.set(datetime.now(USER_TZ))
+    try:
+        yield
+    finally:
+        _clock.reset(token)
+
+
+def mentions_year(text: str) -> bool:
+    return bool(_YEAR_RE.search(text))
+
+
+def _date_fields(m) -> Optional[Tuple[Optional[int], int, int]]:
+    if m.group("iso_y"):
+        return int(m.group("iso_y")), int(m.group("iso_m")), int(m.group("iso_d"))
+    month = _MONTHS.get(m.group("month").lower())
+    if month is None:
+        return None
+    year = m.group("year")
+    return (int(year) if year else None), month, int(m.group("day"))
+
+
+def _time_fields(m) -> Optional[Tuple[int, int]]:
+    if m.group("minute") is None and m.group("ampm") is None:
+        return None  # a bare number: dateutil's reading depends on context
+    hour, minute = int(m.group("hour")), int(m.group("minute") or 0)
+    ampm = (m.group("ampm") or "").lower()
+    if ampm:
+        if hour > 12:
+            return None
+        # dateutil's 12-hour rule: 1-11 PM add twelve, 12 AM is midnight.
+        if ampm == "pm" and hour < 12:
+            hour += 12
+        elif ampm == "am" and hour == 12:
+            hour = 0
+    return hour, minute
+
+
+def _fast_date(text: str):
+    m = DATE_RE.fullmatch(text) if FAST_PATH else None
+    return _date_fields(m) if m else None
+
+
+def _fast_time(text: str):
+    m = TIME_RE.fullmatch(text) if FAST_PATH else None
+    return _time_fields(m) if m else None
+
+
+def _midnight(day: date) -> datetime:
+    return datetime.combine(day, time(0), USER_TZ)
+
+
+@lru_cache(maxsize=DATE_MEMO_SIZE)
+def _parse_date(text: str, day: date) -> date:
+    fields = _fast_date(text)
+    if fields:
+        try:
+            return date(fields[0] or day.year, fields[1], fields[2])
+        except ValueError:
+            pass  # let dateutil raise its own error
+    return dtparser.parse(text, default=_midnight(day)).date()
+
+
+@lru_cache(maxsize=DATE_MEMO_SIZE)
+def _parse_time(text: str) -> Optional[Tuple[int, int]]:
+    fields = _fast_time(text)
+    if fields and fields[0] < 24 and fields[1] < 60:
+        return fields
+    try:
+        parsed = dtparser.parse(text)
+    except Exception:
+        return None
+    return parsed.hour, parsed.minute
+
+
+@lru_cache(maxsize=DATE_MEMO_SIZE)
+def _parse_datetime(text: str, day: date) -> datetime:
+    m = DATE_TIME_RE.fullmatch(text) if FAST_PATH else None
+    fields = _date_fields(m) if m else None
+    clock = _time_fields(m) if fields else None
+    if clock:
+        try:
+            return datetime(fields[0] or day.year, fields[1], fields[2], *clock, tzinfo=USER_TZ)
+        except ValueError:
+            pass
+    parsed = dtparser.parse(text, default=_midnight(day))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=USER_TZ)
+
+
+def _fuzzy_fast(text: str, year: int):
+    """(matched, result) for a free-text message; matched is False when dateutil must decide."""
+    found_date = found_time = None
+    for m in _DATE_IN_TEXT.finditer(text):
+        fields = _date_fields(m)
+        if fields:
+            found_date = (m.span(), fields)
+            break
+    for m in _TIME_IN_TEXT.finditer(text):
+        fields = _time_fields(m)
+        if fields and not (found_date and m.start() < found_date[0][1] and found_date[0][0] < m.end()):
+            found_time = (m.span(), fields)
+            break
+    rest = text
+    for found in (found_date, found_time):
+        if found:
+            (start, end) = found[0]
+            rest = rest[:start] + " " * (end - start) + rest[end:]
+    if any(c.isdigit() for c in rest):
+        return False, None
+    words = {w.lower() for w in _WORD_RE.findall(rest)}
+    # A stray "a"/"pm" can still flip an earlier hour ("12 pm ... a" is midnight to dateutil).
+    if words & _MONTHS.keys() or words & _WEEKDAYS or words & _AMPM:
+        return False, None
+    if found_time and words & _TZ_NAMES:
+        return False, None
+    if not found_date and not found_time:
+        return True, None  # dateutil: "String does not contain a date"
+    y, mo, d = found_date[1] if found_date else (None, 1, 1)
+    h, mi = found_time[1] if found_time else (9, 0)
+    try:
+        return True, datetime(y or year, mo, d, h, mi, tzinfo=USER_TZ)
+    except ValueError:
+        return False, None
+
+
+@lru_cache(maxsize=DATE_MEMO_SIZE)
+def _parse_fuzzy(text: str, day: date) -> Optional[datetime]:
+    if FAST_PATH:
+        matched, dt = _fuzzy_fast(text, day.year)
+        if matched:
+            return dt
+    default_dt = datetime(day.year, 1, 1, 9, 0, tzinfo=USER_TZ)
+    try:
+        dt = dtparser.parse(text, default=default_dt, fuzzy=True)
+    except Exception:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=USER_TZ)
+
+
+_MEMOS = {"dates:date": _parse_date, "dates:time": _parse_time,
+          "dates:datetime": _parse_datetime, "dates:text": _parse_fuzzy}
+for _name, _cached in _MEMOS.items():
+    metrics.watch_lru_cache(_name, _cached)
+
+
+def clear_memo():
+    for cached in _MEMOS.values():
+        cached.cache_clear()
+
+
+def normalize_date(date_str: str, user_msg: str) -> str:
+    """``date_str`` as YYYY-MM-DD, forced into this year unless ``user_msg`` typed a year."""
+    day = today()
+    parsed = _parse_date(date_str, day)
+    if not mentions_year(user_msg):
+        parsed = parsed.replace(year=day.year)
+    return parsed.isoformat()
+
+
+def normalize_time_ampm(time_str: str) -> str:
+    """``time_str`` as "H:MM AM/PM"; returned unchanged if it is not a time."""
+    fields = _parse_time(time_str)
+    if fields is None:
+        return time_str
+    hour, minute = fields
+    return f"{hour % 12 or 12}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
+def to_aware(date_str: str, time_str: str) -> datetime:
+    """The date and time in USER_TZ (unless the strings name another zone)."""
+    return _parse_datetime(f"{date_str} {time_str}", today())
+
+
+def parse_date_time_from_text(text: str) -> Optional[dict]:
+    """The date and time mentioned in a free-text message; missing parts default to Jan 1 and 09:00."""
+    day = today()
+    dt = _parse_fuzzy(text, day)
+    if dt is None:
+        return None
+    if not mentions_year(text):
+        dt = dt.replace(year=day.year)
+    return {"date": dt.date().isoformat(), "time": dt.strftime("%H:%M"), "aware_dt": dt}
+
+
+def is_past(aware_dt: datetime) -> bool:
+    return aware_dt < now()
@@ -0,0 +1,121 @@
+import re
+from typing import Any, Dict, List, Tuple
+
+from langchain.schema import HumanMessage, SystemMessage, AIMessage
+
+from token_counter import estimate_messages_tokens, estimate_tokens
+
+# Facts worth carrying forward once the turn that mentioned them is no longer sent
+# verbatim. Patterns are deliberately loose: a stray extra value in the summary is
+# cheap, a dropped phone number costs another clarification turn.
+FACT_PATTERNS = {
+    "name": re.compile(r"(?i:\bmy name is|\bi am|\bi'm|\bthis is)\s+([A-Z][a-z]+(?:\s[A-Z][a-z]+)?)"),
+    "email": re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"),
+    "phone": re.compile(r"(?<![\w-])(?!\d{4}-\d{2}-\d{2}\b)\+?\d[\d\s().-]{7,}\d\b"),
+    "provider_id": re.compile(r"(?i:provider\s*(?:id)?\s*[:#]?\s*)(\d+)"),
+    "date": re.compile(
+        r"\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}/\d{1,2}/\d{2,4}\b|"
+        r"(?i:\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{1,2}(?:st|nd|rd|th)?(?:,?\s*\d{4})?)"
+    ),
+    "time": re.compile(r"(?i:\b\d{1,2}(?::\d{2})?\s?(?:am|pm)\b)|\b\d{1,2}:\d{2}\b"),
+    "intent": re.compile(r"(?i:\b(reschedul|cancel|schedul|book|view)\w*)"),
+}
+
+INTENT_STEMS = {"reschedul": "reschedule", "cancel": "cancel", "schedul": "schedule", "book": "schedule", "view": "view"}
+
+# How many distinct values to remember per fact; the newest win.
+MAX_VALUES_PER_FACT = 3
+
+
+class HistoryManager:
+    """Builds the per-turn message list for MediCall with bounded prompt size.
+
+    The last ``keep_turns`` user turns (with the assistant replies that followed)
+    are sent verbatim. Older entries are folded, once, into a fact summary kept in
+    ``state["history_summary"]``. If the request still exceeds ``token_budget``
+    the oldest verbatim turns are folded as well, down to ``min_turns``.
+    """
+
+    def __init__(self, keep_turns: int = 6, token_budget: int = 4000, min_turns: int = 1):
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.min_turns = min_turns
+
+    def build_messages(self, system_prompt: str, state: Dict[str, Any], user_message: str) -> Tuple[List[Any], Dict[str, int]]:
+        history = state["history"]
+        summary = self._summary(state)
+        starts = [i for i, turn in enumerate(history) if turn["role"] == "user"]
+
+        keep_from = starts[-self.keep_turns] if len(starts) > self.keep_turns else 0
+        self._fold(summary, history, keep_from)
+
+        # Running size of the full transcript, for comparison with what we actually send.
+        summary["transcript_tokens"] += estimate_messages_tokens(history[summary["counted"]:])
+        summary["counted"] = len(history)
+
+        system = SystemMessage(content=system_prompt)
+        latest = HumanMessage(content=user_message)
+        while True:
+            summary_msg = self._summary_message(summary["facts"])
+            verbatim = [self._to_message(turn) for turn in history[summary["upto"]:]]
+            messages = [system] + ([summary_msg] if summary_msg else []) + verbatim + [latest]
+            prompt_tokens = estimate_messages_tokens(messages)
+
+            remaining = [i for i in starts if i >= summary["upto"]]
+            if prompt_tokens <= self.token_budget or len(remaining) <= self.min_turns:
+                break
+            self._fold(summary, history, remaining[1])
+
+        stats = {
+            "prompt_tokens": prompt_tokens,
+            "system_tokens": estimate_tokens(system_prompt),
+            "summary_tokens": estimate_tokens(summary_msg.content) if summary_msg else 0,
+            "verbatim_entries": len(verbatim),
+            "summarized_entries": summary["upto"],
+            "full_transcript_tokens": estimate_messages_tokens([system, latest]) + summary["transcript_tokens"],
+        }
+        return messages, stats
+
+    def trim(self, state: Dict[str, Any], max_entries: int):
+        """Session-store hook: drop the oldest history entries, folding them first."""
+        history = state["history"]
+        dropped = len(history) - max_entries
+        if dropped <= 0:
+            return
+        summary = self._summary(state)
+        self._fold(summary, history, dropped)
+        del history[:dropped]
+        summary["upto"] -= dropped
+        summary["counted"] = max(0, summary["counted"] - dropped)
+
+    @staticmethod
+    def _summary(state: Dict[str, Any]) -> Dict[str, Any]:
+        return state.setdefault("history_summary", {"facts": {}, "upto": 0, "counted": 0, "transcript_tokens": 0})
+
+    def _fold(self, summary: Dict[str, Any], history: List[Dict[str, str]], upto: int):
+        facts = summary["facts"]
+        for turn in history[summary["upto"]:upto]:
+            for fact, pattern in FACT_PATTERNS.items():
+                for match in pattern.finditer(turn["text"]):
+                    value = (match.group(1) if match.groups() else match.group(0)).strip()
+                    if fact == "intent":
+                        value = INTENT_STEMS[value.lower()]
+                    values = facts.setdefault(fact, [])
+                    if value in values:
+                        values.remove(value)
+                    values.append(value)
+                    del values[:-MAX_VALUES_PER_FACT]
+        summary["upto"] = max(summary["upto"], upto)
+
+    @staticmethod
+    def _summary_message(facts: Dict[str, List[str]]):
+        if not facts:
+            return None
+        lines = "; ".join(f"{fact}: {', '.join(values)}" for fact, values in facts.items())
+        return SystemMessage(content=f"Summary of earlier turns (most recent last): {lines}")
+
+    @staticmethod
+    def _to_message(turn: Dict[str, str]):
+        if turn["role"] == "user":
+            return HumanMessage(content=turn["text"])
+        return AIMessage(content=turn["text"])
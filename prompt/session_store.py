@@ -0,0 +1,498 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SessionState = Dict[str, Any]
+
+log = logging.getLogger(__name__)
+
+
+class SessionConflict(Exception):
+    """Another turn saved this session after we loaded it; our write was not applied."""
+
+    def __init__(self, session_id: str):
+        super().__init__(f"Session {session_id} was updated concurrently; please retry.")
+        self.session_id = session_id
+
+
+def trim_history(state: SessionState, max_entries: int):
+    """Default per-session cap: keep only the newest ``max_entries`` history items."""
+    history = state.get("history")
+    if isinstance(history, list) and len(history) > max_entries:
+        del history[:len(history) - max_entries]
+
+
+class SessionStore:
+    """Interface shared by the chat apps in ``prompt/``.
+
+    A turn is ``sid, state = store.get_or_create(sid)``, mutate ``state``, then
+    ``store.save(sid, state)``. Only ``save`` may persist or trim the state.
+    Async handlers use ``aget_or_create`` and ``asave``, which never block the
+    event loop on the backend.
+    """
+
+    def __init__(self, factory: Callable[[], SessionState], max_history: int = 50,
+                 trim: Callable[[SessionState, int], None] = trim_history):
+        self.factory = factory
+        self.max_history = max_history
+        self.trim = trim
+
+    def new_session(self) -> str:
+        raise NotImplementedError
+
+    def get_or_create(self, session_id: Optional[str]) -> Tuple[str, SessionState]:
+        raise NotImplementedError
+
+    def peek(self, session_id: str) -> Optional[SessionState]:
+        """Read a session without refreshing its idle timer."""
+        raise NotImplementedError
+
+    def save(self, session_id: str, state: SessionState):
+        raise NotImplementedError
+
+    async def aget_or_create(self, session_id: Optional[str]) -> Tuple[str, SessionState]:
+        return self.get_or_create(session_id)
+
+    async def asave(self, session_id: str, state: SessionState):
+        self.save(session_id, state)
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """Drop expired sessions; returns how many were removed."""
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def start_sweeper(self, interval_seconds: float = 60.0):
+        if getattr(self, "_sweeper", None) and self._sweeper.is_alive():
+            return
+        self._stop_sweeper = threading.Event()
+
+        def _run():
+            while not self._stop_sweeper.wait(interval_seconds):
+                try:
+                    self.sweep()
+                except Exception:
+                    log.exception("Session sweep failed")
+
+        self._sweeper = threading.Thread(target=_run, name=f"{type(self).__name__}-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        if getattr(self, "_sweeper", None):
+            self._stop_sweeper.set()
+            self._sweeper.join()
+            self._sweeper = None
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-process store with idle TTL and least-recently-used eviction."""
+
+    def __init__(self, factory: Callable[[], SessionState], ttl_seconds: float = 1800,
+                 max_entries: int = 10000, max_history: int = 50,
+                 trim: Callable[[SessionState, int], None] = trim_history):
+        super().__init__(factory, max_history, trim)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # session_id -> (state, last_access); oldest access first
+        self._sessions: "OrderedDict[str, Tuple[SessionState, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"created": 0, "hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return self.peek(session_id) is not None
+
+    def _put(self, session_id: str, state: SessionState, now: float):
+        self._sessions[session_id] = (state, now)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+            self._counters["evicted"] += 1
+
+    def _create(self, now: float) -> Tuple[str, SessionState]:
+        sid, state = str(uuid.uuid4()), self.factory()
+        self._put(sid, state, now)
+        self._counters["created"] += 1
+        return sid, state
+
+    def new_session(self) -> str:
+        with self._lock:
+            return self._create(time.monotonic())[0]
+
+    def get_or_create(self, session_id: Optional[str]) -> Tuple[str, SessionState]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id) if session_id else None
+            if entry and now - entry[1] <= self.ttl_seconds:
+                self._counters["hits"] += 1
+                self._put(session_id, entry[0], now)
+                return session_id, entry[0]
+            if entry:
+                del self._sessions[session_id]
+                self._counters["expired"] += 1
+            self._counters["misses"] += 1
+            return self._create(now)
+
+    def peek(self, session_id: str) -> Optional[SessionState]:
+        entry = self._sessions.get(session_id)
+        if not entry or time.monotonic() - entry[1] > self.ttl_seconds:
+            return None
+        return entry[0]
+
+    def save(self, session_id: str, state: SessionState):
+        self.trim(state, self.max_history)
+        with self._lock:
+            self._put(session_id, state, time.monotonic())
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def sweep(self) -> int:
+        cutoff = time.monotonic() - self.ttl_seconds
+        removed = 0
+        with self._lock:
+            # Entries are kept in access order, so expired ones are at the front.
+            while self._sessions:
+                sid, (_, last_access) = next(iter(self._sessions.items()))
+                if last_access > cutoff:
+                    break
+                del self._sessions[sid]
+                removed += 1
+            self._counters["expired"] += removed
+        return removed
+
+    def stats(self, sample_size: int = 50) -> Dict[str, Any]:
+        with self._lock:
+            states = [state for state, _ in self._sessions.values()]
+            counters = dict(self._counters)
+        sample = random.sample(states, min(sample_size, len(states)))
+        per_session = sum(deep_sizeof(s) for s in sample) / len(sample) if sample else 0
+        return {
+            "backend": "memory",
+            "sessions": len(states),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "max_history": self.max_history,
+            "approx_bytes": int(per_session * len(states)),
+            "avg_history_len": round(sum(len(s.get("history", [])) for s in states) / len(states), 1) if states else 0,
+            **counters,
+        }
+
+
+def _finish(commit: Future, error: Optional[BaseException] = None):
+    """Release the saves waiting on ``commit``."""
+    if error is None:
+        commit.set_result(None)
+    else:
+        commit.set_exception(error)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Durable store shared by every worker process that points at the same file.
+
+    States are JSON documents with a version number. A state handed out by
+    ``get_or_create`` carries its version under ``"_version"``; ``save`` only
+    applies if the stored version still matches and raises ``SessionConflict``
+    otherwise, including when another worker wrote the session first: ``save``
+    returns only once its compare-and-swap has committed. Saves are group
+    committed: a background thread writes everything queued in one transaction
+    and saves arriving meanwhile join the next one, so concurrent turns share
+    commits. ``asave`` awaits that commit without blocking the event loop and
+    ``aget_or_create`` reads on a worker thread. ``flush_interval <= 0`` writes
+    each save inline instead. New sessions are inserted immediately so other
+    workers can see them.
+    """
+
+    def __init__(self, factory: Callable[[], SessionState], path: str = "chat_sessions.db",
+                 namespace: str = "default", ttl_seconds: float = 1800, max_entries: int = 100000,
+                 max_history: int = 50, trim: Callable[[SessionState, int], None] = trim_history,
+                 flush_interval: float = 0.025):
+        super().__init__(factory, max_history, trim)
+        self.path = path
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        # session_id -> (state json, new version, updated_at, version expected in the db, commit)
+        self._pending: Dict[str, Tuple[str, int, float, int, Future]] = {}
+        # The batch being committed, readable until its transaction ends.
+        self._writing: Dict[str, Tuple[str, int, float, int, Future]] = {}
+        # Guards the queues and the counters, which several threads update.
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters = {"created": 0, "hits": 0, "misses": 0, "expired": 0, "evicted": 0,
+                          "conflicts": 0, "flushes": 0, "flushed_rows": 0}
+        self._create_tables()
+        if flush_interval > 0:
+            self._flush_wakeup = threading.Event()
+            threading.Thread(target=self._flush_loop, name="SQLiteSessionStore-flush", daemon=True).start()
+            atexit.register(self.flush)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shared across threads; one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # In WAL mode NORMAL syncs at checkpoints, not on every commit.
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key: str, amount: int = 1):
+        with self._pending_lock:
+            self._counters[key] += amount
+
+    def _create_tables(self):
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                namespace TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, session_id)
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated ON chat_sessions (namespace, updated_at)")
+
+    def _load(self, session_id: str) -> Optional[Tuple[SessionState, int, float]]:
+        with self._pending_lock:
+            pending = self._pending.get(session_id) or self._writing.get(session_id)
+        if pending:
+            return json.loads(pending[0]), pending[1], pending[2]
+        row = self._conn().execute(
+            "SELECT state, version, updated_at FROM chat_sessions WHERE namespace = ? AND session_id = ?",
+            (self.namespace, session_id)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def _create(self) -> Tuple[str, SessionState]:
+        sid, state = str(uuid.uuid4()), self.factory()
+        self._conn().execute(
+            "INSERT INTO chat_sessions (namespace, session_id, state, version, updated_at) VALUES (?, ?, ?, 1, ?)",
+            (self.namespace, sid, json.dumps(state, default=str), time.time()))
+        self._count("created")
+        state["_version"] = 1
+        return sid, state
+
+    def new_session(self) -> str:
+        return self._create()[0]
+
+    def get_or_create(self, session_id: Optional[str]) -> Tuple[str, SessionState]:
+        loaded = self._load(session_id) if session_id else None
+        if loaded and time.time() - loaded[2] <= self.ttl_seconds:
+            self._count("hits")
+            state, version, _ = loaded
+            state["_version"] = version
+            return session_id, state
+        self._count("misses")
+        return self._create()
+
+    async def aget_or_create(self, session_id: Optional[str]) -> Tuple[str, SessionState]:
+        return await asyncio.to_thread(self.get_or_create, session_id)
+
+    def peek(self, session_id: str) -> Optional[SessionState]:
+        loaded = self._load(session_id)
+        if not loaded or time.time() - loaded[2] > self.ttl_seconds:
+            return None
+        state, version, _ = loaded
+        state["_version"] = version
+        return state
+
+    def _enqueue(self, session_id: str, state: SessionState) -> Tuple[str, int, float, int, Future]:
+        self.trim(state, self.max_history)
+        expected = state.get("_version", 0)
+        body = json.dumps({k: v for k, v in state.items() if k != "_version"}, default=str)
+
+        # Check and enqueue atomically so two turns of one session in this
+        # process cannot both pass the version check. Other workers' writes are
+        # caught by the compare-and-swap when the entry is committed.
+        with self._pending_lock:
+            previous = self._pending.get(session_id)
+            latest = previous or self._writing.get(session_id)
+            if latest and latest[1] != expected:
+                self._counters["conflicts"] += 1
+                raise SessionConflict(session_id)
+            # A save still queued is replaced; its caller waits on the same commit.
+            commit = previous[4] if previous else Future()
+            entry = (body, expected + 1, time.time(), previous[3] if previous else expected, commit)
+            if self.flush_interval > 0:
+                self._pending[session_id] = entry
+        return entry
+
+    def save(self, session_id: str, state: SessionState):
+        entry = self._enqueue(session_id, state)
+        if self.flush_interval <= 0:
+            if self._write([(session_id, entry)]):
+                raise SessionConflict(session_id)
+        else:
+            self._flush_wakeup.set()
+            entry[4].result()
+        state["_version"] = entry[1]
+
+    async def asave(self, session_id: str, state: SessionState):
+        if self.flush_interval <= 0:
+            return await asyncio.to_thread(self.save, session_id, state)
+        entry = self._enqueue(session_id, state)
+        self._flush_wakeup.set()
+        # Shielded: a cancelled turn must not cancel the commit other saves share.
+        await asyncio.shield(asyncio.wrap_future(entry[4]))
+        state["_version"] = entry[1]
+
+    def _write(self, items) -> List[str]:
+        """Apply saves in one transaction; returns the ids another writer changed first."""
+        conflicted = []
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for session_id, (body, version, updated_at, db_version, _) in items:
+                cur = conn.execute(
+                    "UPDATE chat_sessions SET state = ?, version = ?, updated_at = ? "
+                    "WHERE namespace = ? AND session_id = ? AND version = ?",
+                    (body, version, updated_at, self.namespace, session_id, db_version))
+                if cur.rowcount == 0:
+                    conflicted.append(session_id)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._pending_lock:
+            self._counters["conflicts"] += len(conflicted)
+            self._counters["flushes"] += 1
+            self._counters["flushed_rows"] += len(items)
+        return conflicted
+
+    def flush(self):
+        """Commit every queued save now and release the turns waiting on them."""
+        with self._flush_lock:
+            with self._pending_lock:
+                items = list(self._pending.items())
+                self._writing, self._pending = self._pending, {}
+            if not items:
+                return
+            try:
+                conflicted, error = set(self._write(items)), None
+            except Exception as e:
+                conflicted, error = set(), e
+            with self._pending_lock:
+                self._writing = {}
+            for session_id, entry in items:
+                _finish(entry[4], error or (SessionConflict(session_id) if session_id in conflicted else None))
+            if error is not None:
+                raise error
+
+    def _flush_loop(self):
+        while True:
+            self._flush_wakeup.wait(self.flush_interval)
+            self._flush_wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Session flush failed")
+
+    def delete(self, session_id: str) -> bool:
+        with self._pending_lock:
+            pending = self._pending.pop(session_id, None)
+        if pending:
+            _finish(pending[4], SessionConflict(session_id))
+        cur = self._conn().execute(
+            "DELETE FROM chat_sessions WHERE namespace = ? AND session_id = ?", (self.namespace, session_id))
+        return cur.rowcount > 0
+
+    def sweep(self) -> int:
+        self.flush()
+        conn = self._conn()
+        expired = conn.execute(
+            "DELETE FROM chat_sessions WHERE namespace = ? AND updated_at < ?",
+            (self.namespace, time.time() - self.ttl_seconds)).rowcount
+        evicted = conn.execute(
+            "DELETE FROM chat_sessions WHERE namespace = ? AND session_id IN ("
+            " SELECT session_id FROM chat_sessions WHERE namespace = ?"
+            " ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries)).rowcount
+        with self._pending_lock:
+            self._counters["expired"] += expired
+            self._counters["evicted"] += evicted
+        return expired + evicted
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        count, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(state)), 0) FROM chat_sessions WHERE namespace = ?",
+            (self.namespace,)).fetchone()
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        with self._pending_lock:
+            pending = len(self._pending)
+            counters = dict(self._counters)
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "namespace": self.namespace,
+            "sessions": count,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "max_history": self.max_history,
+            "approx_bytes": total_bytes,
+            "db_file_bytes": page_count * page_size,
+            "pending_writes": pending,
+            **counters,
+        }
+
+
+def deep_sizeof(obj: Any, _seen: Optional[set] = None) -> int:
+    """Approximate retained size of a JSON-like object graph."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def make_session_store(factory: Callable[[], SessionState], namespace: str = "default", **kwargs) -> SessionStore:
+    """Build the configured store; settings come from the environment unless overridden.
+
+    ``SESSION_BACKEND=sqlite`` is required to run the chat apps with more than one
+    worker; ``namespace`` keeps apps that share one database file apart.
+    """
+    options = {
+        "ttl_seconds": float(os.getenv("SESSION_TTL_SECONDS", "1800")),
+        "max_entries": int(os.getenv("SESSION_MAX_ENTRIES", "10000")),
+        "max_history": int(os.getenv("SESSION_MAX_HISTORY", "50")),
+    }
+    if os.getenv("SESSION_BACKEND", "memory") == "sqlite":
+        options["path"] = os.getenv("SESSION_DB_PATH", "chat_sessions.db")
+        options["flush_interval"] = float(os.getenv("SESSION_WRITE_BEHIND_MS", "25")) / 1000
+        options.update(kwargs)
+        return SQLiteSessionStore(factory, namespace=namespace, **options)
+    options.update(kwargs)
+    return InMemorySessionStore(factory, **options)
@@ -0,0 +1,296 @@
+"""Structured LLM output for the prompt services: JSON mode, tool calls, validation and repair.
+
+``STRUCTURED_OUTPUT`` picks how the model is asked for structure:
+
+* ``native`` - JSON-only prompts are sent with ``response_format=json_object``
+  and MediCall's tools are bound as function schemas (default).
+* ``prompt`` - the prompts alone ask for JSON, as before.
+
+Either way replies are read with ``JsonObjectParser`` (the first complete JSON
+object, wherever it sits in the text) and validated against a Pydantic model.
+A reply that carries JSON which does not validate is sent back to the model
+with the validation errors, up to ``STRUCTURED_OUTPUT_RETRIES`` times, instead
+of silently falling back to defaults. Outcomes are counted in
+``structured_output_total``.
+
+``astream_tool_call`` streams the reply and reports a tool call as soon as its
+JSON is complete, so the caller can start the tool while the completion is
+still finishing.
+"""
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "native")
+STRUCTURED_OUTPUT_RETRIES = int(os.getenv("STRUCTURED_OUTPUT_RETRIES", "1"))
+
+outcomes = metrics.counter("structured_output_total", "Structured LLM replies by schema and outcome "
+                           "(ok, repaired, failed, text = no structure asked for was given).",
+                           ("schema", "result"))
+
+
+class ToolParams(BaseModel):
+    """Base for tool parameter schemas: string fields, numbers read as strings, missing as ""."""
+
+    model_config = ConfigDict(extra="ignore", coerce_numbers_to_str=True)
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _none_is_empty(cls, value):
+        return "" if value is None else value
+
+
+class StructuredOutputError(ValueError):
+    """The model's tool call was still invalid after every repair attempt."""
+
+    def __init__(self, schema: str, error: str):
+        super().__init__(f"{schema}: {error}")
+        self.schema = schema
+        self.error = error
+
+
+class ToolCall(NamedTuple):
+    name: str
+    params: Dict[str, Any]
+
+
+class JsonObjectParser:
+    """Finds the JSON objects in text that may arrive in pieces.
+
+    ``feed`` the text as it comes; every top-level ``{...}`` that parses is
+    appended to ``objects`` the moment its closing brace arrives. Text around
+    the objects (prose, code fences) is skipped, and a brace-balanced span
+    that is not JSON is rescanned from its next character. ``fields`` holds
+    the string values of the object being read, so a ``"tool"`` name is known
+    before its parameters have streamed.
+    """
+
+    def __init__(self):
+        self.objects: List[dict] = []
+        self.fields: Dict[str, str] = {}
+        self._reset()
+
+    def _reset(self):
+        self._buf: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string: List[str] = []
+        self._key: Optional[str] = None
+        self._expect_value = False
+
+    def feed(self, text: str) -> List[dict]:
+        pending = text
+        while pending:
+            pending = self._scan(pending)
+        return self.objects
+
+    def _scan(self, text: str) -> str:
+        """Consume ``text``; returns what must be rescanned after a span that was not JSON."""
+        for i, ch in enumerate(text):
+            if self._depth == 0:
+                if ch == "{":
+                    self._buf, self._depth, self.fields = ["{"], 1, {}
+                continue
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._end_string()
+                    continue
+                if self._depth == 1:
+                    self._string.append(ch)
+            elif ch == '"':
+                self._in_string, self._string = True, []
+            elif ch in "{[":
+                self._depth += 1
+                self._expect_value = False
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    span = "".join(self._buf)
+                    self._reset()
+                    try:
+                        value = json.loads(span)
+                    except ValueError:
+                        return span[1:] + text[i + 1:]
+                    if isinstance(value, dict):
+                        self.objects.append(value)
+            elif self._depth == 1 and ch == ":":
+                self._expect_value = True
+            elif self._depth == 1 and ch == ",":
+                self._key, self._expect_value = None, False
+        return ""
+
+    def _end_string(self):
+        try:
+            value = json.loads('"' + "".join(self._string) + '"')
+        except ValueError:
+            value = "".join(self._string)
+        if self._expect_value:
+            if self._key is not None:
+                self.fields[self._key] = value
+            self._expect_value = False
+        else:
+            self._key = value
+
+
+def first_object(text: str) -> Optional[dict]:
+    parser = JsonObjectParser()
+    parser.feed(text)
+    return parser.objects[0] if parser.objects else None
+
+
+def _errors(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc']) or 'value'}: {e['msg']}" for e in error.errors())
+
+
+def parse_json(text: str, model: Type[BaseModel]) -> Tuple[Optional[BaseModel], Optional[str]]:
+    """(instance, None) for the first JSON object in ``text``, else (None, what was wrong)."""
+    data = first_object(text or "")
+    if data is None:
+        return None, "the reply contained no JSON object"
+    try:
+        return model.model_validate(data), None
+    except ValidationError as e:
+        return None, _errors(e)
+
+
+def validate_tool_call(name: Any, params: Any, schemas: Dict[str, Type[ToolParams]]) -> Tuple[Optional[ToolCall], Optional[str]]:
+    schema = schemas.get(name) if isinstance(name, str) else None
+    if schema is None:
+        return None, f"unknown tool {name!r}; use one of {', '.join(schemas)}"
+    if params is None:
+        params = {}
+    if not isinstance(params, dict):
+        return None, "parameters must be a JSON object"
+    try:
+        return ToolCall(name, schema.model_validate(params).model_dump()), None
+    except ValidationError as e:
+        return None, _errors(e)
+
+
+def json_mode(llm):
+    """``llm`` asked for a JSON object reply, when STRUCTURED_OUTPUT is native."""
+    if STRUCTURED_OUTPUT != "native":
+        return llm
+    return llm.bind(response_format={"type": "json_object"})
+
+
+def tool_mode(llm, schemas: Dict[str, Type[ToolParams]]):
+    """``llm`` with ``schemas`` bound as function tools, when STRUCTURED_OUTPUT is native."""
+    if STRUCTURED_OUTPUT != "native":
+        return llm
+    try:
+        return llm.bind_tools(list(schemas.values()))
+    except (AttributeError, NotImplementedError):
+        # Older chat model classes (langchain.chat_models.AzureChatOpenAI) have no
+        # bind_tools but pass extra request fields through to the API.
+        return llm.bind(tools=[convert_to_openai_tool(schema) for schema in schemas.values()])
+
+
+def _repair_request(reply: str, error: str, what: str) -> List[Any]:
+    return [AIMessage(content=reply),
+            HumanMessage(content=f"That reply could not be used: {error}. "
+                                 f"Reply again with only the corrected {what}.")]
+
+
+def _record(schema: str, result: str):
+    outcomes.labels(schema, result).inc()
+    if result == "failed":
+        log.warning("Structured output: %s still invalid after %d repair(s)", schema, STRUCTURED_OUTPUT_RETRIES)
+
+
+async def ainvoke_json(llm, messages: List[Any], model: Type[BaseModel]) -> Optional[BaseModel]:
+    """Call ``llm`` (in JSON mode) and validate the reply as ``model``; None if repairs run out."""
+    for attempt in range(STRUCTURED_OUTPUT_RETRIES + 1):
+        reply = (await llm.ainvoke(messages)).content.strip()
+        result, error = parse_json(reply, model)
+        if result is not None:
+            _record(model.__name__, "repaired" if attempt else "ok")
+            return result
+        messages = [*messages, *_repair_request(reply, error, "JSON object")]
+    _record(model.__name__, "failed")
+    return None
+
+
+def _reply_text(ai) -> str:
+    if ai.content:
+        return ai.content if isinstance(ai.content, str) else json.dumps(ai.content)
+    return json.dumps([{"name": c["name"], "args": c["args"]} for c in getattr(ai, "tool_calls", None) or []])
+
+
+async def astream_tool_call(llm, messages: List[Any], schemas: Dict[str, Type[ToolParams]],
+                            on_call: Callable[[ToolCall], None] = None) -> Tuple[AIMessage, Optional[ToolCall], Optional[str]]:
+    """Stream one reply that is either prose or a tool call.
+
+    A call is a native tool call or a ``{"tool": ..., "parameters": {...}}``
+    object in the text. It is validated, and handed to ``on_call``, as soon as
+    its JSON is complete. Returns (reply, call, error); ``error`` is set when
+    the reply had a tool call that did not validate.
+    """
+    text, args = JsonObjectParser(), JsonObjectParser()
+    full, name = None, None
+    call = error = None
+    decided = False
+    async for chunk in llm.astream(messages):
+        full = chunk if full is None else full + chunk
+        if decided:
+            continue
+        if isinstance(chunk.content, str) and chunk.content:
+            text.feed(chunk.content)
+        for piece in getattr(chunk, "tool_call_chunks", None) or []:
+            if piece.get("index") in (None, 0):
+                name = name or piece.get("name")
+                args.feed(piece.get("args") or "")
+        if name and args.objects:
+            call, error = validate_tool_call(name, args.objects[0], schemas)
+            decided = True
+        else:
+            envelope = next((o for o in text.objects if "tool" in o), None)
+            if envelope is not None:
+                call, error = validate_tool_call(envelope["tool"], envelope.get("parameters"), schemas)
+                decided = True
+        if call is not None and on_call is not None:
+            on_call(call)
+    if full is None:
+        full = AIMessage(content="")
+    if not decided and getattr(full, "tool_calls", None):
+        # Argument-less tools may stream no argument text at all.
+        first = full.tool_calls[0]
+        call, error = validate_tool_call(first["name"], first["args"], schemas)
+        if call is not None and on_call is not None:
+            on_call(call)
+    return full, call, error
+
+
+async def arequest_tool_call(llm, messages: List[Any], schemas: Dict[str, Type[ToolParams]],
+                             on_call: Callable[[ToolCall], None] = None, schema: str = "tool_call"):
+    """``astream_tool_call`` with repair: an invalid tool call is sent back to the model with its errors.
+
+    Returns (reply, call); call is None for a prose reply. Raises
+    ``StructuredOutputError`` when repairs run out, so the caller answers with
+    its own fallback instead of the unusable reply.
+    """
+    for attempt in range(STRUCTURED_OUTPUT_RETRIES + 1):
+        ai, call, error = await astream_tool_call(llm, messages, schemas, on_call)
+        if error is None:
+            _record(schema, "text" if call is None else "repaired" if attempt else "ok")
+            return ai, call
+        messages = [*messages, *_repair_request(_reply_text(ai), error, "tool call JSON")]
+    _record(schema, "failed")
+    raise StructuredOutputError(schema, error)
@@ -0,0 +1,193 @@
+"""Process-wide resources shared by every app surface, and the lifespan that owns them.
+
+Each surface (``main``, ``main_new``, ``prompt.MediCallPrompt``,
+``prompt.MedicalAsstPromptEndpoin``) is an ``APIRouter``; ``build_app`` turns one
+into its standalone ``app``, and ``service.py`` mounts all of them in one
+process. Either way they draw from the single ``resources`` container:
+
+    resources.db(AppointmentManager)          one manager (connection) per thread and database
+    resources.chat_model("medicall", build)   one chat model per call site
+    resources.session_store("medicall", f)    one session store per namespace
+    resources.lazy("graph", build_graph)      one compiled graph per name, built on first use
+
+``resources.lifespan`` runs once per process however many apps enter it: at
+startup it starts the session sweepers, builds what ``WARM_UP`` names and runs
+``on_startup`` hooks; at shutdown it runs ``on_shutdown`` hooks, stops the
+sweepers, flushes queued session saves and closes the DB connections.
+"""
+import inspect
+import os
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Tuple
+
+import metrics
+from DB.database_connection import AppointmentAndPatientManager
+from lazy import Lazy, warm_up
+
+SESSION_SWEEP_SECONDS = float(os.getenv("SESSION_SWEEP_SECONDS", "60"))
+# Responses of at least GZIP_MIN_BYTES are gzipped for clients that accept it.
+GZIP = os.getenv("GZIP", "on") == "on"
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+
+class Resources:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._generation = 0
+        self._managers: List[Tuple[int, Any]] = []
+        self._models: Dict[str, Any] = {}
+        self._stores: Dict[str, Any] = {}
+        self._lazies: Dict[str, Lazy] = {}
+        self._startup: List[Callable] = []
+        self._shutdown: List[Callable] = []
+        self._running = 0
+
+    def db(self, manager_cls=AppointmentAndPatientManager, db_name: str = None):
+        """This thread's ``manager_cls`` on ``db_name`` (the class's default database if None).
+
+        sqlite3 connections are not shared across threads, so each thread keeps
+        its own manager instead of every request reconnecting and re-running
+        the schema statements.
+        """
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            local.managers, local.generation = {}, self._generation
+        key = (manager_cls, db_name)
+        manager = local.managers.get(key)
+        if manager is None:
+            manager = manager_cls(db_name) if db_name else manager_cls()
+            local.managers[key] = manager
+            with self._lock:
+                self._managers.append((threading.get_ident(), manager))
+        elif manager.conn.in_transaction:
+            # A write that failed before its commit leaves the transaction (and
+            # its lock) open on this long-lived connection; start clean.
+            manager.conn.rollback()
+        return manager
+
+    def chat_model(self, site: str, build_live: Callable[[], Any]):
+        """The chat model for call site ``site`` (see ``llm_provider.chat_model``), built once."""
+        with self._lock:
+            if site not in self._models:
+                from llm_provider import chat_model
+                self._models[site] = chat_model(site, build_live)
+            return self._models[site]
+
+    def session_store(self, namespace: str, factory: Callable[[], Dict[str, Any]], **kwargs):
+        """The session store for ``namespace``, exported to /metrics and swept while the app runs."""
+        with self._lock:
+            if namespace not in self._stores:
+                from prompt.session_store import make_session_store
+                store = make_session_store(factory, namespace=namespace, **kwargs)
+                metrics.watch_session_store(namespace, store)
+                self._stores[namespace] = store
+            return self._stores[namespace]
+
+    def lazy(self, name: str, factory: Callable[[], Any]) -> Lazy:
+        """The ``Lazy`` called ``name``; surfaces asking for the same name share one build."""
+        with self._lock:
+            if name not in self._lazies:
+                self._lazies[name] = Lazy(name, factory)
+            return self._lazies[name]
+
+    def on_startup(self, fn: Callable) -> Callable:
+        """Run ``fn`` (sync or async) once when the first app starts."""
+        self._startup.append(fn)
+        return fn
+
+    def on_shutdown(self, fn: Callable) -> Callable:
+        """Run ``fn`` (sync or async) once when the last app shuts down."""
+        self._shutdown.append(fn)
+        return fn
+
+    async def startup(self):
+        self._running += 1
+        if self._running > 1:
+            return
+        for store in list(self._stores.values()):
+            store.start_sweeper(SESSION_SWEEP_SECONDS)
+        warm_up()
+        for fn in self._startup:
+            await _call(fn)
+
+    async def shutdown(self):
+        self._running -= 1
+        if self._running > 0:
+            return
+        for fn in reversed(self._shutdown):
+            await _call(fn)
+        for store in list(self._stores.values()):
+            store.stop_sweeper()
+            if hasattr(store, "flush"):
+                store.flush()
+        self.close_db()
+
+    def close_db(self):
+        """Close the pooled connections; threads open fresh ones on their next ``db()``."""
+        with self._lock:
+            managers, self._managers = self._managers, []
+            self._generation += 1
+        me = threading.get_ident()
+        for owner, manager in managers:
+            # sqlite3 refuses a close from another thread; those connections
+            # close when their thread replaces them (or exits).
+            if owner == me:
+                manager.close_connection()
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        await self.startup()
+        try:
+            yield
+        finally:
+            await self.shutdown()
+
+    def build_app(self, app_name: str, routers: Dict[str, Any], cors: bool = False,
+                  usage_path: str = "/usage", **fastapi_kwargs):
+        """A FastAPI app serving ``routers`` ({prefix: router}) with the shared lifespan.
+
+        Adds /metrics (requests labelled ``app_name``), the token usage report on
+        ``usage_path``, the 409 reply for session conflicts, gzip for large
+        responses (see GZIP) and, with ``cors``, permissive CORS.
+        """
+        from fastapi import FastAPI
+        from fastapi.middleware.cors import CORSMiddleware
+        from fastapi.middleware.gzip import GZipMiddleware
+        from fastapi.responses import JSONResponse
+        import token_budget
+        from prompt.session_store import SessionConflict
+
+        app = FastAPI(lifespan=self.lifespan, **fastapi_kwargs)
+        for prefix, router in routers.items():
+            app.include_router(router, prefix=prefix)
+        if cors:
+            app.add_middleware(
+                CORSMiddleware,
+                allow_origins=["*"],  # lock down in prod
+                allow_credentials=True,
+                allow_methods=["*"],
+                allow_headers=["*"],
+            )
+        if GZIP:
+            # Responses that already carry a Content-Encoding (http_cache) pass through.
+            app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=GZIP_LEVEL)
+        metrics.install(app, app_name)
+        token_budget.install(app, usage_path)
+
+        @app.exception_handler(SessionConflict)
+        async def session_conflict_handler(request, exc: SessionConflict):
+            return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+        return app
+
+
+async def _call(fn: Callable):
+    result = fn()
+    if inspect.isawaitable(result):
+        await result
+
+
+resources = Resources()
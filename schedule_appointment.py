@@ -1,7 +1,6 @@
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from datetime import datetime
-import pandas as pd
 from langchain_core.tools import tool
 
 class ScheduleState(TypedDict):
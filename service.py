@@ -0,0 +1,24 @@
+"""All four app surfaces in one process: ``uvicorn service:app``.
+
+    (root)      main.py                               REST + /gemini-agent
+    /v2         main_new.py
+    /medicall   prompt/MediCallPrompt.py
+    /assistant  prompt/MedicalAsstPromptEndpoin.py
+
+Routes keep their own paths under those prefixes (``/medicall/chat``). The
+surfaces share ``resources``: one DB connection per thread, one chat model per
+call site, one session store per namespace and one build of each graph, under
+a single lifespan. /metrics labels requests ``app="service"``; /usage reports
+tokens for all of them. Each module still runs standalone as ``<module>:app``.
+"""
+import main
+import main_new
+from prompt import MediCallPrompt, MedicalAsstPromptEndpoin
+from resources import resources
+
+app = resources.build_app("service", {
+    "": main.router,
+    "/v2": main_new.router,
+    "/medicall": MediCallPrompt.router,
+    "/assistant": MedicalAsstPromptEndpoin.router,
+}, cors=True, title="Appointment Scheduling Service")
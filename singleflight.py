@@ -0,0 +1,185 @@
+"""Request coalescing: concurrent identical calls share one in-flight computation.
+
+    providers = SingleFlight("db")
+    providers.do(key, fn, *args)          # threads: the first caller runs fn, the rest wait for it
+    await providers.ado(key, afn, *args)  # asyncio: same, per event loop, for coroutine functions
+    @providers.wrap()                     # decorator keyed on the arguments
+    coalesce_methods(Cls, names, flight)  # wrap read methods of a class
+
+Only calls that overlap are shared: nothing is cached once the leader
+returns. ``invalidate()`` after a write makes later calls start a new flight
+rather than join one that began before the write. Followers get
+the leader's result object (or its exception), so callers must treat it as
+read-only. ``SINGLEFLIGHT=off`` runs every call on its own (benchmarks flip it).
+
+Each group reports leader and coalesced calls to /metrics
+(``singleflight_requests_total``) and in ``stats()``.
+"""
+import asyncio
+import functools
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable
+
+import metrics
+
+SINGLEFLIGHT = os.getenv("SINGLEFLIGHT", "on") == "on"
+
+
+class _Call:
+    __slots__ = ("done", "owner", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.owner = threading.get_ident()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.leaders = 0
+        self.coalesced = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._futures: Dict[Any, asyncio.Future] = {}
+        metrics.watch_singleflight(name, self)
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        """``fn(*args, **kwargs)``, or the result of the identical call already running on another thread."""
+        if not SINGLEFLIGHT:
+            return fn(*args, **kwargs)
+        with self._lock:
+            key = (self._generation, key)
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            elif call.owner == threading.get_ident():
+                call = None  # the leader calling itself again must not wait on its own flight
+            else:
+                self.coalesced += 1
+        if call is None:
+            return fn(*args, **kwargs)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: Hashable, fn: Callable, *args, **kwargs):
+        """``await fn(*args, **kwargs)``, or the result of the identical call already awaited on this loop."""
+        if not SINGLEFLIGHT:
+            return await fn(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slot = (loop, self._generation, key)
+            future = self._futures.get(slot)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                future = self._futures[slot] = loop.create_future()
+                # Nobody may be waiting to retrieve a failure.
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                self.leaders += 1
+                future = None
+        if future is not None:
+            # shield: a follower giving up must not cancel the shared computation.
+            return await asyncio.shield(future)
+        shared = self._futures[slot]
+        try:
+            result = await fn(*args, **kwargs)
+            shared.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            shared.cancel()
+            raise
+        except BaseException as e:
+            shared.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._futures.pop(slot, None)
+
+    def invalidate(self):
+        """Calls from now on start their own flights instead of joining ones already running."""
+        with self._lock:
+            self._generation += 1
+
+    def wrap(self, key: Callable[..., Hashable] = None):
+        """Decorator: calls of the function with the same ``key(*args, **kwargs)`` (default: the arguments) coalesce."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                k = key(*args, **kwargs) if key else args_key(args, kwargs)
+                return self.do((func.__qualname__, k), func, *args, **kwargs)
+            return wrapper
+        return decorate
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced,
+                    "in_flight": len(self._calls) + len(self._futures)}
+
+
+def args_key(args: tuple, kwargs: dict) -> Hashable:
+    """A hashable key for call arguments; unhashable ones (models, lists) by their repr."""
+    key = (args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+        return key
+    except TypeError:
+        return repr(key)
+
+
+def coalesce_methods(cls, names: Iterable[str], flight: SingleFlight,
+                     scope: Callable[[Any], Hashable] = None, skip: Callable[[Any], bool] = None,
+                     writes: Iterable[str] = ()):
+    """Coalesce calls of ``cls``'s ``names`` methods across instances.
+
+    Calls share a flight when the method, arguments and ``scope(self)`` match
+    (e.g. the database an instance points at); ``skip(self)`` runs the call on
+    its own instance (e.g. inside a transaction that must read its own writes).
+    The ``writes`` methods invalidate the flight once they return, so a read
+    issued after a write never shares a query that started before it.
+    """
+    for name in names:
+        method = getattr(cls, name)
+
+        def make(name, method):
+            @functools.wraps(method)
+            def wrapper(self, *args, **kwargs):
+                if skip is not None and skip(self):
+                    return method(self, *args, **kwargs)
+                key = (cls.__name__, name, scope(self) if scope else None, args_key(args, kwargs))
+                return flight.do(key, method, self, *args, **kwargs)
+            return wrapper
+
+        setattr(cls, name, make(name, method))
+    for name in writes:
+        method = getattr(cls, name)
+
+        def make_write(method):
+            @functools.wraps(method)
+            def wrapper(self, *args, **kwargs):
+                try:
+                    return method(self, *args, **kwargs)
+                finally:
+                    flight.invalidate()
+            return wrapper
+
+        setattr(cls, name, make_write(method))
+    return cls
@@ -0,0 +1,182 @@
+"""Token accounting per session, route and agent, with per-session and global budgets.
+
+Every chat model built by ``llm_provider.chat_model`` reports its calls here.
+Prompt/completion counts come from the provider's usage metadata, or from
+``token_counter`` estimates when there is none (counted as ``estimated_calls``).
+A turn runs inside ``usage_scope(session_id, route)`` so nested agent calls are
+charged to the conversation that caused them.
+
+Budgets are checked when a turn starts; a turn that crosses one still finishes,
+and the next turn gets a templated reply instead of an LLM call:
+
+    SESSION_TOKEN_BUDGET=0            tokens one session may use (0 = unlimited)
+    GLOBAL_TOKEN_BUDGET=0             tokens all sessions may use per window (0 = unlimited)
+    GLOBAL_TOKEN_WINDOW_SECONDS=3600  length of the global budget window
+    USAGE_MAX_SESSIONS=10000          sessions tracked (least recently active dropped)
+
+Counts are per process, like the session store's in-memory backend.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+
+import metrics
+
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0"))
+GLOBAL_TOKEN_BUDGET = int(os.getenv("GLOBAL_TOKEN_BUDGET", "0"))
+GLOBAL_TOKEN_WINDOW_SECONDS = float(os.getenv("GLOBAL_TOKEN_WINDOW_SECONDS", "3600"))
+USAGE_MAX_SESSIONS = int(os.getenv("USAGE_MAX_SESSIONS", "10000"))
+
+BUDGET_REPLIES = {
+    "session": (
+        "I'm sorry, this conversation has reached its usage limit, so I can't continue it. "
+        "Please start a new conversation or call the clinic to finish your request."
+    ),
+    "global": (
+        "I'm sorry, the assistant is very busy right now. Please try again in a little while "
+        "or call the clinic to book, change or cancel an appointment."
+    ),
+}
+
+_scope: ContextVar[Tuple[Optional[str], Optional[str]]] = ContextVar("usage_scope", default=(None, None))
+
+budget_refusals = metrics.counter("llm_budget_refusals_total", "Turns answered with a templated reply "
+                                  "because a token budget was exhausted.", ("budget",))
+
+
+def _totals() -> Dict[str, int]:
+    return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "calls": 0, "estimated_calls": 0}
+
+
+def _add(totals: Dict[str, int], prompt: int, completion: int, estimated: bool):
+    totals["prompt_tokens"] += prompt
+    totals["completion_tokens"] += completion
+    totals["total_tokens"] += prompt + completion
+    totals["calls"] += 1
+    totals["estimated_calls"] += estimated
+
+
+class TokenLedger:
+    """Running token totals, overall and per session, route and agent."""
+
+    def __init__(self, session_budget: int = SESSION_TOKEN_BUDGET, global_budget: int = GLOBAL_TOKEN_BUDGET,
+                 window_seconds: float = GLOBAL_TOKEN_WINDOW_SECONDS, max_sessions: int = USAGE_MAX_SESSIONS):
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.window_seconds = window_seconds
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._overall = _totals()
+        self._routes = defaultdict(_totals)
+        self._agents = defaultdict(_totals)
+        # session_id -> totals; least recently charged first
+        self._sessions: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+        self._window_start = time.monotonic()
+        self._window_tokens = 0
+        self._refusals = {"session": 0, "global": 0}
+
+    def _roll_window(self, now: float):
+        if now - self._window_start >= self.window_seconds:
+            self._window_start, self._window_tokens = now, 0
+
+    def record(self, agent: str, prompt: int, completion: int, estimated: bool = False,
+               session_id: str = None, route: str = None):
+        """Charge one LLM call; session and route default to the current ``usage_scope``."""
+        scope_session, scope_route = _scope.get()
+        session_id = session_id or scope_session
+        route = route or scope_route or "-"
+        with self._lock:
+            self._roll_window(time.monotonic())
+            self._window_tokens += prompt + completion
+            _add(self._overall, prompt, completion, estimated)
+            _add(self._routes[route], prompt, completion, estimated)
+            _add(self._agents[agent], prompt, completion, estimated)
+            if session_id:
+                totals = self._sessions.pop(session_id, None) or _totals()
+                _add(totals, prompt, completion, estimated)
+                self._sessions[session_id] = totals
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+
+    def exceeded(self, session_id: Optional[str]) -> Optional[str]:
+        """Which budget is used up for ``session_id`` ("global" first, then "session"), or None."""
+        with self._lock:
+            self._roll_window(time.monotonic())
+            if self.global_budget and self._window_tokens >= self.global_budget:
+                return "global"
+            totals = self._sessions.get(session_id) if session_id else None
+            if self.session_budget and totals and totals["total_tokens"] >= self.session_budget:
+                return "session"
+        return None
+
+    def refusal(self, session_id: Optional[str]) -> Optional[str]:
+        """The templated reply to send instead of running the turn, or None to run it."""
+        budget = self.exceeded(session_id)
+        if budget is None:
+            return None
+        with self._lock:
+            self._refusals[budget] += 1
+        budget_refusals.labels(budget).inc()
+        return BUDGET_REPLIES[budget]
+
+    def session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            totals = self._sessions.get(session_id)
+            if totals is None:
+                return None
+            return {**totals, "budget": self.session_budget or None,
+                    "remaining": max(self.session_budget - totals["total_tokens"], 0) if self.session_budget else None}
+
+    def report(self, top: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            self._roll_window(time.monotonic())
+            heaviest = sorted(self._sessions.items(), key=lambda item: item[1]["total_tokens"], reverse=True)[:top]
+            return {
+                "overall": dict(self._overall),
+                "by_route": {route: dict(t) for route, t in sorted(self._routes.items())},
+                "by_agent": {agent: dict(t) for agent, t in sorted(self._agents.items())},
+                "sessions_tracked": len(self._sessions),
+                "top_sessions": {sid: dict(t) for sid, t in heaviest},
+                "budgets": {
+                    "session": self.session_budget or None,
+                    "global": self.global_budget or None,
+                    "global_window_seconds": self.window_seconds,
+                    "global_window_used": self._window_tokens,
+                },
+                "refusals": dict(self._refusals),
+            }
+
+
+ledger = TokenLedger()
+
+
+@contextmanager
+def usage_scope(session_id: Optional[str], route: str):
+    """Charge LLM calls made inside the block (and its tasks and threads) to ``session_id`` and ``route``."""
+    token = _scope.set((session_id, route))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def install(app, path: str = "/usage"):
+    """Serve the ledger report on ``GET <path>`` and one session's totals on ``GET <path>/{session_id}``."""
+    from fastapi import HTTPException
+
+    @app.get(path)
+    def usage_report(top: int = 10):
+        return ledger.report(top)
+
+    @app.get(path + "/{session_id}")
+    def session_usage(session_id: str):
+        usage = ledger.session(session_id)
+        if usage is None:
+            raise HTTPException(status_code=404, detail="no usage recorded for this session")
+        return usage
+
+    return app
